@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 候选图片获取后端统计
+记录 Selenium / Crawl4AI 获取候选图片列表的耗时、可用率和对冲胜率（可持久化为JSON），
+用于决定默认先启动哪个后端，以及对冲模式下等待多久再启动另一个后端
+"""
+
+import json
+import os
+import statistics
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+BACKEND_SELENIUM = 'selenium'
+BACKEND_CRAWL4AI = 'crawl4ai'
+BACKENDS = (BACKEND_SELENIUM, BACKEND_CRAWL4AI)
+
+# 一次获取的结果
+OUTCOME_USABLE = 'usable'        # 得到非空候选列表
+OUTCOME_EMPTY = 'empty'          # 正常结束但没有候选
+OUTCOME_ERROR = 'error'          # 出错
+OUTCOME_CANCELLED = 'cancelled'  # 对冲落败被取消（不计入可用率）
+
+# 获取模式
+ACQUISITION_SEQUENTIAL = 'sequential'  # 主后端失败或未下载到图片后再用另一个后端（原有行为）
+ACQUISITION_HEDGED = 'hedged'          # 主后端超出延迟预算后并行启动另一个后端，先得到可用列表者胜出
+ACQUISITION_MODES = (ACQUISITION_SEQUENTIAL, ACQUISITION_HEDGED)
+
+
+class BackendStats:
+    """各获取后端的耗时、可用率和对冲胜率（线程安全）"""
+
+    def __init__(self, path: Optional[str] = None, window: int = 50, min_samples: int = 5):
+        """
+        Args:
+            path: 持久化JSON文件路径，为None时只保存在内存中
+            window: 每个后端保留的最近可用耗时样本数
+            min_samples: 调整默认顺序和对冲延迟所需的最少样本数
+        """
+        self.path = Path(path) if path else None
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._backends: Dict[str, Dict] = {}
+        self._load()
+
+    def _entry(self, backend: str) -> Dict:
+        if backend not in self._backends:
+            self._backends[backend] = {
+                'attempts': 0, 'usable': 0, 'races': 0, 'wins': 0,
+                'latencies': deque(maxlen=self.window)
+            }
+        return self._backends[backend]
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # 统计文件损坏时从头开始统计
+            return
+        for backend, values in data.get('backends', {}).items():
+            entry = self._entry(backend)
+            for key in ('attempts', 'usable', 'races', 'wins'):
+                entry[key] = int(values.get(key, 0))
+            entry['latencies'].extend(float(value) for value in values.get('latencies', []))
+
+    def _save(self):
+        if not self.path:
+            return
+        data = {'backends': {
+            backend: {
+                'attempts': entry['attempts'], 'usable': entry['usable'],
+                'races': entry['races'], 'wins': entry['wins'],
+                'latencies': [round(value, 3) for value in entry['latencies']]
+            }
+            for backend, entry in self._backends.items()
+        }}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def record(self, backend: str, seconds: float, outcome: str):
+        """
+        记录一次获取
+
+        Args:
+            backend: 后端名称
+            seconds: 耗时（秒）
+            outcome: usable / empty / error / cancelled
+        """
+        with self._lock:
+            if outcome == OUTCOME_CANCELLED:
+                return
+            entry = self._entry(backend)
+            entry['attempts'] += 1
+            if outcome == OUTCOME_USABLE:
+                entry['usable'] += 1
+                entry['latencies'].append(seconds)
+            self._save()
+
+    def record_race(self, contenders: Sequence[str], winner: Optional[str]):
+        """
+        记录一次对冲（两个后端都已启动）的结果
+
+        Args:
+            contenders: 参与的后端
+            winner: 胜出的后端，都没有得到可用列表时为None
+        """
+        with self._lock:
+            for backend in contenders:
+                entry = self._entry(backend)
+                entry['races'] += 1
+                if backend == winner:
+                    entry['wins'] += 1
+            self._save()
+
+    def latency_quantile(self, backend: str, quantile: float = 0.5) -> Optional[float]:
+        """
+        可用获取耗时的分位数
+
+        Args:
+            backend: 后端名称
+            quantile: 分位（0~1）
+
+        Returns:
+            样本不足时返回None
+        """
+        with self._lock:
+            latencies = sorted(self._backends.get(backend, {}).get('latencies', ()))
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, max(0, int(round(quantile * (len(latencies) - 1)))))
+        return latencies[index]
+
+    def hedge_delay(self, backend: str, default: float, quantile: float = 0.9,
+                    minimum: float = 1.0) -> float:
+        """
+        对冲延迟预算：主后端通常（quantile）能在此时间内返回，超过后启动另一个后端
+
+        Args:
+            backend: 主后端
+            default: 样本不足时使用的预算（秒）
+            quantile: 使用的耗时分位
+            minimum: 预算下限（秒）
+
+        Returns:
+            延迟预算（秒）
+        """
+        value = self.latency_quantile(backend, quantile)
+        if value is None:
+            return default
+        return max(minimum, value)
+
+    def preferred_order(self, default: Sequence[str]) -> List[str]:
+        """
+        根据统计调整后端顺序
+
+        两个后端都有足够的对冲记录时按胜率排序；否则都有足够的获取记录时，
+        按“可用率 / 耗时中位数”（单位时间内得到可用列表的期望）排序；样本不足时保持默认顺序
+
+        Args:
+            default: 默认顺序
+
+        Returns:
+            调整后的顺序
+        """
+        backends = list(default)
+        if len(backends) < 2:
+            return backends
+        with self._lock:
+            entries = [self._backends.get(backend) for backend in backends]
+            if all(entry and entry['races'] >= self.min_samples for entry in entries):
+                scores = [entry['wins'] / entry['races'] for entry in entries]
+            elif all(entry and entry['attempts'] >= self.min_samples and entry['latencies']
+                     for entry in entries):
+                scores = [(entry['usable'] / entry['attempts']) / max(statistics.median(entry['latencies']), 0.1)
+                          for entry in entries]
+            else:
+                return backends
+        # sorted 是稳定排序，分数相同时保持默认顺序
+        ranked = sorted(zip(backends, scores), key=lambda item: item[1], reverse=True)
+        return [backend for backend, _ in ranked]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """各后端统计摘要"""
+        with self._lock:
+            backends = list(self._backends)
+            summary = {
+                backend: {
+                    'attempts': entry['attempts'],
+                    'usable_rate': round(entry['usable'] / entry['attempts'], 3) if entry['attempts'] else None,
+                    'races': entry['races'],
+                    'win_rate': round(entry['wins'] / entry['races'], 3) if entry['races'] else None,
+                }
+                for backend, entry in self._backends.items()
+            }
+        for backend in backends:
+            p50 = self.latency_quantile(backend, 0.5)
+            p90 = self.latency_quantile(backend, 0.9)
+            summary[backend]['p50_seconds'] = round(p50, 3) if p50 is not None else None
+            summary[backend]['p90_seconds'] = round(p90, 3) if p90 is not None else None
+        return summary
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - AIMD自适应并发控制
+按实时的成功率和耗时调整同时进行的下载 / 页面渲染数量：
+健康时每完成一个“窗口”（当前并发数个请求）加一（加性增），遇到403/429/超时或耗时明显升高时减半（乘性减）
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+# 一次请求的结果信号
+SIGNAL_OK = 'ok'              # 成功
+SIGNAL_OVERLOAD = 'overload'  # 对方限流或过载（403 / 429 / 超时等），触发乘性减
+SIGNAL_NEUTRAL = 'neutral'    # 与负载无关的失败（如404、非图片内容），不影响并发数
+
+# 下载失败原因（img_data['failure_reason']）中表示CDN限流或过载的部分
+OVERLOAD_REASONS = frozenset({'http_403', 'http_408', 'http_429', 'timeout'})
+
+
+class AIMDController:
+    """加性增、乘性减的并发上限（在单个事件循环内使用）"""
+
+    def __init__(self, name: str, maximum: int, minimum: int = 1, initial: Optional[int] = None,
+                 increase: int = 1, decrease_factor: float = 0.5, latency_tolerance: Optional[float] = 2.0,
+                 min_latency_samples: int = 5, ewma_alpha: float = 0.2, baseline_drift: float = 0.01,
+                 on_change: Optional[Callable[['AIMDController'], None]] = None):
+        """
+        Args:
+            name: 名称（downloads / renders），用于进度和日志
+            maximum: 并发上限的最大值
+            minimum: 并发上限的最小值
+            initial: 初始并发上限，默认为 minimum
+            increase: 每个健康窗口增加的并发数
+            decrease_factor: 过载时并发上限乘以的系数
+            latency_tolerance: 耗时滑动平均超过基线的倍数时按过载处理，为None时不使用耗时信号
+            min_latency_samples: 启用耗时信号所需的最少样本数
+            ewma_alpha: 耗时滑动平均的平滑系数
+            baseline_drift: 每个样本基线向当前耗时靠拢的比例（网络整体变慢时不至于一直判定过载）
+            on_change: 并发上限变化时的回调
+        """
+        self.name = name
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.min_latency_samples = min_latency_samples
+        self.ewma_alpha = ewma_alpha
+        self.baseline_drift = baseline_drift
+        self.on_change = on_change
+
+        initial = self.minimum if initial is None else initial
+        self._limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._window_successes = 0
+        self._last_decrease_at = float('-inf')
+        self._latency_samples = 0
+        self._ewma_latency: Optional[float] = None
+        self._baseline_latency: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return int(self._limit)
+
+    async def acquire(self) -> float:
+        """
+        等待一个并发名额
+
+        Returns:
+            开始时间（传给 release）
+        """
+        while self.in_flight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started_at: float, signal: str = SIGNAL_OK):
+        """
+        归还并发名额并按结果调整上限
+
+        Args:
+            started_at: acquire 返回的开始时间
+            signal: ok / overload / neutral
+        """
+        self.in_flight -= 1
+        latency = time.monotonic() - started_at
+        if signal == SIGNAL_OK and self._latency_congested(latency):
+            signal = SIGNAL_OVERLOAD
+
+        previous = self.limit
+        if signal == SIGNAL_OVERLOAD:
+            # 同一窗口内（上次减小之前开始的请求）的多个过载信号只减一次
+            if started_at >= self._last_decrease_at:
+                self._limit = max(float(self.minimum), self._limit * self.decrease_factor)
+                self._last_decrease_at = time.monotonic()
+                self._window_successes = 0
+                self.decreases += 1
+        elif signal == SIGNAL_OK:
+            self._window_successes += 1
+            if self._window_successes >= self.limit:
+                self._window_successes = 0
+                if self._limit < self.maximum:
+                    self._limit = min(float(self.maximum), self._limit + self.increase)
+                    self.increases += 1
+
+        self._wake_waiters()
+        if self.limit != previous and self.on_change:
+            self.on_change(self)
+
+    def _latency_congested(self, latency: float) -> bool:
+        """更新耗时滑动平均，判断是否明显高于基线"""
+        if self.latency_tolerance is None:
+            return False
+        if self._ewma_latency is None:
+            self._ewma_latency = latency
+        else:
+            self._ewma_latency += self.ewma_alpha * (latency - self._ewma_latency)
+        self._latency_samples += 1
+        if self._baseline_latency is None:
+            self._baseline_latency = self._ewma_latency
+        else:
+            self._baseline_latency = min(
+                self._ewma_latency,
+                self._baseline_latency + self.baseline_drift * (self._ewma_latency - self._baseline_latency)
+            )
+        if self._latency_samples < self.min_latency_samples:
+            return False
+        return self._ewma_latency > self._baseline_latency * self.latency_tolerance
+
+    def _wake_waiters(self):
+        # 唤醒与空闲名额数量相同的等待者
+        for _ in range(max(0, self.limit - self.in_flight)):
+            while self._waiters and self._waiters[0].done():
+                self._waiters.popleft()
+            if not self._waiters:
+                return
+            self._waiters.popleft().set_result(None)
+
+    def snapshot(self) -> Dict:
+        """当前状态"""
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'minimum': self.minimum,
+            'maximum': self.maximum,
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'ewma_latency_seconds': round(self._ewma_latency, 3) if self._ewma_latency is not None else None,
+            'baseline_latency_seconds': (round(self._baseline_latency, 3)
+                                         if self._baseline_latency is not None else None)
+        }
@@ -7,23 +7,64 @@
 
 import asyncio
 import json
+import logging
 import os
 import threading
 import time
 from pathlib import Path
-from queue import Queue
 from typing import Dict, Any
 
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, send_file
 from werkzeug.utils import secure_filename
 
 # 导入现有的爬虫模块
 from douyin_image_crawler import DouyinImageCrawler
-from linkrush import extract_links_from_file
+from image_catalog import ImageCatalog
+from page_cache import CACHE_BYPASS, CACHE_MODES
+from acquisition_stats import ACQUISITION_MODES, ACQUISITION_SEQUENTIAL
+from metrics import REGISTRY, CRAWL_JOBS_RUNNING
+from crawl_logging import SSEForwardHandler, add_handler, get_logger, setup_logging
+from profiling import JobProfiler, PROFILE_MODES
+from progress_buffer import ProgressEventBuffer
+from cancellation import CancellationToken
+from linkrush import LinkFeed, LinkStreamParser, extract_links_from_text
+from upload_stream import MultipartUpload
+from results_view import CrawlResultsView, InvalidCursor
+from archive_export import ARCHIVE_FORMATS, collect_entries
+from crawl_pipeline import CrawlPipeline
+from task_queue import FINAL_STATES, TASK_DONE, TaskBroker, open_broker
+from storage_budget import DISK_FULL_REASON, StorageBudget
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_KEEP_FILES'] = False  # 是否在 UPLOAD_FOLDER 保留上传的链接文件（默认边上传边解析，不落盘）
+app.config['CATALOG_PATH'] = 'douyin_catalog.db'
+app.config['VIDEO_BATCH_CONCURRENCY'] = 4  # 批量视频任务同时渲染的最大页面数
+app.config['VIDEO_BATCH_MEMORY_PERCENT'] = 85.0  # 系统内存占用超过该比例时暂停派发新页面
+app.config['PIPELINE_ENABLED'] = True  # 用户主页任务使用分阶段流水线（渲染与下载重叠）
+app.config['PIPELINE_RENDER_WORKERS'] = 2  # 同时渲染的最大页面数（每个占用一个浏览器）
+app.config['PIPELINE_DOWNLOAD_WORKERS'] = 8  # 同时下载的最大图片数
+app.config['PIPELINE_ADAPTIVE'] = True  # 按403/429/超时和耗时自动调整并发（AIMD），关闭时固定使用上面的最大值
+app.config['PIPELINE_QUEUE_SIZE'] = 64  # 候选图片队列容量，队列满时渲染阶段等待
+app.config['ACQUISITION_STATS_PATH'] = '.douyin_backend_stats.json'  # Selenium/Crawl4AI耗时与胜率统计
+app.config['TASK_BROKER_URL'] = None  # 分布式任务队列，如 sqlite:///douyin_tasks.db 或 redis://主机:6379/0；为空时不支持分布式爬取
+app.config['DISTRIBUTED_MAX_ATTEMPTS'] = 3  # 分布式任务的最大尝试次数（worker失联、失败后重新入队）
+app.config['DISTRIBUTED_POLL_SECONDS'] = 2.0  # 协调端汇总任务结果的轮询间隔
+app.config['STORAGE_INDEX_PATH'] = 'douyin_storage.db'  # 已下载文件索引（配额和淘汰使用），为空时不做存储预算
+app.config['STORAGE_GLOBAL_QUOTA_BYTES'] = None  # 所有任务图片的总字节上限
+app.config['STORAGE_JOB_QUOTA_BYTES'] = None  # 单个任务的图片字节上限，达到后不再请求图片
+app.config['STORAGE_MIN_FREE_BYTES'] = 512 * 1024 * 1024  # 下载目录所在磁盘的最小剩余空间，不足时暂停下载
+app.config['STORAGE_EVICTION'] = False  # 超出全局配额或磁盘空间不足时，是否按最近访问时间删除旧任务的图片
+app.config['STORAGE_MAX_AGE_SECONDS'] = None  # 旧任务图片的最长保留时间（需开启 STORAGE_EVICTION），任务开始时清理
+app.config['STORAGE_PAUSE_TIMEOUT'] = 600  # 暂停下载超过该时间（秒）后中止任务
+app.config['LOG_LEVEL'] = 'INFO'
+app.config['LOG_JSON'] = False
+app.config['LOG_SAMPLE_RATE'] = 1.0  # 单张图片日志的保留比例
+app.config['SSE_LOG_LEVEL'] = 'INFO'  # 转发到前端的最低日志级别
+app.config['PROGRESS_LOG_HISTORY'] = 500  # 进度缓冲区保留的最近日志条数
+app.config['SSE_MAX_STREAM_SECONDS'] = 300  # 单个SSE连接的最长时间，之后由浏览器带 Last-Event-ID 重连
+app.config['SSE_HEARTBEAT_SECONDS'] = 15  # 无事件时的心跳间隔，用于及时发现已断开的客户端
 
 # 全局变量
 crawl_status = {
@@ -31,79 +72,390 @@ crawl_status = {
     'progress': 0,
     'status': '准备开始...',
     'results': None,
-    'error': None
+    'error': None,
+    'job_id': None,
+    'started_at': None
 }
 
-# 消息队列用于实时通信
-message_queue = Queue()
+# 当前任务结果的分页视图（任务完成时创建，/status 只返回其汇总）
+crawl_results = None
+
+# 进度事件缓冲区（有界，进度事件只保留最新一条，支持断线重连补发）
+progress_events = ProgressEventBuffer(max_logs=app.config['PROGRESS_LOG_HISTORY'])
 crawl_thread = None
+# 当前任务的取消令牌，/stop_crawl 通过它中断进行中的浏览器会话和下载
+crawl_cancel_token = None
+# 服务关闭时置为False，不再接受新任务
+accepting_jobs = True
+
+# 异步日志：控制台输出 + 指定级别转发到进度事件缓冲区
+logger = get_logger('app')
+setup_logging(app.config['LOG_LEVEL'], json_format=app.config['LOG_JSON'],
+              sample_rate=app.config['LOG_SAMPLE_RATE'])
+add_handler(SSEForwardHandler(progress_events.put, level=logging.getLevelName(app.config['SSE_LOG_LEVEL'])))
+
+# 各任务的性能剖析产物 {job_id: {类型: 文件路径}}
+job_profiles: Dict[str, Dict[str, str]] = {}
+
+# 图片元数据目录（查询接口使用，延迟创建）
+image_catalog = None
+catalog_lock = threading.Lock()
+
+# 存储预算（延迟创建）
+storage_budget = None
+storage_lock = threading.Lock()
+
+# 分布式任务队列（延迟创建）
+task_broker = None
+broker_lock = threading.Lock()
+
+def get_task_broker() -> TaskBroker:
+    """获取分布式任务队列，未配置 TASK_BROKER_URL 时返回None"""
+    global task_broker
+    with broker_lock:
+        if task_broker is None and app.config['TASK_BROKER_URL']:
+            task_broker = open_broker(app.config['TASK_BROKER_URL'])
+        return task_broker
+
+def publish_results(total_results: Dict[str, Any]):
+    """保存任务结果并建立分页视图（在标记任务结束之前调用）"""
+    global crawl_results
+    crawl_results = CrawlResultsView(crawl_status.get('job_id'), total_results)
+    crawl_status['results'] = total_results
+
+def status_snapshot() -> Dict[str, Any]:
+    """任务状态（结果只含汇总，各URL结果通过 /results 分页读取）"""
+    status = {key: value for key, value in crawl_status.items() if key != 'results'}
+    view = crawl_results
+    status['results'] = view.summary() if view is not None and crawl_status.get('results') is not None else None
+    return status
+
+def get_catalog() -> ImageCatalog:
+    """获取全局图片元数据目录"""
+    global image_catalog
+    with catalog_lock:
+        if image_catalog is None:
+            image_catalog = ImageCatalog(app.config['CATALOG_PATH'])
+        return image_catalog
+
+def get_storage_budget() -> StorageBudget:
+    """获取全局存储预算，未配置 STORAGE_INDEX_PATH 时返回None"""
+    global storage_budget
+    with storage_lock:
+        if storage_budget is None and app.config['STORAGE_INDEX_PATH']:
+            storage_budget = StorageBudget(
+                app.config['STORAGE_INDEX_PATH'],
+                global_quota_bytes=app.config['STORAGE_GLOBAL_QUOTA_BYTES'],
+                min_free_bytes=app.config['STORAGE_MIN_FREE_BYTES'],
+                max_age_seconds=app.config['STORAGE_MAX_AGE_SECONDS'],
+                allow_eviction=app.config['STORAGE_EVICTION'],
+                pause_timeout=app.config['STORAGE_PAUSE_TIMEOUT']
+            )
+        return storage_budget
 
 class CrawlProgressHandler:
-    """爬虫进度处理器"""
+    """爬虫进度处理器（按图片粒度统计进度、吞吐和预计剩余时间）"""
     
-    def __init__(self):
-        self.total_images = 0
+    def __init__(self, min_interval: float = 0.25, ewma_alpha: float = 0.2):
+        """
+        Args:
+            min_interval: 两次进度推送的最小间隔（秒），图片完成事件在此间隔内只累计不推送
+            ewma_alpha: 单张图片耗时滑动平均的平滑系数
+        """
+        self.min_interval = min_interval
+        self.ewma_alpha = ewma_alpha
+        
+        self.total_urls = 0
+        self.processed_urls = 0
+        self.max_images = 0
         self.processed_images = 0
         self.downloaded_images = 0
         self.failed_images = 0
+        self.bytes_downloaded = 0
+        self.retries = 0
+        self.circuit_breakers = {}
+        # 流水线当前的并发上限 {renders/downloads: {'limit', 'maximum'}}
+        self.concurrency: Dict[str, Dict[str, int]] = {}
+        # 下载是否因磁盘空间不足而暂停
+        self.storage_paused = False
+        
+        # 每个URL的子进度 {url: {'total', 'done', 'downloaded', 'failed'}}
+        self.url_progress: Dict[str, Dict[str, int]] = {}
+        self.current_url = None
+        # 已确定图片数（报告过候选图片或已处理完）的URL
+        self._sized_urls = set()
+        
+        self.started_at = time.monotonic()
+        self._last_image_at = None
+        self._ewma_image_seconds = None
+        self._last_sent = 0.0
+        
+    @property
+    def total_images(self) -> int:
+        """预计的图片总数（已处理 + 已知待下载 + 未开始URL的估计值）"""
+        return self.processed_images + self._remaining_images()
+        
+    def update_total(self, total_urls: int, max_images: int = 0):
+        """
+        设置任务规模
+        
+        Args:
+            total_urls: URL总数
+            max_images: 每个URL的最大图片数，用于估计尚未开始的URL的图片数
+        """
+        self.total_urls = total_urls
+        self.max_images = max_images
+        self._send_progress(force=True)
+        
+    def set_total_urls(self, total_urls: int):
+        """更新URL总数（上传文件仍在解析时由解析线程调用，随下一次进度推送）"""
+        self.total_urls = total_urls
+        
+    def start_url(self, url: str):
+        """开始处理一个URL"""
+        self.current_url = url
+        self.url_progress.setdefault(url, {'total': 0, 'done': 0, 'downloaded': 0, 'failed': 0})
+        self._send_progress(force=True)
         
-    def update_total(self, total: int):
-        """更新总图片数"""
-        self.total_images = total
+    def on_crawler_event(self, event: Dict[str, Any]):
+        """爬虫进度回调（在下载路径上调用，只做计数，推送按间隔节流）"""
+        url = event.get('page_url') or self.current_url
+        state = self.url_progress.setdefault(url, {'total': 0, 'done': 0, 'downloaded': 0, 'failed': 0})
+        
+        if event['event'] == 'candidates':
+            # Selenium失败回退到Crawl4AI时会再次报告，已处理的图片仍计入
+            state['total'] = state['done'] + event['count']
+            self._sized_urls.add(url)
+            # 批量任务中页面按渲染完成顺序下载，当前下载的页面即为当前URL
+            self.current_url = url
+            self._send_progress(force=True)
+            return
+        
+        if event['event'] == 'concurrency':
+            self.concurrency = event['limits']
+            self._send_progress(force=True)
+            return
+        
+        if event['event'] == 'storage':
+            self.storage_paused = event['paused']
+            free_mb = event['free_bytes'] // (1024 * 1024)
+            if self.storage_paused:
+                self.send_log(f"磁盘剩余空间不足（{free_mb} MB），已暂停下载", logging.WARNING)
+            else:
+                self.send_log(f"磁盘空间已恢复（{free_mb} MB），继续下载")
+            self._send_progress(force=True)
+            return
+        
+        if event['event'] == 'page_done':
+            # 批量任务中一个页面处理完成
+            self.processed_urls += 1
+            state['total'] = state['done']
+            self._sized_urls.add(url)
+            self._send_progress(force=True)
+            return
+        
+        if event['event'] != 'image':
+            return
+        now = time.monotonic()
+        previous = self._last_image_at if self._last_image_at is not None else self.started_at
+        elapsed = now - previous
+        self._last_image_at = now
+        if self._ewma_image_seconds is None:
+            self._ewma_image_seconds = elapsed
+        else:
+            self._ewma_image_seconds += self.ewma_alpha * (elapsed - self._ewma_image_seconds)
+        
+        state['done'] += 1
+        self.processed_images += 1
+        if event.get('success'):
+            state['downloaded'] += 1
+            self.downloaded_images += 1
+            self.bytes_downloaded += event.get('bytes', 0)
+        else:
+            state['failed'] += 1
+            self.failed_images += 1
+        self.retries += event.get('retries', 0)
         self._send_progress()
         
-    def update_processed(self, processed: int, downloaded: int, failed: int):
-        """更新处理进度"""
-        self.processed_images = processed
+    def update_processed(self, processed_urls: int, downloaded: int, failed: int):
+        """
+        一个URL处理完成（以爬虫返回的结果为准校正计数）
+        
+        Args:
+            processed_urls: 已处理的URL数
+            downloaded: 累计下载成功数
+            failed: 累计下载失败数
+        """
+        self.processed_urls = processed_urls
         self.downloaded_images = downloaded
         self.failed_images = failed
-        self._send_progress()
+        self.processed_images = downloaded + failed
+        state = self.url_progress.get(self.current_url)
+        if state:
+            # 未下载的候选图片（如异常中断）不再计入剩余
+            state['total'] = state['done']
+            self._sized_urls.add(self.current_url)
+        self._send_progress(force=True)
         
-    def send_log(self, message: str):
-        """发送日志消息"""
-        message_queue.put({
-            'type': 'log',
-            'message': message
-        })
+    def update_download_health(self, retries: int, circuit_breakers: Dict[str, Any]):
+        """更新重试次数和CDN域名熔断状态"""
+        self.retries = retries
+        self.circuit_breakers = circuit_breakers
+        self._send_progress(force=True)
+        
+    def send_log(self, message: str, level: int = logging.INFO):
+        """发送日志消息（经日志层转发到SSE）"""
+        logger.log(level, message)
         
-    def _send_progress(self):
-        """发送进度更新"""
-        if self.total_images > 0:
-            progress = int((self.processed_images / self.total_images) * 100)
+    def _remaining_images(self) -> int:
+        known = sum(max(0, state['total'] - state['done']) for state in self.url_progress.values())
+        announced = [self.url_progress[url]['total'] for url in self._sized_urls]
+        unstarted = max(0, self.total_urls - len(self._sized_urls))
+        if announced:
+            per_url = sum(announced) / len(announced)
         else:
-            progress = 0
-            
-        status = f"已处理 {self.processed_images}/{self.total_images} 张图片 (成功: {self.downloaded_images}, 失败: {self.failed_images})"
+            per_url = self.max_images
+        return known + int(unstarted * per_url)
         
-        message_queue.put({
-            'type': 'progress',
-            'progress': progress,
-            'status': status
-        })
-
-# 创建上传目录
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    def snapshot(self) -> Dict[str, Any]:
+        """当前进度快照"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        remaining = self._remaining_images()
+        total = self.processed_images + remaining
+        eta = None
+        if self._ewma_image_seconds is not None and (remaining or self.processed_urls < self.total_urls):
+            eta = round(remaining * self._ewma_image_seconds, 1)
+        current = None
+        if self.current_url in self.url_progress:
+            state = self.url_progress[self.current_url]
+            current = dict(state, url=self.current_url,
+                           progress=int(state['done'] / state['total'] * 100) if state['total'] else 0)
+        return {
+            'progress': int(self.processed_images / total * 100) if total else 0,
+            'total_urls': self.total_urls,
+            'processed_urls': self.processed_urls,
+            'total_images': total,
+            'processed_images': self.processed_images,
+            'downloaded_images': self.downloaded_images,
+            'failed_images': self.failed_images,
+            'bytes_downloaded': self.bytes_downloaded,
+            'images_per_second': round(self.processed_images / elapsed, 2),
+            'bytes_per_second': round(self.bytes_downloaded / elapsed, 1),
+            'eta_seconds': eta,
+            'current_url': current
+        }
+        
+    def _send_progress(self, force: bool = False):
+        """发送进度更新（非强制时按最小间隔节流）"""
+        now = time.monotonic()
+        if not force and now - self._last_sent < self.min_interval:
+            return
+        self._last_sent = now
+        
+        snapshot = self.snapshot()
+        status = (f"URL {self.processed_urls}/{self.total_urls}，已处理 {self.processed_images}/{snapshot['total_images']} 张图片 "
+                  f"(成功: {self.downloaded_images}, 失败: {self.failed_images}, 重试: {self.retries})，"
+                  f"{snapshot['images_per_second']} 张/秒")
+        if snapshot['eta_seconds'] is not None:
+            status += f"，预计剩余 {int(snapshot['eta_seconds'])} 秒"
+        if self.storage_paused:
+            status += "，磁盘空间不足，下载已暂停"
+        
+        progress_events.put(dict(
+            snapshot,
+            type='progress',
+            status=status,
+            retries=self.retries,
+            circuit_breakers=self.circuit_breakers,
+            concurrency=self.concurrency,
+            storage_paused=self.storage_paused
+        ))
 
 @app.route('/')
 def index():
     """主页"""
     return render_template('index.html')
 
+def _parse_upload(chunks, link_parser: LinkStreamParser, feed: LinkFeed, until_first: bool = False):
+    """把上传文件的数据块解析为链接放入 feed（until_first 时读到链接即返回，之后可继续调用）"""
+    for chunk in chunks:
+        feed.put(link_parser.feed(chunk))
+        if until_first and len(feed):
+            return
+    feed.put(link_parser.close())
+    feed.close()
+    logger.info("上传文件解析完成: %s 字节，%s 个链接", link_parser.bytes_read, len(feed))
+
+def _keep_upload(chunks, filename: str):
+    """边解析边把上传文件写入 UPLOAD_FOLDER（文件名加时间戳和随机后缀，避免不同用户的同名文件互相覆盖）"""
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    name = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.urandom(3).hex()}_{secure_filename(filename) or 'upload'}"
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], name), 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+
 @app.route('/start_crawl', methods=['POST'])
 def start_crawl():
     """开始爬取"""
-    global crawl_thread, crawl_status
+    global crawl_thread, crawl_status, crawl_cancel_token
     
-    if crawl_status['running']:
+    if not accepting_jobs:
+        return jsonify({'success': False, 'error': '服务正在关闭，不再接受新任务'}), 503
+    
+    # 已停止的任务在线程退出前仍在关闭浏览器、写入部分结果，此时不接受新任务
+    if crawl_status['running'] or (crawl_thread is not None and crawl_thread.is_alive()):
         return jsonify({'success': False, 'error': '爬取正在进行中'})
     
     try:
+        # multipart 表单按到达顺序流式解码：文件之前的字段先读出，链接文件边上传边解析
+        # （访问 request.form 会先读完整个请求体）
+        upload = None
+        if request.mimetype == 'multipart/form-data':
+            upload = MultipartUpload(request.stream, request.mimetype_params.get('boundary', ''))
+            form = upload.read_fields()
+            if 'crawl_type' not in form:
+                # 字段在文件之后：先缓存文件内容，读完全部字段
+                form = upload.read_all_fields()
+        else:
+            form = request.form
+        
         # 获取参数
-        crawl_type = request.form.get('crawl_type')
-        save_dir = request.form.get('save_dir', 'douyin_images')
-        max_images = int(request.form.get('max_images', 50))
-        use_selenium = request.form.get('use_selenium') == 'true'
-        save_metadata = request.form.get('save_metadata') == 'true'
+        crawl_type = form.get('crawl_type')
+        save_dir = form.get('save_dir', 'douyin_images')
+        max_images = int(form.get('max_images', 50))
+        use_selenium = form.get('use_selenium') == 'true'
+        save_metadata = form.get('save_metadata') == 'true'
+        # 分布式：主页URL提交到任务队列，由各节点的 crawl_worker.py 爬取，本机只汇总结果
+        distributed = form.get('distributed') == 'true'
+        if distributed:
+            if get_task_broker() is None:
+                return jsonify({'success': False, 'error': '未配置分布式任务队列（TASK_BROKER_URL）'})
+            if crawl_type == 'video':
+                return jsonify({'success': False, 'error': '视频批量任务不支持分布式爬取'})
+        
+        # 页面结果缓存配置
+        page_cache_mode = form.get('page_cache_mode', CACHE_BYPASS)
+        if page_cache_mode not in CACHE_MODES:
+            return jsonify({'success': False, 'error': f'无效的页面缓存模式: {page_cache_mode}'})
+        crawler_options = {
+            'page_cache_mode': page_cache_mode,
+            'page_cache_ttl': float(form.get('page_cache_ttl', 24 * 3600))
+        }
+        
+        # 候选图片获取模式（sequential / hedged），hedge_delay 留空时按历史耗时自动确定
+        acquisition_mode = form.get('acquisition_mode', ACQUISITION_SEQUENTIAL)
+        if acquisition_mode not in ACQUISITION_MODES:
+            return jsonify({'success': False, 'error': f'无效的获取模式: {acquisition_mode}'})
+        crawler_options['acquisition_mode'] = acquisition_mode
+        hedge_delay = form.get('hedge_delay', '').strip()
+        if hedge_delay:
+            crawler_options['hedge_delay'] = float(hedge_delay)
+        
+        # 性能剖析（cprofile / sampling，留空不开启）
+        profile_mode = form.get('profile', '').strip() or None
+        if profile_mode and profile_mode not in PROFILE_MODES:
+            return jsonify({'success': False, 'error': f'无效的剖析模式: {profile_mode}'})
         
         # 处理保存路径 - 支持绝对路径和相对路径
         save_dir = save_dir.strip()
@@ -133,13 +485,13 @@ def start_crawl():
         except Exception as e:
             return jsonify({'success': False, 'error': f'无法创建保存目录: {str(e)}'})
         
-        print(f"保存路径设置为: {save_dir}")
+        logger.debug("保存路径设置为: %s", save_dir)
         
         # 根据爬取类型获取URL列表
         urls = []
         
         if crawl_type == 'url':
-            url = request.form.get('url')
+            url = form.get('url')
             if not url:
                 return jsonify({'success': False, 'error': '请提供有效的URL'})
             
@@ -151,54 +503,81 @@ def start_crawl():
             if '\n' in url:
                 url = url.split('\n')[0].strip()
             
-            print(f"网址爬取 - 原始URL: {repr(original_url)}")
-            print(f"网址爬取 - 清理后URL: {repr(url)}")
+            logger.debug("网址爬取 - 原始URL: %r", original_url)
+            logger.debug("网址爬取 - 清理后URL: %r", url)
             
             urls = [url]
             
         elif crawl_type == 'file':
-            file = request.files.get('file')
-            if not file or file.filename == '':
+            if upload is None or not upload.filename:
                 return jsonify({'success': False, 'error': '请选择文件'})
+            try:
+                link_parser = LinkStreamParser(upload.filename)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)})
             
-            # 保存上传的文件
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            upload_chunks = upload.iter_file()
+            if app.config['UPLOAD_KEEP_FILES']:
+                upload_chunks = _keep_upload(upload_chunks, upload.filename)
             
-            # 从文件中提取链接
+            # 从上传流中提取链接：读到第一批链接即启动爬取，其余部分在任务启动后继续解析
+            urls = LinkFeed()
             try:
-                urls = extract_links_from_file(file_path)
-                print(f"文档爬取 - 从文件提取的URLs: {urls}")
-                if not urls:
-                    return jsonify({'success': False, 'error': '文件中未找到有效的链接'})
+                _parse_upload(upload_chunks, link_parser, urls, until_first=True)
             except Exception as e:
                 return jsonify({'success': False, 'error': f'解析文件失败: {str(e)}'})
+            logger.debug("文档爬取 - 从文件提取的URLs: %s", urls.snapshot())
+            if not len(urls):
+                return jsonify({'success': False, 'error': '文件中未找到有效的链接'})
+        elif crawl_type == 'video':
+            # 视频链接（每行一个），在同一个浏览器中批量并发渲染
+            urls = extract_links_from_text(form.get('urls') or form.get('url') or '')
+            logger.debug("视频爬取 - 提取的URLs: %s", urls)
+            if not urls:
+                return jsonify({'success': False, 'error': '请提供有效的视频链接'})
         else:
             return jsonify({'success': False, 'error': '无效的爬取类型'})
         
         # 重置状态
+        job_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.urandom(3).hex()}"
         crawl_status.update({
             'running': True,
             'progress': 0,
             'status': '准备开始...',
             'results': None,
-            'error': None
+            'error': None,
+            'job_id': job_id,
+            'started_at': time.time()
         })
         
-        # 清空消息队列
-        while not message_queue.empty():
-            message_queue.get()
+        # 清空上一次任务的事件
+        progress_events.clear()
+        crawl_cancel_token = CancellationToken()
         
-        # 启动爬取线程
-        crawl_thread = threading.Thread(
-            target=run_crawl_task,
-            args=(urls, save_dir, max_images, use_selenium, save_metadata)
-        )
+        # 启动爬取线程（分布式时为汇总线程）
+        if distributed:
+            crawl_thread = threading.Thread(
+                target=run_distributed_job,
+                args=(urls, max_images, use_selenium, save_metadata, crawler_options, job_id, crawl_cancel_token)
+            )
+        else:
+            crawl_thread = threading.Thread(
+                target=run_crawl_task,
+                args=(urls, save_dir, max_images, use_selenium, save_metadata, crawler_options,
+                      job_id, profile_mode, crawl_cancel_token, crawl_type)
+            )
         crawl_thread.daemon = True
         crawl_thread.start()
         
-        return jsonify({'success': True, 'message': '爬取任务已启动'})
+        # 继续解析上传文件的剩余部分（爬取线程同时处理已读到的链接）
+        if isinstance(urls, LinkFeed) and not urls.closed:
+            try:
+                _parse_upload(upload_chunks, link_parser, urls)
+            except Exception as e:
+                logger.warning("上传文件解析中断: %s", e)
+                urls.close(str(e))
+        
+        return jsonify({'success': True, 'message': '爬取任务已启动', 'job_id': job_id, 'total_urls': len(urls)})
         
     except Exception as e:
         crawl_status['running'] = False
@@ -206,139 +585,718 @@ def start_crawl():
 
 @app.route('/stop_crawl', methods=['POST'])
 def stop_crawl():
-    """停止爬取"""
-    global crawl_status
-    
-    crawl_status['running'] = False
-    message_queue.put({
-        'type': 'log',
-        'message': '收到停止信号，正在停止爬取...'
-    })
+    """停止爬取（中止进行中的浏览器会话和下载；running 在爬取线程收尾结束后才清除）"""
+    logger.info('收到停止信号，正在停止爬取...')
+    if crawl_cancel_token is not None:
+        crawl_cancel_token.cancel('用户停止')
     
     return jsonify({'success': True, 'message': '停止信号已发送'})
 
 @app.route('/progress')
 def progress():
-    """SSE进度推送"""
+    """SSE进度推送（支持 Last-Event-ID 断线重连，中途加入的客户端会先收到最近的历史）"""
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id', 0))
+    except ValueError:
+        last_id = 0
+    if last_id > progress_events.last_id:
+        # 服务重启后序号重新计数
+        last_id = 0
+    
+    def format_event(event_id, message):
+        return f"id: {event_id}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+    
+    max_seconds = app.config['SSE_MAX_STREAM_SECONDS']
+    heartbeat_seconds = app.config['SSE_HEARTBEAT_SECONDS']
+    
     def generate():
+        nonlocal last_id
+        started = last_sent = time.monotonic()
         while True:
             try:
-                # 获取消息
-                if not message_queue.empty():
-                    message = message_queue.get_nowait()
-                    yield f"data: {json.dumps(message, ensure_ascii=False)}\n\n"
+                # 等待新事件（最多0.5秒，之后检查任务是否结束）
+                events, last_id = progress_events.wait(last_id, timeout=0.5)
+                for event_id, message in events:
+                    yield format_event(event_id, message)
+                now = time.monotonic()
+                if events:
+                    last_sent = now
+                elif now - last_sent >= heartbeat_seconds:
+                    # SSE注释行，浏览器忽略；客户端已断开时写入失败，连接线程随之释放
+                    yield ": keepalive\n\n"
+                    last_sent = now
+                
+                # 连接时间有上限，避免长任务期间一直占用服务线程
+                if max_seconds and now - started >= max_seconds:
+                    yield "retry: 1000\n\n"
+                    break
                 
                 # 检查是否完成
                 if not crawl_status['running'] and crawl_status.get('results'):
-                    yield f"data: {json.dumps({'type': 'complete', 'results': crawl_status['results']}, ensure_ascii=False)}\n\n"
+                    # 只推送汇总，各URL结果通过 /results 分页读取
+                    complete = {'type': 'complete', 'results': status_snapshot()['results'], 'results_url': '/results'}
+                    yield f"data: {json.dumps(complete, ensure_ascii=False)}\n\n"
                     break
                 elif not crawl_status['running'] and crawl_status.get('error'):
                     yield f"data: {json.dumps({'type': 'error', 'message': crawl_status['error']}, ensure_ascii=False)}\n\n"
                     break
                 
-                time.sleep(0.5)  # 避免过于频繁的检查
-                
             except Exception as e:
                 yield f"data: {json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False)}\n\n"
                 break
     
-    return Response(generate(), mimetype='text/event-stream')
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 反向代理（nginx）不缓冲事件流
+    })
+
+def drain_crawl_jobs(timeout: float = 300, cancel_grace: float = 15) -> bool:
+    """
+    服务关闭前等待正在运行的爬取任务结束（不再接受新任务）
+    
+    Args:
+        timeout: 等待任务自然结束的最长时间（秒）
+        cancel_grace: 超时后取消任务，再等待其收尾（写入部分元数据）的时间（秒）
+        
+    Returns:
+        任务是否已结束
+    """
+    global accepting_jobs
+    accepting_jobs = False
+    
+    thread = crawl_thread
+    if thread is None or not thread.is_alive():
+        return True
+    
+    logger.info("等待正在运行的爬取任务结束（最长 %s 秒）...", timeout)
+    thread.join(timeout)
+    if thread.is_alive():
+        logger.warning("爬取任务未在 %s 秒内结束，正在取消", timeout)
+        if crawl_cancel_token is not None:
+            crawl_cancel_token.cancel('服务关闭')
+        thread.join(cancel_grace)
+    
+    finished = not thread.is_alive()
+    if not finished:
+        logger.error("爬取任务未能在关闭前结束")
+    return finished
+
+def _finish_profile(profiler: JobProfiler) -> Dict[str, Any]:
+    """停止剖析，登记产物并返回下载信息"""
+    artifacts = profiler.stop()
+    job_profiles[profiler.job_id] = artifacts
+    return {
+        'job_id': profiler.job_id,
+        'mode': profiler.mode,
+        'seconds': round(profiler.elapsed, 3),
+        'files': {kind: f"/profile/{profiler.job_id}/{kind}" for kind in artifacts}
+    }
 
-def run_crawl_task(urls, save_dir, max_images, use_selenium, save_metadata):
-    """运行爬取任务"""
+def _run_video_batch(crawler, urls, save_metadata, cancel_token, progress_handler, total_results):
+    """批量爬取视频页面，结果合并到 total_results"""
+    progress_handler.send_log(f"批量渲染 {len(urls)} 个视频页面（最多同时 {app.config['VIDEO_BATCH_CONCURRENCY']} 个）")
+    total_results['method_used'] = 'crawl4ai'
+    
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        result = loop.run_until_complete(
+            crawler.crawl_douyin_video_images_batch(
+                video_urls=urls,
+                save_metadata=save_metadata,
+                max_concurrency=app.config['VIDEO_BATCH_CONCURRENCY'],
+                memory_threshold_percent=app.config['VIDEO_BATCH_MEMORY_PERCENT'],
+                cancel_token=cancel_token
+            )
+        )
+    finally:
+        loop.close()
+    
+    for key in ('total_images', 'downloaded_images', 'failed_downloads', 'retries'):
+        total_results[key] += result.get(key, 0)
+    total_results['circuit_breakers'] = crawler.circuit_breakers.snapshot()
+    total_results['processed_urls'] = len(result.get('videos', []))
+    total_results['url_results'] = [{'url': video['video_url'], 'result': video} for video in result.get('videos', [])]
+    if result.get('cancelled'):
+        total_results['cancelled'] = True
+        progress_handler.send_log(f"批量任务已中止: 已下载 {result.get('downloaded_images', 0)} 张图片", logging.WARNING)
+    if result.get('error'):
+        progress_handler.send_log(f"批量爬取出错: {result['error']}", logging.ERROR)
+    
+    progress_handler.update_download_health(total_results['retries'], total_results['circuit_breakers'])
+    progress_handler.update_processed(
+        total_results['processed_urls'],
+        total_results['downloaded_images'],
+        total_results['failed_downloads']
+    )
+
+def _run_pipeline(crawler, urls, max_images, use_selenium, save_metadata, cancel_token,
+                  progress_handler, total_results):
+    """用户主页任务：分阶段流水线（渲染下一个页面时继续下载上一个页面的图片），结果合并到 total_results"""
+    progress_handler.send_log(
+        f"流水线模式: 最多 {app.config['PIPELINE_RENDER_WORKERS']} 个页面同时渲染，"
+        f"最多 {app.config['PIPELINE_DOWNLOAD_WORKERS']} 张图片同时下载"
+        f"{'（自适应并发）' if app.config['PIPELINE_ADAPTIVE'] else ''}"
+    )
+    
+    def on_page_done(url, result):
+        total_results['total_images'] += result.get('total_images', 0)
+        total_results['downloaded_images'] += result.get('downloaded_images', 0)
+        total_results['failed_downloads'] += result.get('failed_downloads', 0)
+        total_results['retries'] += result.get('retries', 0)
+        total_results['circuit_breakers'] = crawler.circuit_breakers.snapshot()
+        total_results['processed_urls'] += 1
+        
+        acquisition = result.get('acquisition')
+        if acquisition and acquisition.get('winner'):
+            progress_handler.send_log(
+                f"候选图片由 {acquisition['winner']} 获取"
+                f"{'（已对冲）' if acquisition.get('hedged') else ''}"
+            )
+        progress_handler.send_log(
+            f"URL 完成: {url}，下载 {result.get('downloaded_images', 0)} 张图片"
+            f"，重试 {result.get('retries', 0)} 次"
+        )
+        open_hosts = crawler.circuit_breakers.open_hosts()
+        if open_hosts:
+            progress_handler.send_log(f"熔断中的CDN域名: {', '.join(open_hosts)}", logging.WARNING)
+        progress_handler.update_download_health(total_results['retries'], total_results['circuit_breakers'])
+    
+    pipeline = CrawlPipeline(
+        crawler,
+        max_images=max_images,
+        use_selenium=use_selenium,
+        save_metadata=save_metadata,
+        render_workers=app.config['PIPELINE_RENDER_WORKERS'],
+        download_workers=app.config['PIPELINE_DOWNLOAD_WORKERS'],
+        queue_size=app.config['PIPELINE_QUEUE_SIZE'],
+        adaptive=app.config['PIPELINE_ADAPTIVE'],
+        cancel_token=cancel_token,
+        on_page_done=on_page_done
+    )
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        results = loop.run_until_complete(pipeline.run(urls))
+    finally:
+        loop.close()
+    
+    total_results['concurrency'] = pipeline.concurrency_snapshot()
+    for result in results:
+        total_results['url_results'].append({'url': result['user_url'], 'result': result})
+        if result.get('cancelled'):
+            total_results['cancelled'] = True
+            total_results['downloaded_images'] += result.get('downloaded_images', 0)
+            total_results['failed_downloads'] += result.get('failed_downloads', 0)
+    if total_results.get('cancelled'):
+        progress_handler.send_log(f"任务已中止: 已下载 {total_results['downloaded_images']} 张图片", logging.WARNING)
+    
+    progress_handler.update_processed(
+        total_results['processed_urls'],
+        total_results['downloaded_images'],
+        total_results['failed_downloads']
+    )
+
+def run_crawl_task(urls, save_dir, max_images, use_selenium, save_metadata, crawler_options=None,
+                   job_id=None, profile_mode=None, cancel_token=None, crawl_type='url'):
+    """运行爬取任务（crawl_type 为 video 时批量爬取视频页面，否则用流水线或逐个爬取用户主页）"""
     global crawl_status
     
     progress_handler = CrawlProgressHandler()
+    CRAWL_JOBS_RUNNING.inc()
+    # 图片请求、Selenium会话和写盘都在线程池中执行，采样需包含所有线程
+    profiler = JobProfiler(save_dir, job_id or str(int(time.time())), profile_mode,
+                           all_threads=True) if profile_mode else None
+    job_storage = None
     
     try:
-        progress_handler.send_log(f"开始爬取任务，共 {len(urls)} 个URL")
+        if profiler:
+            profiler.start()
+            progress_handler.send_log(f"性能剖析已开启: {profile_mode}")
+        if isinstance(urls, LinkFeed) and not urls.closed:
+            # 上传文件仍在解析：已读到的URL先开始爬取，URL总数随解析增长
+            progress_handler.send_log(f"开始爬取任务，已读取 {len(urls)} 个URL，文件仍在解析")
+            urls.add_listener(progress_handler.set_total_urls)
+        else:
+            progress_handler.send_log(f"开始爬取任务，共 {len(urls)} 个URL")
         progress_handler.send_log(f"保存目录: {save_dir}")
         progress_handler.send_log(f"最大图片数: {max_images}")
         progress_handler.send_log(f"使用Selenium: {use_selenium}")
+        progress_handler.update_total(len(urls), max_images)
+        
+        # 存储预算：先清理过期的旧任务图片，再按配额和磁盘剩余空间控制本任务的下载
+        budget = get_storage_budget()
+        if budget is not None:
+            Path(save_dir).mkdir(parents=True, exist_ok=True)
+            expired = budget.evict_expired()
+            if expired:
+                progress_handler.send_log(f"已清理过期的旧任务图片 {expired // (1024 * 1024)} MB")
+            job_storage = budget.job(job_id or save_dir, save_dir, app.config['STORAGE_JOB_QUOTA_BYTES'])
         
         # 创建爬虫实例
-        crawler = DouyinImageCrawler(download_dir=save_dir)
+        crawler = DouyinImageCrawler(
+            download_dir=save_dir,
+            catalog_path=app.config['CATALOG_PATH'],
+            progress_callback=progress_handler.on_crawler_event,
+            acquisition_stats_path=app.config['ACQUISITION_STATS_PATH'],
+            storage=job_storage,
+            **(crawler_options or {})
+        )
+        if crawler.page_cache.mode != CACHE_BYPASS:
+            progress_handler.send_log(f"页面缓存模式: {crawler.page_cache.mode}")
+        if crawler.acquisition_mode != ACQUISITION_SEQUENTIAL:
+            progress_handler.send_log(f"候选图片获取模式: {crawler.acquisition_mode}")
         
         total_results = {
             'total_images': 0,
             'downloaded_images': 0,
             'failed_downloads': 0,
+            'retries': 0,
+            'circuit_breakers': {},
             'processed_urls': 0,
             'method_used': 'selenium' if use_selenium else 'crawl4ai',
             'save_path': str(Path(save_dir).absolute()),
             'url_results': []
         }
         
-        # 处理每个URL
-        for i, url in enumerate(urls):
-            if not crawl_status['running']:
-                progress_handler.send_log("爬取已被用户停止")
-                break
+        try:
+            if crawl_type == 'video':
+                _run_video_batch(crawler, urls, save_metadata, cancel_token, progress_handler, total_results)
+            elif app.config['PIPELINE_ENABLED']:
+                _run_pipeline(crawler, urls, max_images, use_selenium, save_metadata, cancel_token,
+                              progress_handler, total_results)
+            else:
+                # 处理每个URL
+                for i, url in enumerate(urls):
+                    if not crawl_status['running'] or (cancel_token is not None and cancel_token.cancelled):
+                        progress_handler.send_log("爬取已被用户停止")
+                        total_results['cancelled'] = True
+                        break
                 
-            progress_handler.send_log(f"正在处理第 {i+1}/{len(urls)} 个URL: {url}")
+                    progress_handler.send_log(f"正在处理第 {i+1}/{len(urls)} 个URL: {url}")
+                    progress_handler.start_url(url)
             
-            try:
-                # 运行异步爬取
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
+                    try:
+                        # 运行异步爬取
+                        loop = asyncio.new_event_loop()
+                        asyncio.set_event_loop(loop)
                 
-                result = loop.run_until_complete(
-                    crawler.crawl_douyin_user_images(
-                        user_url=url,
-                        max_images=max_images,
-                        save_metadata=save_metadata,
-                        use_selenium=use_selenium
-                    )
-                )
+                        result = loop.run_until_complete(
+                            crawler.crawl_douyin_user_images(
+                                user_url=url,
+                                max_images=max_images,
+                                save_metadata=save_metadata,
+                                use_selenium=use_selenium,
+                                cancel_token=cancel_token
+                            )
+                        )
                 
-                loop.close()
+                        loop.close()
                 
-                # 更新总结果
-                total_results['total_images'] += result.get('total_images', 0)
-                total_results['downloaded_images'] += result.get('downloaded_images', 0)
-                total_results['failed_downloads'] += result.get('failed_downloads', 0)
-                total_results['processed_urls'] += 1
-                total_results['url_results'].append({
-                    'url': url,
-                    'result': result
-                })
+                        # 更新总结果
+                        total_results['total_images'] += result.get('total_images', 0)
+                        total_results['downloaded_images'] += result.get('downloaded_images', 0)
+                        total_results['failed_downloads'] += result.get('failed_downloads', 0)
+                        total_results['retries'] += result.get('retries', 0)
+                        total_results['circuit_breakers'] = crawler.circuit_breakers.snapshot()
+                        total_results['processed_urls'] += 1
+                        total_results['url_results'].append({
+                            'url': url,
+                            'result': result
+                        })
                 
-                progress_handler.send_log(
-                    f"URL {i+1} 完成: 下载 {result.get('downloaded_images', 0)} 张图片"
-                )
+                        acquisition = result.get('acquisition')
+                        if acquisition and acquisition.get('winner'):
+                            progress_handler.send_log(
+                                f"候选图片由 {acquisition['winner']} 获取"
+                                f"{'（已对冲）' if acquisition.get('hedged') else ''}"
+                            )
                 
-                # 更新进度
-                progress_handler.update_processed(
-                    i + 1,
-                    total_results['downloaded_images'],
-                    total_results['failed_downloads']
-                )
+                        if result.get('cancelled'):
+                            progress_handler.send_log(
+                                f"URL {i+1} 已中止: 已下载 {result.get('downloaded_images', 0)} 张图片", logging.WARNING
+                            )
+                        else:
+                            progress_handler.send_log(
+                                f"URL {i+1} 完成: 下载 {result.get('downloaded_images', 0)} 张图片"
+                                f"，重试 {result.get('retries', 0)} 次"
+                            )
+                        open_hosts = crawler.circuit_breakers.open_hosts()
+                        if open_hosts:
+                            progress_handler.send_log(f"熔断中的CDN域名: {', '.join(open_hosts)}", logging.WARNING)
+                        progress_handler.update_download_health(
+                            total_results['retries'],
+                            total_results['circuit_breakers']
+                        )
                 
-            except Exception as e:
-                error_msg = f"处理URL {url} 时出错: {str(e)}"
-                progress_handler.send_log(error_msg)
-                total_results['url_results'].append({
-                    'url': url,
-                    'error': str(e)
-                })
+                        # 更新进度
+                        progress_handler.update_processed(
+                            i + 1,
+                            total_results['downloaded_images'],
+                            total_results['failed_downloads']
+                        )
+                
+                    except Exception as e:
+                        error_msg = f"处理URL {url} 时出错: {str(e)}"
+                        progress_handler.send_log(error_msg, logging.ERROR)
+                        total_results['url_results'].append({
+                            'url': url,
+                            'error': str(e)
+                        })
+                        progress_handler.update_processed(
+                            i + 1,
+                            total_results['downloaded_images'],
+                            total_results['failed_downloads']
+                        )
+        finally:
+            # 出错时也要写完图片并写入元数据目录中缓冲的记录
+            crawler.close()
+        
+        total_results['page_cache'] = crawler.page_cache.stats()
+        total_results['acquisition_stats'] = crawler.acquisition_stats.snapshot()
+        if job_storage is not None:
+            total_results['storage'] = job_storage.snapshot()
+            if job_storage.rejected:
+                progress_handler.send_log(f"{job_storage.rejected} 张图片因超出存储配额未下载", logging.WARNING)
+        if profiler:
+            total_results['profile'] = _finish_profile(profiler)
         
         # 完成
-        crawl_status['results'] = total_results
+        publish_results(total_results)
         crawl_status['running'] = False
         
+        if cancel_token is not None and cancel_token.reason == DISK_FULL_REASON:
+            progress_handler.send_log("磁盘空间不足且长时间未恢复，任务已中止", logging.ERROR)
         progress_handler.send_log("爬取任务完成！")
         progress_handler.send_log(f"总计下载 {total_results['downloaded_images']} 张图片")
         
     except Exception as e:
         error_msg = f"爬取任务失败: {str(e)}"
-        progress_handler.send_log(error_msg)
+        progress_handler.send_log(error_msg, logging.ERROR)
+        if profiler:
+            crawl_status['profile'] = _finish_profile(profiler)
+        crawl_status['error'] = error_msg
+        crawl_status['running'] = False
+    finally:
+        if job_storage is not None:
+            job_storage.close()
+        CRAWL_JOBS_RUNNING.dec()
+
+def run_distributed_job(urls, max_images, use_selenium, save_metadata, crawler_options, job_id,
+                        cancel_token=None):
+    """协调端：把主页URL提交到任务队列，轮询汇总各worker的结果（取消时取消未完成的任务）"""
+    global crawl_status
+    
+    progress_handler = CrawlProgressHandler()
+    CRAWL_JOBS_RUNNING.inc()
+    broker = get_task_broker()
+    try:
+        urls = list(dict.fromkeys(urls))
+        payloads = [{
+            'url': url,
+            'max_images': max_images,
+            'use_selenium': use_selenium,
+            'save_metadata': save_metadata,
+            'crawler_options': crawler_options or {}
+        } for url in urls]
+        broker.submit(job_id, payloads, max_attempts=app.config['DISTRIBUTED_MAX_ATTEMPTS'])
+        progress_handler.send_log(f"已提交分布式任务 {job_id}，共 {len(urls)} 个URL")
+        progress_handler.update_total(len(urls), max_images)
+        workers = broker.workers()
+        if workers:
+            progress_handler.send_log(f"在线worker: {', '.join(worker['worker_id'] for worker in workers)}")
+        else:
+            progress_handler.send_log("当前没有在线worker，任务将在worker启动后开始", logging.WARNING)
+        
+        reported = set()
+        cancel_sent = False
+        while True:
+            if cancel_token is not None and cancel_token.cancelled and not cancel_sent:
+                cancelled = broker.cancel_job(job_id)
+                cancel_sent = True
+                progress_handler.send_log(f"已取消 {cancelled} 个未完成的分布式任务", logging.WARNING)
+            
+            # 租约过期的任务（worker失联）由协调端回收，不依赖其他worker下次租用时顺带回收
+            requeued = broker.requeue_expired()
+            if requeued:
+                progress_handler.send_log(f"回收了 {requeued} 个租约过期的任务（worker失联）", logging.WARNING)
+            
+            tasks = broker.job_tasks(job_id)
+            for task in tasks:
+                if task['state'] not in FINAL_STATES or task['task_id'] in reported:
+                    continue
+                reported.add(task['task_id'])
+                result = task['result'] or {}
+                if task['state'] == TASK_DONE:
+                    progress_handler.send_log(
+                        f"URL 完成（{result.get('worker_id')}）: {task['payload']['url']}，"
+                        f"下载 {result.get('downloaded_images', 0)} 张图片"
+                    )
+                elif task['error']:
+                    progress_handler.send_log(f"URL 失败: {task['payload']['url']}，{task['error']}", logging.WARNING)
+            
+            summary = broker.job_summary(job_id)
+            progress_handler.update_processed(len(reported), summary['downloaded_images'], summary['failed_downloads'])
+            if summary['finished']:
+                break
+            time.sleep(app.config['DISTRIBUTED_POLL_SECONDS'])
+        
+        total_results = {
+            'total_images': summary['total_images'],
+            'downloaded_images': summary['downloaded_images'],
+            'failed_downloads': summary['failed_downloads'],
+            'retries': summary['retries'],
+            'circuit_breakers': {},
+            'processed_urls': summary['states'][TASK_DONE],
+            'method_used': 'selenium' if use_selenium else 'crawl4ai',
+            'save_path': sorted({task['result']['save_dir'] for task in tasks if task['result']}),
+            'url_results': [
+                {'url': task['payload']['url'], 'result': task['result']} if task['state'] == TASK_DONE
+                else {'url': task['payload']['url'], 'error': task['error'] or task['state']}
+                for task in tasks
+            ],
+            'distributed': {
+                'job_id': job_id,
+                'states': summary['states'],
+                'workers': sorted({task['worker_id'] for task in tasks if task['worker_id']})
+            }
+        }
+        if cancel_sent:
+            total_results['cancelled'] = True
+        
+        publish_results(total_results)
+        crawl_status['running'] = False
+        progress_handler.send_log("分布式任务完成！")
+        progress_handler.send_log(f"总计下载 {total_results['downloaded_images']} 张图片")
+        
+    except Exception as e:
+        error_msg = f"分布式任务失败: {str(e)}"
+        progress_handler.send_log(error_msg, logging.ERROR)
         crawl_status['error'] = error_msg
         crawl_status['running'] = False
+    finally:
+        CRAWL_JOBS_RUNNING.dec()
 
 @app.route('/status')
 def get_status():
-    """获取当前状态"""
-    return jsonify(crawl_status)
+    """获取当前状态（只含结果汇总，内容未变化时返回304）"""
+    response = jsonify(status_snapshot())
+    response.add_etag()
+    return response.make_conditional(request)
+
+def _results_view():
+    """当前结果视图和请求的ETag检查：返回 (视图, 提前返回的响应)"""
+    view = crawl_results
+    if view is None or crawl_status.get('results') is None:
+        return None, (jsonify({'success': False, 'running': crawl_status['running'], 'error': '暂无结果'}), 404)
+    if request.if_none_match.contains_weak(view.etag):
+        # 结果未变化：不再序列化
+        response = Response(status=304)
+        response.set_etag(view.etag, weak=True)
+        return None, response
+    return view, None
+
+def _with_etag(view: CrawlResultsView, payload: Dict[str, Any]):
+    response = jsonify(dict(payload, success=True, job_id=view.job_id))
+    response.set_etag(view.etag, weak=True)
+    return response
+
+@app.route('/results')
+def list_results():
+    """按游标分页读取各URL的结果（不含图片元数据），支持 status / url 过滤"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        return jsonify({'success': False, 'error': '分页参数无效'}), 400
+    view, response = _results_view()
+    if response is not None:
+        return response
+    try:
+        page = view.url_results(cursor=request.args.get('cursor'), limit=limit,
+                                status=request.args.get('status') or None, url=request.args.get('url') or None)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return _with_etag(view, dict(page, limit=limit))
+
+@app.route('/results/images')
+def list_result_images():
+    """按游标分页读取一个URL的图片元数据"""
+    url = request.args.get('url')
+    if not url:
+        return jsonify({'success': False, 'error': '缺少 url 参数'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+    except ValueError:
+        return jsonify({'success': False, 'error': '分页参数无效'}), 400
+    view, response = _results_view()
+    if response is not None:
+        return response
+    try:
+        page = view.images(url, cursor=request.args.get('cursor'), limit=limit)
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if page is None:
+        return jsonify({'success': False, 'error': '结果中没有该URL'}), 404
+    return _with_etag(view, dict(page, limit=limit))
+
+def _export_files(view: CrawlResultsView):
+    """任务下载的图片 (本地路径, 归档内路径)：优先用结果中的元数据，未保存元数据时从图片目录按任务开始时间查找"""
+    files = view.image_files()
+    if not files and app.config['CATALOG_PATH'] and crawl_status.get('started_at'):
+        catalog = get_catalog()
+        for url in view.page_urls():
+            files.extend((url, row['file_path']) for row in catalog.query(
+                source_url=url, since=crawl_status['started_at'], limit=1000000) if row.get('file_path'))
+    save_path = crawl_status['results'].get('save_path')
+    root = Path(save_path) if isinstance(save_path, str) else None
+    exported = []
+    for _, path in files:
+        path = Path(path)
+        try:
+            arcname = path.relative_to(root).as_posix() if root else path.name
+        except ValueError:
+            arcname = path.name
+        exported.append((str(path), arcname))
+    return exported
+
+@app.route('/export/<job_id>')
+def export_images(job_id):
+    """边生成边下载任务图片的归档（?format=zip|tar），支持Range断点续传"""
+    view = crawl_results
+    if view is None or crawl_status.get('results') is None or view.job_id != job_id:
+        return jsonify({'success': False, 'error': '任务结果不存在（只保留最近一次任务）'}), 404
+    archive_format = request.args.get('format', 'zip')
+    if archive_format not in ARCHIVE_FORMATS:
+        return jsonify({'success': False, 'error': f'无效的归档格式: {archive_format}'}), 400
+    entries = collect_entries(_export_files(view))
+    if not entries:
+        return jsonify({'success': False, 'error': '没有可导出的图片'}), 404
+    budget = get_storage_budget()
+    if budget is not None and request.method != 'HEAD' and not request.range:
+        # 被导出的图片最近仍在使用，推迟淘汰
+        budget.touch(entry.path for entry in entries)
+    archive = ARCHIVE_FORMATS[archive_format](entries)
+    
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f'attachment; filename="douyin_{job_id}.{archive.extension}"'
+    }
+    if request.if_none_match.contains(archive.etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(archive.etag)
+        return response
+    
+    start, end, status = 0, archive.length, 200
+    # If-Range 不匹配（文件已变化）时忽略Range，返回完整归档；没有Last-Modified，日期形式的If-Range按不匹配处理
+    if_range = request.if_range
+    range_valid = (if_range.etag is None and if_range.date is None) or if_range.etag == archive.etag
+    if request.range and range_valid:
+        byte_range = request.range.range_for_length(archive.length)
+        if byte_range is None:
+            headers['Content-Range'] = f'bytes */{archive.length}'
+            return Response(status=416, headers=headers)
+        start, end = byte_range
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{archive.length}'
+    
+    logger.info("导出任务 %s: %s 个文件，%s 字节（%s-%s）", job_id, len(entries), archive.length, start, end)
+    response = Response(archive.iter_range(start, end), status=status, headers=headers,
+                        mimetype=archive.content_type, direct_passthrough=True)
+    response.content_length = end - start
+    response.set_etag(archive.etag)
+    return response
+
+@app.route('/profile/<job_id>/<kind>')
+def download_profile(job_id, kind):
+    """下载任务的性能剖析产物（prof / collapsed / summary）"""
+    path = job_profiles.get(job_id, {}).get(kind)
+    if not path or not os.path.exists(path):
+        return jsonify({'success': False, 'error': '剖析结果不存在'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus格式的指标导出"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/workers')
+def list_workers():
+    """分布式worker列表（最近心跳的worker）"""
+    broker = get_task_broker()
+    if broker is None:
+        return jsonify({'success': False, 'error': '未配置分布式任务队列'}), 404
+    try:
+        max_age = float(request.args.get('max_age', 120))
+        if not max_age >= 0:
+            raise ValueError(max_age)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'max_age 参数无效'}), 400
+    return jsonify({'success': True, 'workers': broker.workers(max_age=max_age)})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """分布式作业的汇总和各任务状态"""
+    broker = get_task_broker()
+    if broker is None:
+        return jsonify({'success': False, 'error': '未配置分布式任务队列'}), 404
+    tasks = broker.job_tasks(job_id)
+    if not tasks:
+        return jsonify({'success': False, 'error': '作业不存在'}), 404
+    return jsonify({
+        'success': True,
+        'summary': broker.job_summary(job_id),
+        'tasks': [{
+            'url': task['payload']['url'],
+            'state': task['state'],
+            'attempts': task['attempts'],
+            'worker_id': task['worker_id'],
+            'result': task['result'],
+            'error': task['error']
+        } for task in tasks]
+    })
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消分布式作业中未完成的任务（进行中的worker在下次续租时停止）"""
+    broker = get_task_broker()
+    if broker is None:
+        return jsonify({'success': False, 'error': '未配置分布式任务队列'}), 404
+    return jsonify({'success': True, 'cancelled': broker.cancel_job(job_id)})
+
+@app.route('/catalog')
+def query_catalog():
+    """查询图片元数据目录"""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        offset = int(request.args.get('offset', 0))
+        since = request.args.get('since')
+        since = float(since) if since else None
+    except ValueError:
+        return jsonify({'success': False, 'error': '分页参数无效'}), 400
+    
+    catalog = get_catalog()
+    source_url = request.args.get('source_url')
+    images = catalog.query(
+        source_url=source_url,
+        image_url=request.args.get('image_url'),
+        content_hash=request.args.get('content_hash'),
+        since=since,
+        limit=limit,
+        offset=offset
+    )
+    return jsonify({
+        'success': True,
+        'images': images,
+        'count': len(images),
+        'total': catalog.count(source_url) if source_url else None,
+        'limit': limit,
+        'offset': offset
+    })
+
+@app.route('/catalog/stats')
+def catalog_stats():
+    """图片元数据目录统计"""
+    return jsonify({'success': True, 'stats': get_catalog().stats()})
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -356,6 +1314,7 @@ if __name__ == '__main__':
     print("   • 请遵守抖音平台使用条款")
     print("   • 建议适度使用，避免频繁请求")
     print("   • 确保网络连接稳定")
+    print("   • 生产环境请使用: python start_web.py --server waitress")
     print("=" * 60)
     
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
+    app.run(debug=os.environ.get('DOUYIN_DEBUG') == '1', host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
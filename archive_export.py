@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 边生成边发送的ZIP/TAR导出
+按文件大小预先计算整个归档的布局（不读取文件内容），响应时只生成请求的字节区间：
+归档既不在内存中也不在磁盘上完整生成，长度固定，可以支持HTTP Range断点续传。
+ZIP使用存储模式（图片已压缩，不再压缩），CRC32在发送文件内容时计算，写在数据描述符和中央目录中
+"""
+
+import bisect
+import hashlib
+import os
+import struct
+import tarfile
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from crawl_logging import get_logger
+
+logger = get_logger('export')
+
+# 读取文件的块大小
+CHUNK_SIZE = 256 * 1024
+
+_ZIP32_LIMIT = 0xFFFFFFFF
+_ZIP_COUNT_LIMIT = 0xFFFF
+# 通用标志：使用数据描述符（CRC在文件内容之后） | 文件名为UTF-8
+_ZIP_FLAGS = 0x08 | 0x800
+_TAR_BLOCK = 512
+
+# 段的类型
+SEGMENT_BYTES = 0    # 固定字节
+SEGMENT_FILE = 1     # 文件内容（参数为条目序号）
+SEGMENT_RECORD = 2   # 依赖CRC、发送时才生成的记录（参数由子类的 _build_record 解释）
+
+
+class ArchiveEntry:
+    """归档中的一个文件"""
+
+    def __init__(self, path: str, arcname: str, size: int, mtime: float):
+        """
+        Args:
+            path: 本地文件路径
+            arcname: 归档内的路径
+            size: 文件大小（生成布局时的大小）
+            mtime: 修改时间
+        """
+        self.path = path
+        self.arcname = arcname
+        self.size = size
+        self.mtime = mtime
+
+
+def collect_entries(files: Iterable[Tuple[str, str]]) -> List[ArchiveEntry]:
+    """
+    读取文件大小和修改时间，生成归档条目（不存在的文件跳过，重名时加序号）
+
+    Args:
+        files: (本地路径, 归档内路径) 列表
+
+    Returns:
+        归档条目列表
+    """
+    entries = []
+    seen_paths = set()
+    used_names = set()
+    for path, arcname in files:
+        path = os.path.abspath(path)
+        if path in seen_paths:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            logger.debug("导出时文件不存在，跳过: %s", path)
+            continue
+        seen_paths.add(path)
+        arcname = arcname.replace('\\', '/').lstrip('/')
+        base, extension = os.path.splitext(arcname)
+        counter = 1
+        while arcname in used_names:
+            arcname = f"{base}({counter}){extension}"
+            counter += 1
+        used_names.add(arcname)
+        entries.append(ArchiveEntry(path, arcname, stat.st_size, stat.st_mtime))
+    return entries
+
+
+class StreamingArchive:
+    """
+    归档布局：由若干段（固定字节 / 文件内容 / 依赖CRC的记录）组成，每段长度在生成布局时确定
+    """
+
+    content_type = 'application/octet-stream'
+    extension = ''
+
+    def __init__(self, entries: List[ArchiveEntry]):
+        """
+        Args:
+            entries: 归档条目（collect_entries 的结果）
+        """
+        self.entries = entries
+        # 段按偏移排列，用并列的列表保存（数万个条目时避免为每段创建闭包）
+        self._offsets: List[int] = []
+        self._lengths: List[int] = []
+        self._kinds: List[int] = []
+        self._args: List = []
+        self.length = 0
+        self._crcs: Dict[int, int] = {}
+        self._layout()
+        digest = hashlib.sha1(self.extension.encode())
+        for entry in entries:
+            digest.update(f"{entry.arcname}\0{entry.size}\0{entry.mtime}\0".encode('utf-8', 'surrogateescape'))
+        # 强ETag（用于 If-Range）：文件列表、大小和修改时间不变时归档的每个字节都不变
+        self.etag = f"{self.extension}-{digest.hexdigest()[:20]}"
+
+    def _layout(self):
+        raise NotImplementedError
+
+    def _add(self, kind: int, length: int, arg):
+        if length <= 0:
+            return
+        self._offsets.append(self.length)
+        self._lengths.append(length)
+        self._kinds.append(kind)
+        self._args.append(arg)
+        self.length += length
+
+    def _add_bytes(self, data: bytes):
+        self._add(SEGMENT_BYTES, len(data), data)
+
+    def _add_record(self, length: int, arg):
+        """内容依赖CRC、发送时才生成的记录"""
+        self._add(SEGMENT_RECORD, length, arg)
+
+    def _add_file(self, index: int):
+        self._add(SEGMENT_FILE, self.entries[index].size, index)
+
+    def _build_record(self, arg) -> bytes:
+        raise NotImplementedError
+
+    def _read_file(self, index: int, start: int, end: int) -> Iterator[bytes]:
+        """
+        发送文件内容的 [start, end) 部分；从头发送到结尾时顺便计算CRC。
+        文件在生成布局后变短或被删除时用0补齐，保证归档长度不变
+        """
+        entry = self.entries[index]
+        full = start == 0 and end == entry.size
+        crc = 0
+        remaining = end - start
+        try:
+            with open(entry.path, 'rb') as f:
+                f.seek(start)
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    if full:
+                        crc = zlib.crc32(chunk, crc)
+                    yield chunk
+        except OSError as e:
+            logger.warning("导出时读取文件失败，用0补齐: %s %s", entry.path, e)
+        if remaining > 0:
+            logger.warning("导出时文件已变短，用0补齐: %s", entry.path)
+            padding = bytes(min(CHUNK_SIZE, remaining))
+            while remaining > 0:
+                chunk = padding[:remaining]
+                remaining -= len(chunk)
+                if full:
+                    crc = zlib.crc32(chunk, crc)
+                yield chunk
+        if full:
+            self._crcs[index] = crc
+
+    def _crc(self, index: int) -> int:
+        """文件的CRC32（断点续传时之前的文件没有经过本次请求，重新读取计算）"""
+        if index not in self._crcs:
+            for _ in self._read_file(index, 0, self.entries[index].size):
+                pass
+        return self._crcs[index]
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        生成归档的 [start, end) 字节区间
+
+        Args:
+            start: 起始偏移
+            end: 结束偏移（不含），默认到结尾
+
+        Yields:
+            字节块
+        """
+        end = self.length if end is None else min(end, self.length)
+        if start >= end:
+            return
+        index = bisect.bisect_right(self._offsets, start) - 1
+        while index < len(self._offsets) and self._offsets[index] < end:
+            offset = self._offsets[index]
+            segment_start = max(0, start - offset)
+            segment_end = min(self._lengths[index], end - offset)
+            kind, arg = self._kinds[index], self._args[index]
+            if kind == SEGMENT_FILE:
+                yield from self._read_file(arg, segment_start, segment_end)
+            else:
+                data = arg if kind == SEGMENT_BYTES else self._build_record(arg)
+                assert len(data) == self._lengths[index], "归档记录长度与布局不一致"
+                yield data[segment_start:segment_end]
+            index += 1
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    """ZIP使用的DOS日期和时间（最早1980年）"""
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return (1 << 5) | 1, 0
+    date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    clock = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return date, clock
+
+
+class ZipArchive(StreamingArchive):
+    """存储模式的ZIP（条目或偏移超过4GB、条目超过65535个时使用ZIP64）"""
+
+    content_type = 'application/zip'
+    extension = 'zip'
+
+    def _layout(self):
+        central = []
+        for index, entry in enumerate(self.entries):
+            name = entry.arcname.encode('utf-8')
+            offset = self.length
+            zip64 = entry.size >= _ZIP32_LIMIT or offset >= _ZIP32_LIMIT
+            date, clock = _dos_datetime(entry.mtime)
+            version = 45 if zip64 else 20
+            # 存储模式的大小已知，直接写在本地文件头中（部分解压工具不支持存储模式只靠数据描述符）
+            if zip64:
+                extra = struct.pack('<2H2Q', 0x0001, 16, entry.size, entry.size)
+                size_field = _ZIP32_LIMIT
+            else:
+                extra = b''
+                size_field = entry.size
+            self._add_bytes(struct.pack(
+                '<4s2B4HL2L2H', b'PK\x03\x04', version, 0, _ZIP_FLAGS, 0, clock, date,
+                0, size_field, size_field, len(name), len(extra)
+            ) + name + extra)
+            self._add_file(index)
+            self._add_record(24 if zip64 else 16, (False, index, zip64))
+            central.append((True, index, name, offset, zip64, date, clock))
+
+        central_offset = self.length
+        for record in central:
+            self._add_record(46 + len(record[2]) + (28 if record[4] else 0), record)
+        central_size = self.length - central_offset
+
+        count = len(self.entries)
+        end_record = b''
+        if count >= _ZIP_COUNT_LIMIT or central_offset >= _ZIP32_LIMIT or central_size >= _ZIP32_LIMIT:
+            zip64_end_offset = self.length
+            end_record += struct.pack('<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0,
+                                      count, count, central_size, central_offset)
+            end_record += struct.pack('<4sLQL', b'PK\x06\x07', 0, zip64_end_offset, 1)
+        end_record += struct.pack(
+            '<4s4H2LH', b'PK\x05\x06', 0, 0, min(count, _ZIP_COUNT_LIMIT), min(count, _ZIP_COUNT_LIMIT),
+            min(central_size, _ZIP32_LIMIT), min(central_offset, _ZIP32_LIMIT), 0
+        )
+        self._add_bytes(end_record)
+
+    def _build_record(self, arg) -> bytes:
+        # (False, 序号, zip64) 为数据描述符，(True, 序号, ...) 为中央目录记录
+        return self._central_record(*arg[1:]) if arg[0] else self._descriptor(*arg[1:])
+
+    def _descriptor(self, index: int, zip64: bool) -> bytes:
+        size = self.entries[index].size
+        if zip64:
+            return struct.pack('<4sL2Q', b'PK\x07\x08', self._crc(index), size, size)
+        return struct.pack('<4s3L', b'PK\x07\x08', self._crc(index), size, size)
+
+    def _central_record(self, index: int, name: bytes, offset: int, zip64: bool, date: int, clock: int) -> bytes:
+        size = self.entries[index].size
+        version = 45 if zip64 else 20
+        if zip64:
+            extra = struct.pack('<2H3Q', 0x0001, 24, size, size, offset)
+            size_field = offset_field = _ZIP32_LIMIT
+        else:
+            extra = b''
+            size_field, offset_field = size, offset
+        return struct.pack(
+            '<4s4B4HL2L5H2L', b'PK\x01\x02', version, 3, version, 0, _ZIP_FLAGS, 0, clock, date,
+            self._crc(index), size_field, size_field, len(name), len(extra), 0, 0, 0,
+            0o100644 << 16, offset_field
+        ) + name + extra
+
+
+# ustar 文件头模板（普通文件、权限0644，校验和字段先填空格）
+_USTAR_TEMPLATE = tarfile.TarInfo('').tobuf(tarfile.USTAR_FORMAT)
+_USTAR_TEMPLATE = _USTAR_TEMPLATE[:148] + b' ' * 8 + _USTAR_TEMPLATE[156:]
+
+
+class TarArchive(StreamingArchive):
+    """POSIX pax 格式的tar（长文件名和非ASCII文件名写在pax扩展头中）"""
+
+    content_type = 'application/x-tar'
+    extension = 'tar'
+
+    def _layout(self):
+        for index, entry in enumerate(self.entries):
+            self._add_bytes(self._header(entry))
+            self._add_file(index)
+            padding = -entry.size % _TAR_BLOCK
+            if padding:
+                self._add_bytes(bytes(padding))
+        # 归档结尾：两个全0块
+        self._add_bytes(bytes(2 * _TAR_BLOCK))
+
+    @staticmethod
+    def _header(entry: ArchiveEntry) -> bytes:
+        name = entry.arcname.encode('utf-8', 'surrogateescape')
+        if len(name) > 100 or not name.isascii() or entry.size >= 8 ** 11:
+            info = tarfile.TarInfo(entry.arcname)
+            info.size = entry.size
+            info.mtime = int(entry.mtime)
+            info.mode = 0o644
+            return info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+        # 常见情况（短ASCII文件名）直接拼ustar头，与 tarfile 生成的相同，比 TarInfo.tobuf 快一个数量级
+        header = bytearray(_USTAR_TEMPLATE)
+        header[0:len(name)] = name
+        header[124:136] = b'%011o\0' % entry.size
+        header[136:148] = b'%011o\0' % int(entry.mtime)
+        header[148:155] = b'%06o\0' % sum(header)
+        return bytes(header)
+
+
+ARCHIVE_FORMATS = {
+    ZipArchive.extension: ZipArchive,
+    TarArchive.extension: TarArchive
+}
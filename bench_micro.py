@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 热点函数微基准测试
+用合成语料（真实形态的抖音CDN地址、杂乱的分享文本）测量链接提取、
+URL清理、图片过滤和URL处理函数的吞吐（ops/sec）和内存分配
+
+用法:
+    python bench_micro.py --sizes 1000,10000,100000
+    python bench_micro.py --sizes 1000000 --functions filter_douyin_images --output micro.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+CDN_HOSTS = [
+    'p3-sign.douyinpic.com', 'p9-sign.douyinpic.com', 'p26-sign.douyinpic.com',
+    'p3-pc-sign.douyinpic.com', 'p11.douyinpic.com', 'p6-pc.douyinpic.com',
+    'p3-pc.douyinpic.com', 'sf3-cdn-tos.douyinstatic.com', 'p1-dy.byteimg.com'
+]
+TEMPLATES = ['tplv-dy-aweme-images:q75.webp', 'tplv-dy-360p.jpeg', 'tplv-dy-cropcenter:323:430.jpeg',
+             'c5_300_300.jpeg', 'tplv-dy-resize-origshort-autoq-75:330.jpeg']
+UI_PATHS = ['/obj/douyin-web/favicon.ico', '/static/sprite.png', '/img/logo@2x.png',
+            '/goofy/ies/douyin_web/media/icon_search.svg']
+SHARE_PREFIXES = ['7.94 复制打开抖音，看看', '2.30 Ljq:/ 复制此链接，打开Dou音搜索，直接观看视频！',
+                  '长按复制此条消息，打开抖音搜索，查看TA的更多作品。', '0.53 03/26 kcN:/ ']
+
+
+def _hex(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice('0123456789abcdef') for _ in range(length))
+
+
+def _token(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+
+def make_image_urls(n: int, rng: random.Random) -> List[str]:
+    """生成抖音CDN图片URL（含签名参数、协议相对地址、相对路径和UI图标）"""
+    urls = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.08:
+            urls.append(f"https://{rng.choice(CDN_HOSTS)}{rng.choice(UI_PATHS)}")
+            continue
+        if roll < 0.1:
+            urls.append('data:image/png;base64,' + _token(rng, 40))
+            continue
+        path = f"/tos-cn-i-{rng.choice(['0813', 'dy', '0813c001'])}/{_hex(rng, 32)}~{rng.choice(TEMPLATES)}"
+        query = (f"x-expires={rng.randint(1700000000, 1800000000)}&x-signature={_token(rng, 28)}%3D"
+                 f"&from={rng.randint(100000000, 999999999)}&s=PackSourceEnum_AWEME_DETAIL&se=false"
+                 f"&sc=cover&biz_tag=aweme_images&l={_hex(rng, 26)}")
+        host = rng.choice(CDN_HOSTS)
+        if roll < 0.15:
+            urls.append(f"//{host}{path}?{query}")
+        elif roll < 0.18:
+            urls.append(f"{path}?{query}")
+        else:
+            urls.append(f"https://{host}{path}?{query}")
+    return urls
+
+
+def make_share_texts(n: int, rng: random.Random) -> List[str]:
+    """生成杂乱的分享文本（前后缀噪声、引号、反引号、换行、用户主页链接）"""
+    texts = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.5:
+            url = f"https://v.douyin.com/{_token(rng, 8)}/"
+        elif roll < 0.8:
+            url = f"https://www.douyin.com/user/MS4wLjABAAAA{_token(rng, 43)}?from_tab_name=main&vid={rng.randint(10**18, 10**19)}"
+        elif roll < 0.9:
+            url = f"www.douyin.com/video/{rng.randint(10**18, 10**19)}"
+        else:
+            url = f"https://www.iesdouyin.com/share/user/{rng.randint(10**10, 10**11)}?sec_uid={_token(rng, 20)}"
+        quote = rng.choice(['', '`', '"', "'", ''])
+        texts.append(f"{rng.choice(SHARE_PREFIXES)}【{_token(rng, 6)}的作品】 {quote}{url}{quote} "
+                     f"{_token(rng, 4)}@{_token(rng, 3)}.{_token(rng, 2)} {rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}")
+    return texts
+
+
+def make_image_dicts(urls: List[str], rng: random.Random) -> List[Dict]:
+    """生成Crawl4AI格式的图片字典"""
+    images = []
+    for url in urls:
+        images.append({
+            'src': url,
+            'alt': rng.choice(['', '', 'cover', '用户头像', f'{_token(rng, 5)}的作品封面']),
+            'width': rng.choice([None, 0, 24, 48, 120, 300, 540, 1080]),
+            'height': rng.choice([None, 0, 24, 48, 160, 400, 720, 1440]),
+            'score': rng.choice([0, 0.05, 0.3, 1, 3, 5])
+        })
+    return images
+
+
+def make_elements(urls: List[str], rng: random.Random) -> List:
+    """生成Selenium图片元素的属性快照"""
+    from replay import FixtureElement
+
+    return [FixtureElement({
+        'src': url,
+        'width': rng.choice([None, '', '32', '120', '300', 'auto']),
+        'height': rng.choice([None, '', '32', '160', '400'])
+    }) for url in urls]
+
+
+def measure(fn: Callable[[], int], repeat: int, trace_fn: Optional[Callable[[], int]] = None) -> Dict:
+    """
+    测量函数吞吐和内存分配
+
+    Args:
+        fn: 执行一轮并返回操作数的函数
+        repeat: 重复次数，取最快一轮
+        trace_fn: 用于tracemalloc统计的（较小）一轮
+
+    Returns:
+        测量结果
+    """
+    best = None
+    ops = 0
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        ops = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    trace_fn = trace_fn or fn
+    gc.collect()
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    traced_ops = trace_fn()
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = snapshot_after.compare_to(snapshot_before, 'filename')
+    allocated_blocks = sum(max(0, stat.count_diff) for stat in stats)
+
+    return {
+        'ops': ops,
+        'seconds': round(best, 6),
+        'ops_per_second': round(ops / best, 1) if best else None,
+        'traced_ops': traced_ops,
+        'peak_traced_bytes': peak,
+        'peak_bytes_per_op': round(peak / traced_ops, 1) if traced_ops else None,
+        'retained_blocks': allocated_blocks
+    }
+
+
+def build_benchmarks(crawler, size: int, rng: random.Random, work_dir: Path, trace_limit: int) -> Dict[str, Callable]:
+    """构建各函数的基准测试闭包"""
+    from linkrush import extract_links_from_file
+
+    image_urls = make_image_urls(size, rng)
+    share_texts = make_share_texts(size, rng)
+    image_dicts = make_image_dicts(image_urls, rng)
+    elements = make_elements(image_urls, rng)
+    base_url = 'https://www.douyin.com/user/MS4wLjABAAAA'
+
+    links_file = work_dir / f'links_{size}.txt'
+    links_file.write_text('\n'.join(share_texts), encoding='utf-8')
+    small_links_file = work_dir / f'links_{size}_trace.txt'
+    small_links_file.write_text('\n'.join(share_texts[:trace_limit]), encoding='utf-8')
+
+    def over(items, call):
+        def run(limit=None):
+            count = 0
+            for item in items[:limit] if limit else items:
+                try:
+                    call(item)
+                except ValueError:
+                    pass
+                count += 1
+            return count
+        return run
+
+    validate = over(share_texts, crawler._validate_and_clean_url)
+    extract = over(share_texts, crawler._extract_valid_url_from_text)
+    process = over(image_urls, lambda url: crawler._process_douyin_image_url(url, base_url))
+    pairs = list(zip(image_urls, elements))
+    is_valid = over(pairs, lambda pair: crawler._is_valid_douyin_image(pair[0], pair[1]))
+
+    def extract_links(path: Path, count: int) -> Callable[[], int]:
+        def run():
+            extract_links_from_file(str(path))
+            return count
+        return run
+
+    def filter_images(limit=None) -> int:
+        batch = image_dicts[:limit] if limit else image_dicts
+        crawler._filter_douyin_images(batch)
+        return len(batch)
+
+    return {
+        'extract_links_from_file': (extract_links(links_file, len(share_texts)),
+                                    extract_links(small_links_file, min(trace_limit, len(share_texts)))),
+        'validate_and_clean_url': (validate, lambda: validate(trace_limit)),
+        'extract_valid_url_from_text': (extract, lambda: extract(trace_limit)),
+        'filter_douyin_images': (filter_images, lambda: filter_images(trace_limit)),
+        'is_valid_douyin_image': (is_valid, lambda: is_valid(trace_limit)),
+        'process_douyin_image_url': (process, lambda: process(trace_limit))
+    }
+
+
+def git_revision() -> Optional[str]:
+    """当前代码版本"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抖音图片爬虫 - 热点函数微基准测试')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='语料规模，逗号分隔（最大1000000）')
+    parser.add_argument('--functions', default=None, help='只运行指定函数，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数（取最快一轮）')
+    parser.add_argument('--trace-limit', type=int, default=10000, help='内存分配统计使用的样本数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', default=None, help='结果JSON输出文件，默认打印到stdout')
+    args = parser.parse_args()
+
+    sizes = [int(float(size)) for size in args.sizes.split(',') if size.strip()]
+    selected = set(args.functions.split(',')) if args.functions else None
+    work_dir = Path(tempfile.mkdtemp(prefix='douyin_micro_'))
+
+    # 被测函数会打印大量日志，测量期间丢弃stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        from douyin_image_crawler import DouyinImageCrawler
+        crawler = DouyinImageCrawler(download_dir=str(work_dir / 'images'), catalog_path=None)
+
+    results: Dict[str, Dict] = {}
+    try:
+        for size in sizes:
+            benchmarks = build_benchmarks(crawler, size, random.Random(args.seed), work_dir, args.trace_limit)
+            for name, (fn, trace_fn) in benchmarks.items():
+                if selected and name not in selected:
+                    continue
+                sink = open(os.devnull, 'w')
+                try:
+                    with contextlib.redirect_stdout(sink):
+                        results.setdefault(name, {})[str(size)] = measure(fn, args.repeat, trace_fn)
+                finally:
+                    sink.close()
+                print(f"{name:<30} n={size:<8} {results[name][str(size)]['ops_per_second']} ops/s",
+                      file=sys.stderr)
+    finally:
+        crawler.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'micro',
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'sizes': sizes, 'repeat': args.repeat, 'trace_limit': args.trace_limit, 'seed': args.seed},
+        'results': results
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 端到端基准测试
+在本地替身页面/CDN服务上运行完整爬取流程，输出机器可读的JSON结果，
+用于在不同版本之间比较吞吐、单张图片延迟、峰值内存和浏览器启动开销
+
+用法:
+    python bench_pipeline.py --pages 4 --images-per-page 30 --latency 0.05 --image-size lognormal:11:0.6
+    python bench_pipeline.py --scenarios download_only,run_crawl_task --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from standin_server import StandInServer
+
+SCENARIOS = ('selenium', 'crawl4ai', 'download_only', 'run_crawl_task')
+
+
+def parse_size_distribution(spec: str, seed: int = 0) -> Callable[[], int]:
+    """
+    解析图片大小分布
+
+    Args:
+        spec: fixed:字节数 / uniform:最小:最大 / lognormal:mu:sigma
+        seed: 随机种子
+
+    Returns:
+        生成图片大小的函数
+    """
+    rng = random.Random(seed)
+    kind, *params = spec.split(':')
+    values = [float(param) for param in params]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: int(values[0])
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: int(rng.uniform(values[0], values[1]))
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda: max(1024, int(rng.lognormvariate(values[0], values[1])))
+    raise ValueError(f"无效的图片大小分布: {spec}")
+
+
+class SyntheticSite:
+    """合成的抖音主页和CDN图片"""
+
+    def __init__(self, pages: int, images_per_page: int, size_fn: Callable[[], int], seed: int = 0):
+        self.pages = pages
+        self.images_per_page = images_per_page
+        self.image_sizes: Dict[str, int] = {}
+        self.base_url = ''
+        rng = random.Random(seed)
+        for page in range(pages):
+            for index in range(images_per_page):
+                self.image_sizes[self.image_path(page, index)] = size_fn()
+        # 所有图片共享一段随机内容，按需截取，避免生成大量内存
+        max_size = max(self.image_sizes.values()) if self.image_sizes else 0
+        self._payload = b'\xff\xd8\xff\xe0' + bytes(rng.getrandbits(8) for _ in range(min(max_size, 1 << 16)))
+
+    @staticmethod
+    def image_path(page: int, index: int) -> str:
+        # 路径中包含 douyinpic.com 和 cover，能通过爬虫的图片过滤规则
+        return f"/douyinpic.com/obj/cover_{page}_{index}.jpeg"
+
+    def page_url(self, page: int) -> str:
+        return f"{self.base_url}/user/{page}"
+
+    def page_html(self, page: int) -> bytes:
+        tags = ''.join(
+            f'<img src="{self.base_url}{self.image_path(page, index)}" width="300" height="400" alt="cover {index}">'
+            for index in range(self.images_per_page)
+        )
+        return f'<!DOCTYPE html><html><body><div>{tags}</div></body></html>'.encode('utf-8')
+
+    def image_body(self, path: str) -> bytes:
+        size = self.image_sizes[path]
+        repeats = size // len(self._payload) + 1
+        return (self._payload * repeats)[:size]
+
+    def resolve(self, path: str, query: Dict):
+        if path.startswith('/user/'):
+            try:
+                page = int(path.rsplit('/', 1)[1])
+            except ValueError:
+                return None
+            if page >= self.pages:
+                return None
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, self.page_html(page)
+        if path in self.image_sizes:
+            return 200, {'Content-Type': 'image/jpeg'}, self.image_body(path)
+        return None
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """计算百分位数（线性插值）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def peak_rss_bytes() -> Dict[str, Optional[int]]:
+    """当前进程及已回收子进程（浏览器）的峰值RSS"""
+    try:
+        import resource
+        # Linux单位为KB，macOS为字节
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return {
+            'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        }
+    except ImportError:
+        try:
+            import psutil
+            return {'self': psutil.Process().memory_info().peak_wset, 'children': None}
+        except (ImportError, AttributeError):
+            return {'self': None, 'children': None}
+
+
+def instrument_downloads(crawler, latencies: List[float]):
+    """包装下载方法，记录每张图片的耗时"""
+    original = crawler._download_douyin_image
+
+    async def timed_download(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await original(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    crawler._download_douyin_image = timed_download
+
+
+async def measure_browser_launch(method: str, repeats: int) -> List[float]:
+    """测量浏览器启动+关闭的耗时"""
+    from douyin_image_crawler import DouyinImageCrawler
+
+    crawler = DouyinImageCrawler(download_dir=tempfile.mkdtemp(prefix='douyin_bench_'), catalog_path=None)
+    durations = []
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            if method == 'selenium':
+                driver = crawler._create_chrome_driver(crawler._build_chrome_options())
+                driver.quit()
+            else:
+                from crawl4ai import AsyncWebCrawler, BrowserConfig
+                browser = AsyncWebCrawler(config=BrowserConfig(headless=True, verbose=False))
+                await browser.start()
+                await browser.close()
+            durations.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(crawler.download_dir, ignore_errors=True)
+        crawler.close()
+    return durations
+
+
+def build_fixture(site: SyntheticSite, fixture_dir: str):
+    """把合成站点写成fixture，供download_only场景重放"""
+    from replay import FixtureRecorder
+
+    recorder = FixtureRecorder(fixture_dir, {'max_images': site.images_per_page})
+    for page in range(site.pages):
+        images = []
+        for index in range(site.images_per_page):
+            path = site.image_path(page, index)
+            url = f"https://p3{path}"
+            recorder.record_response(url, 200, {'Content-Type': 'image/jpeg'}, site.image_body(path))
+            images.append({'src': url, 'width': 300, 'height': 400, 'alt': f'cover {index}'})
+        recorder.record_page(f"https://www.douyin.com/user/{page}", 'user', images)
+    recorder.save()
+
+
+async def run_scenario(name: str, config: Dict) -> Dict:
+    """在当前进程中运行一个场景"""
+    from douyin_image_crawler import DouyinImageCrawler
+
+    site = SyntheticSite(config['pages'], config['images_per_page'],
+                         parse_size_distribution(config['image_size'], config['seed']), config['seed'])
+    work_dir = tempfile.mkdtemp(prefix='douyin_bench_')
+    latencies: List[float] = []
+    result: Dict = {'scenario': name}
+
+    def latency_fn(path: str) -> float:
+        return config['page_latency'] if path.startswith('/user/') else config['latency']
+
+    server = StandInServer(site.resolve, latency_fn=latency_fn, bandwidth=config['bandwidth']).start()
+    site.base_url = server.base_url
+    page_urls = [site.page_url(page) for page in range(site.pages)]
+
+    try:
+        if name in ('selenium', 'crawl4ai') and config['launch_repeats'] > 0:
+            try:
+                launches = await measure_browser_launch(name, config['launch_repeats'])
+                result['browser_launch_seconds'] = {
+                    'runs': [round(value, 4) for value in launches],
+                    'p50': percentile(launches, 50)
+                }
+            except Exception as e:
+                result['browser_launch_seconds'] = {'error': f"{type(e).__name__}: {str(e)[:500]}"}
+
+        start = time.perf_counter()
+        downloaded = failed = 0
+
+        if name == 'run_crawl_task':
+            import app as web_app
+            from linkrush import extract_links_from_file
+
+            links_file = Path(work_dir) / 'links.txt'
+            links_file.write_text('\n'.join(page_urls), encoding='utf-8')
+            urls = extract_links_from_file(str(links_file))
+
+            base_crawler = web_app.DouyinImageCrawler
+
+            class BenchCrawler(base_crawler):
+                def __init__(self, *args, **kwargs):
+                    super().__init__(*args, **kwargs)
+                    instrument_downloads(self, latencies)
+
+            web_app.DouyinImageCrawler = BenchCrawler
+            web_app.app.config['CATALOG_PATH'] = str(Path(work_dir) / 'catalog.db')
+            try:
+                web_app.crawl_status['running'] = True
+                # run_crawl_task 会自建事件循环，需在独立线程中运行
+                await asyncio.get_running_loop().run_in_executor(
+                    None, web_app.run_crawl_task, urls, str(Path(work_dir) / 'images'),
+                    config['max_images'], config['use_selenium'], False, {'enable_delays': False}
+                )
+            finally:
+                web_app.DouyinImageCrawler = base_crawler
+            totals = web_app.crawl_status.get('results') or {}
+            downloaded = totals.get('downloaded_images', 0)
+            failed = totals.get('failed_downloads', 0)
+            result['error'] = web_app.crawl_status.get('error')
+        else:
+            crawler = DouyinImageCrawler(download_dir=str(Path(work_dir) / 'images'), catalog_path=None,
+                                         enable_delays=False)
+            if name == 'download_only':
+                from replay import FixturePlayer
+
+                fixture_dir = str(Path(work_dir) / 'fixture')
+                build_fixture(site, fixture_dir)
+                player = FixturePlayer(fixture_dir)
+                player.base_url = server.base_url
+                # 替身服务同时提供fixture响应
+                server.resolver = lambda path, query: player.resolve(path, query) or site.resolve(path, query)
+                crawler.fixture_player = player
+                page_urls = [page['url'] for page in player.pages]
+            instrument_downloads(crawler, latencies)
+            try:
+                for url in page_urls:
+                    page_result = await crawler.crawl_douyin_user_images(
+                        user_url=url, max_images=config['max_images'], save_metadata=False,
+                        use_selenium=name == 'selenium'
+                    )
+                    downloaded += page_result['downloaded_images']
+                    failed += page_result['failed_downloads']
+            finally:
+                crawler.close()
+
+        elapsed = time.perf_counter() - start
+        result.update({
+            'seconds': round(elapsed, 4),
+            'pages': len(page_urls),
+            'downloaded_images': downloaded,
+            'failed_downloads': failed,
+            'images_per_second': round(downloaded / elapsed, 3) if elapsed > 0 else None,
+            'image_latency_seconds': {
+                'count': len(latencies),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'max': max(latencies) if latencies else None
+            },
+            'server_requests': server.requests
+        })
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result['peak_rss_bytes'] = peak_rss_bytes()
+    return result
+
+
+def run_in_subprocess(name: str, config: Dict, timeout: float) -> Dict:
+    """在独立子进程中运行场景，使峰值内存互不影响"""
+    command = [sys.executable, os.path.abspath(__file__), '--run-scenario', name,
+               '--config-json', json.dumps(config)]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    except subprocess.TimeoutExpired:
+        return {'scenario': name, 'error': f'超时（{timeout}秒）'}
+
+    # 爬虫会向stdout输出日志，结果JSON在最后一行
+    for line in reversed(completed.stdout.strip().splitlines()):
+        if line.startswith('{'):
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                break
+    return {'scenario': name, 'error': (completed.stderr or completed.stdout)[-2000:],
+            'returncode': completed.returncode}
+
+
+def git_revision() -> Optional[str]:
+    """当前代码版本"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抖音图片爬虫 - 端到端基准测试')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"逗号分隔: {', '.join(SCENARIOS)}")
+    parser.add_argument('--pages', type=int, default=3, help='主页数量（链接文件中的URL数）')
+    parser.add_argument('--images-per-page', type=int, default=30, help='每个主页的图片数')
+    parser.add_argument('--max-images', type=int, default=20, help='每个主页最大下载数')
+    parser.add_argument('--image-size', default='lognormal:11.5:0.7',
+                        help='图片大小分布: fixed:N / uniform:MIN:MAX / lognormal:MU:SIGMA')
+    parser.add_argument('--latency', type=float, default=0.02, help='图片请求延迟（秒）')
+    parser.add_argument('--page-latency', type=float, default=0.2, help='页面请求延迟（秒）')
+    parser.add_argument('--bandwidth', type=float, default=None, help='每连接带宽（字节/秒）')
+    parser.add_argument('--launch-repeats', type=int, default=3, help='浏览器启动测量次数')
+    parser.add_argument('--use-selenium', action='store_true', help='run_crawl_task场景使用Selenium')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--timeout', type=float, default=900, help='单个场景超时（秒）')
+    parser.add_argument('--output', default=None, help='结果JSON输出文件，默认打印到stdout')
+    parser.add_argument('--run-scenario', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--config-json', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = asyncio.run(run_scenario(args.run_scenario, json.loads(args.config_json)))
+        sys.stdout.write('\n' + json.dumps(result, ensure_ascii=False) + '\n')
+        return
+
+    config = {
+        'pages': args.pages,
+        'images_per_page': args.images_per_page,
+        'max_images': args.max_images,
+        'image_size': args.image_size,
+        'latency': args.latency,
+        'page_latency': args.page_latency,
+        'bandwidth': args.bandwidth,
+        'launch_repeats': args.launch_repeats,
+        'use_selenium': args.use_selenium,
+        'seed': args.seed
+    }
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    report = {
+        'benchmark': 'pipeline',
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'scenarios': {name: run_in_subprocess(name, config, args.timeout) for name in scenarios}
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 启动耗时基准测试
+在全新子进程中测量导入 app / douyin_image_crawler 以及Web应用响应第一个请求的耗时，
+并检查启动阶段是否误导入了 Crawl4AI / Selenium / Playwright 等重量级依赖
+
+用法:
+    python bench_startup.py --repeat 5
+    python bench_startup.py --check --max-seconds 1.0 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from bench_micro import git_revision
+
+# 启动阶段不应导入的模块（首次使用对应爬取方法时才导入）
+HEAVY_MODULES = ('crawl4ai', 'selenium', 'playwright')
+
+# 场景名 -> 子进程中执行的代码（输出JSON：耗时和已导入的重量级模块）
+SCENARIOS = {
+    'import_crawler': "import douyin_image_crawler",
+    'import_app': "import app",
+    'first_request': "import app\nresponse = app.app.test_client().get('/metrics')\nassert response.status_code == 200",
+}
+
+_RUNNER = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{'seconds': elapsed, 'heavy_modules': heavy}}))
+"""
+
+
+def run_once(code: str, importtime: bool = False) -> Dict:
+    """
+    在全新解释器中执行一次场景
+
+    Args:
+        code: 场景代码
+        importtime: 是否附带 -X importtime，统计最慢的导入
+
+    Returns:
+        {'seconds', 'process_seconds', 'heavy_modules'[, 'slowest_imports']}
+    """
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', _RUNNER.format(code=code, heavy=HEAVY_MODULES)]
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    process_seconds = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"子进程失败: {proc.stderr.strip()[-500:]}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process_seconds'] = process_seconds
+    if importtime:
+        result['slowest_imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def parse_importtime(stderr: str, limit: int = 10) -> List[Dict]:
+    """
+    解析 -X importtime 输出，返回累计耗时最长的顶层导入及其直接依赖
+
+    Args:
+        stderr: 子进程stderr
+        limit: 返回条数
+
+    Returns:
+        [{'module', 'depth', 'cumulative_ms'}, ...]
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # 格式: "import time: <自身us> | <累计us> | <缩进的模块名>"
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        # 缩进每两个空格表示一层嵌套；只保留顶层及其直接依赖，便于定位是谁拖慢了启动
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue
+        entries.append({'module': name.strip(), 'depth': depth,
+                        'cumulative_ms': round(int(cumulative_us) / 1000, 1)})
+    entries.sort(key=lambda entry: entry['cumulative_ms'], reverse=True)
+    return entries[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抖音图片爬虫 - 启动耗时基准测试')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='要运行的场景，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=5, help='每个场景的运行次数（取中位数）')
+    parser.add_argument('--check', action='store_true',
+                        help='启动阶段导入了重量级依赖或超出 --max-seconds 时以非零状态退出')
+    parser.add_argument('--max-seconds', type=float, default=None, help='--check 时允许的最长中位耗时')
+    parser.add_argument('--output', default=None, help='结果JSON输出文件，默认打印到stdout')
+    args = parser.parse_args()
+
+    selected = [name for name in args.scenarios.split(',') if name.strip()]
+    results: Dict[str, Dict] = {}
+    failures = []
+    for name in selected:
+        if name not in SCENARIOS:
+            parser.error(f"未知场景: {name}")
+        runs = [run_once(SCENARIOS[name]) for _ in range(args.repeat)]
+        profile = run_once(SCENARIOS[name], importtime=True)
+        seconds = [run['seconds'] for run in runs]
+        results[name] = {
+            'median_seconds': round(statistics.median(seconds), 4),
+            'min_seconds': round(min(seconds), 4),
+            'max_seconds': round(max(seconds), 4),
+            'median_process_seconds': round(statistics.median(run['process_seconds'] for run in runs), 4),
+            'heavy_modules': profile['heavy_modules'],
+            'slowest_imports': profile['slowest_imports']
+        }
+        print(f"{name:<16} median={results[name]['median_seconds']:.3f}s "
+              f"heavy={','.join(profile['heavy_modules']) or '-'}", file=sys.stderr)
+
+        if profile['heavy_modules']:
+            failures.append(f"{name}: 启动时导入了 {', '.join(profile['heavy_modules'])}")
+        if args.max_seconds is not None and results[name]['median_seconds'] > args.max_seconds:
+            failures.append(f"{name}: 中位耗时 {results[name]['median_seconds']}s 超过 {args.max_seconds}s")
+
+    report = {
+        'benchmark': 'startup',
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'scenarios': selected, 'repeat': args.repeat, 'max_seconds': args.max_seconds},
+        'results': results,
+        'failures': failures
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+    else:
+        print(output)
+
+    if args.check and failures:
+        for failure in failures:
+            print(f"❌ {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 浏览器会话交接
+把加载页面的浏览器（Selenium / Crawl4AI）的Cookie和User-Agent导出到该页面专用的下载连接池，
+使图片请求与浏览器请求一致，需要Cookie或签名的CDN地址无需反复重试
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from crawl_logging import get_logger
+
+logger = get_logger('session')
+
+# 写入requests Cookie的字段（浏览器导出的其余字段如 sameSite / expiry 不需要）
+_COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure')
+
+
+class BrowserSession:
+    """一个页面的浏览器会话快照（Cookie和User-Agent）"""
+
+    def __init__(self, page_url: str, user_agent: Optional[str] = None,
+                 cookies: Optional[List[Dict]] = None, backend: Optional[str] = None):
+        """
+        Args:
+            page_url: 页面URL（下载时按此查找会话）
+            user_agent: 浏览器实际使用的User-Agent
+            cookies: Cookie列表 [{'name', 'value', 'domain', 'path', 'secure'}, ...]
+            backend: 导出会话的后端（selenium / crawl4ai）
+        """
+        self.page_url = page_url
+        self.user_agent = user_agent
+        self.cookies = [{key: cookie[key] for key in _COOKIE_FIELDS if key in cookie} for cookie in cookies or []]
+        self.backend = backend
+        self.captured_at = time.time()
+
+    @classmethod
+    def from_selenium(cls, driver, page_url: str) -> 'BrowserSession':
+        """
+        从Selenium WebDriver导出会话
+
+        Args:
+            driver: WebDriver
+            page_url: 页面URL
+
+        Returns:
+            浏览器会话
+        """
+        user_agent = driver.execute_script("return navigator.userAgent")
+        return cls(page_url, user_agent=user_agent, cookies=driver.get_cookies(), backend='selenium')
+
+    @classmethod
+    async def from_playwright(cls, page, context, page_url: str) -> 'BrowserSession':
+        """
+        从Crawl4AI使用的Playwright页面导出会话
+
+        Args:
+            page: Playwright页面
+            context: 浏览器上下文
+            page_url: 页面URL
+
+        Returns:
+            浏览器会话
+        """
+        user_agent = await page.evaluate("() => navigator.userAgent")
+        cookies = await context.cookies()
+        return cls(page_url, user_agent=user_agent, cookies=cookies, backend='crawl4ai')
+
+    def headers(self) -> Dict[str, str]:
+        """
+        图片请求应使用的请求头
+
+        Returns:
+            User-Agent，以及与浏览器跨域加载图片时一致的Referer（页面源站）
+        """
+        parsed = urlparse(self.page_url)
+        headers = {}
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+        if parsed.scheme and parsed.netloc:
+            headers['Referer'] = f"{parsed.scheme}://{parsed.netloc}/"
+        return headers
+
+    def apply_to(self, http_session):
+        """
+        将Cookie写入requests会话（按域名和路径匹配发送，与浏览器一致）
+
+        Args:
+            http_session: requests.Session
+        """
+        for cookie in self.cookies:
+            http_session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/'),
+                secure=bool(cookie.get('secure', False))
+            )
+
+    def summary(self) -> Dict:
+        """会话摘要（不含Cookie值）"""
+        return {
+            'backend': self.backend,
+            'user_agent': self.user_agent,
+            'cookies': len(self.cookies),
+            'captured_at': self.captured_at
+        }
+
+
+class BrowserSessionPool:
+    """按页面保存浏览器会话，每个会话使用独立的下载连接池（线程安全，按LRU淘汰）"""
+
+    def __init__(self, session_factory: Callable, max_sessions: int = 8):
+        """
+        Args:
+            session_factory: 创建requests会话的函数
+            max_sessions: 最多同时保留的页面会话数，超出时关闭最久未使用的连接池
+        """
+        self.session_factory = session_factory
+        self.max_sessions = max(1, max_sessions)
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+
+    def put(self, browser_session: BrowserSession):
+        """
+        保存（或更新）页面的浏览器会话，Cookie写入该页面的连接池
+
+        Args:
+            browser_session: 浏览器会话
+        """
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(browser_session.page_url)
+            if entry is None:
+                entry = {'http_session': self.session_factory()}
+                self._entries[browser_session.page_url] = entry
+            entry['browser_session'] = browser_session
+            browser_session.apply_to(entry['http_session'])
+            self._entries.move_to_end(browser_session.page_url)
+            while len(self._entries) > self.max_sessions:
+                evicted.append(self._entries.popitem(last=False)[1]['http_session'])
+        for http_session in evicted:
+            http_session.close()
+        logger.debug("已导出浏览器会话: %s (%s 个Cookie)", browser_session.page_url, len(browser_session.cookies))
+
+    def get(self, page_url: str) -> Optional[BrowserSession]:
+        """页面的浏览器会话，没有时返回None"""
+        with self._lock:
+            entry = self._entries.get(page_url)
+            if entry is None:
+                return None
+            self._entries.move_to_end(page_url)
+            return entry['browser_session']
+
+    def http_session(self, page_url: str):
+        """页面专用的下载连接池（带浏览器Cookie），没有会话时返回None"""
+        with self._lock:
+            entry = self._entries.get(page_url)
+            return entry['http_session'] if entry else None
+
+    def close(self):
+        """关闭所有连接池"""
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), OrderedDict()
+        for entry in entries:
+            entry['http_session'].close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 协作式取消
+CancellationToken 在Web线程和爬取线程之间传递停止信号：
+可等待（替代 time.sleep / asyncio.sleep），可注册回调（关闭浏览器、取消协程），
+可派生子令牌（父令牌取消时子令牌一并取消）
+"""
+
+import asyncio
+import threading
+from typing import Callable, List, Optional
+
+from crawl_logging import get_logger
+
+logger = get_logger('cancellation')
+
+
+class CrawlCancelled(Exception):
+    """爬取任务已被取消"""
+
+
+class CancellationToken:
+    """取消令牌（线程安全）"""
+
+    def __init__(self, parent: Optional['CancellationToken'] = None):
+        """
+        Args:
+            parent: 父令牌，父令牌取消时本令牌随之取消
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+        if parent is not None:
+            parent.add_callback(lambda: self.cancel(parent.reason))
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已取消"""
+        return self._event.is_set()
+
+    def cancel(self, reason: Optional[str] = None):
+        """
+        取消（重复调用无效），依次执行已注册的回调
+
+        Args:
+            reason: 取消原因
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason or '已取消'
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        注册取消回调，已取消时立即执行
+
+        Args:
+            callback: 无参回调（在调用 cancel 的线程中执行）
+
+        Returns:
+            回调本身，可用于 remove_callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return callback
+        self._run_callback(callback)
+        return callback
+
+    def remove_callback(self, callback: Callable[[], None]):
+        """移除取消回调"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @staticmethod
+    def _run_callback(callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception as e:
+            logger.warning("执行取消回调出错: %s", e)
+
+    def child(self) -> 'CancellationToken':
+        """派生子令牌"""
+        return CancellationToken(parent=self)
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 CrawlCancelled"""
+        if self._event.is_set():
+            raise CrawlCancelled(self.reason)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        可中断的同步等待（替代 time.sleep）
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            等待期间是否被取消
+        """
+        return self._event.wait(timeout)
+
+    async def sleep(self, delay: float) -> bool:
+        """
+        可中断的异步等待（替代 asyncio.sleep）
+
+        Args:
+            delay: 等待时间（秒）
+
+        Returns:
+            等待期间是否被取消
+        """
+        if self._event.is_set():
+            return True
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+        self.add_callback(wake)
+        try:
+            await asyncio.wait_for(waiter, timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.remove_callback(wake)
+        return self._event.is_set()
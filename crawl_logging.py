@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 日志
+基于标准库logging的分级、结构化、异步日志：业务线程只把日志记录放入队列，
+由后台监听线程负责格式化和输出；单张图片级别的日志可按比例采样，
+Web服务可把指定级别的日志转发到SSE消息队列
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+ROOT_LOGGER = 'douyin'
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_sampling_filter: Optional['SamplingFilter'] = None
+_handlers: List[logging.Handler] = []
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    获取爬虫模块的日志器（挂在 douyin 根日志器下）
+
+    Args:
+        name: 模块名，如 crawler / app
+
+    Returns:
+        logging.Logger
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def fields(sampled: bool = False, **values) -> Dict[str, Any]:
+    """
+    构造日志的 extra 参数
+
+    Args:
+        sampled: 是否为可采样的高频日志（如单张图片日志）
+        **values: 结构化字段，输出时附加在消息后
+
+    Returns:
+        传给 logger.xxx(..., extra=...) 的字典
+    """
+    return {'fields': values, 'sampled': sampled}
+
+
+class SamplingFilter(logging.Filter):
+    """按比例保留标记为可采样的日志，WARNING以上级别始终保留"""
+
+    def __init__(self, rate: float = 1.0, always_level: int = logging.WARNING):
+        """
+        Args:
+            rate: 保留比例（0~1），按计数均匀采样而非随机
+            always_level: 不低于该级别的日志不参与采样
+        """
+        super().__init__()
+        self.rate = min(1.0, max(0.0, rate))
+        self.always_level = always_level
+        self._counter = itertools.count()
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False) or record.levelno >= self.always_level or self.rate >= 1.0:
+            return True
+        n = next(self._counter)
+        # 第n条与第n+1条之间跨过整数边界时保留，rate=0.1即每10条保留1条
+        if int((n + 1) * self.rate) != int(n * self.rate):
+            return True
+        self.dropped += 1
+        return False
+
+
+class StructuredFormatter(logging.Formatter):
+    """文本格式：时间 级别 日志器: 消息 key=value ..."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s', '%H:%M:%S')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = getattr(record, 'fields', None)
+        if extra:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in extra.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON行格式，便于日志采集"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        extra = getattr(record, 'fields', None)
+        if extra:
+            entry.update(extra)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SSEForwardHandler(logging.Handler):
+    """把日志转发为SSE消息（{'type': 'log', ...}）"""
+
+    def __init__(self, put: Callable[[Dict], Any], level: int = logging.INFO, include_sampled: bool = False):
+        """
+        Args:
+            put: 消息投递函数，如 message_queue.put
+            level: 转发的最低级别
+            include_sampled: 是否转发可采样的高频日志
+        """
+        super().__init__(level)
+        self.put = put
+        self.include_sampled = include_sampled
+
+    def emit(self, record: logging.LogRecord):
+        if getattr(record, 'sampled', False) and not self.include_sampled:
+            return
+        try:
+            self.put({
+                'type': 'log',
+                'level': record.levelname.lower(),
+                'message': record.getMessage(),
+                'time': record.created
+            })
+        except Exception:
+            self.handleError(record)
+
+
+class _Dispatcher(logging.Handler):
+    """监听线程中的分发器，允许运行时增删下游处理器"""
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in list(_handlers):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord):
+        pass
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数"""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 队列只在进程内使用，不需要像默认实现那样在业务线程中提前格式化消息
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = 'INFO', json_format: bool = False, stream: Optional[TextIO] = None,
+                  sample_rate: float = 1.0, queue_size: int = 10000) -> logging.Logger:
+    """
+    初始化异步日志（重复调用只更新级别和采样比例）
+
+    Args:
+        level: 日志级别
+        json_format: 控制台是否输出JSON行
+        stream: 控制台输出流，默认stderr
+        sample_rate: 单张图片日志的保留比例
+        queue_size: 日志队列容量，队列满时丢弃新日志而不阻塞业务线程
+
+    Returns:
+        douyin 根日志器
+    """
+    global _listener, _queue_handler, _sampling_filter
+    root = logging.getLogger(ROOT_LOGGER)
+    with _lock:
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        if _listener is not None:
+            _sampling_filter.rate = min(1.0, max(0.0, sample_rate))
+            return root
+
+        console = logging.StreamHandler(stream or sys.stderr)
+        console.setFormatter(JsonFormatter() if json_format else StructuredFormatter())
+        _handlers.append(console)
+
+        _sampling_filter = SamplingFilter(sample_rate)
+        _queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        _queue_handler.addFilter(_sampling_filter)
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, _Dispatcher())
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def add_handler(handler: logging.Handler):
+    """在监听线程中追加一个下游处理器（如SSE转发）"""
+    with _lock:
+        _handlers.append(handler)
+
+
+def remove_handler(handler: logging.Handler):
+    """移除下游处理器"""
+    with _lock:
+        if handler in _handlers:
+            _handlers.remove(handler)
+
+
+def logging_stats() -> Dict[str, int]:
+    """采样丢弃和队列溢出丢弃的日志数"""
+    return {
+        'sampled_out': _sampling_filter.dropped if _sampling_filter else 0,
+        'queue_dropped': _queue_handler.dropped if _queue_handler else 0
+    }
+
+
+def shutdown_logging():
+    """停止监听线程（会先输出队列中剩余的日志）"""
+    global _listener, _queue_handler
+    with _lock:
+        listener, _listener = _listener, None
+        if listener is None:
+            return
+        logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+        _queue_handler = None
+    listener.stop()
+    with _lock:
+        _handlers.clear()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 分阶段爬取流水线
+渲染（Selenium / Crawl4AI）→ 候选图片队列 → 下载 → 写盘（DiskWriter），阶段之间为有界队列：
+浏览器渲染下一个页面时上一个页面的图片仍在下载，Selenium滚动过程中发现的图片立即进入下载；
+渲染和下载的并发数由AIMD控制器按成功率和耗时自动调整
+"""
+
+import asyncio
+import concurrent.futures
+import random
+from typing import Callable, Dict, List, Optional, Union
+
+from adaptive_concurrency import (
+    AIMDController, OVERLOAD_REASONS, SIGNAL_NEUTRAL, SIGNAL_OK, SIGNAL_OVERLOAD
+)
+from acquisition_stats import ACQUISITION_HEDGED, BACKEND_CRAWL4AI, BACKEND_SELENIUM
+from cancellation import CancellationToken, CrawlCancelled
+from crawl_logging import get_logger
+from douyin_image_crawler import DOWNLOAD_DELAYS, DouyinImageCrawler
+from linkrush import LinkFeed
+from metrics import CONCURRENCY_DECREASES, CONCURRENCY_LIMIT
+
+logger = get_logger('pipeline')
+
+
+class CrawlPipeline:
+    """多个用户主页的分阶段爬取（单个事件循环内运行）"""
+
+    def __init__(self, crawler: DouyinImageCrawler, max_images: int = 50, use_selenium: bool = True,
+                 save_metadata: bool = True, render_workers: int = 1, download_workers: int = 4,
+                 queue_size: int = 64, adaptive: bool = True, cancel_token: Optional[CancellationToken] = None,
+                 on_page_done: Optional[Callable[[str, Dict], None]] = None):
+        """
+        Args:
+            crawler: 爬虫实例（提供渲染、下载和写盘）
+            max_images: 每个页面的最大图片数量
+            use_selenium: 是否优先使用Selenium
+            save_metadata: 是否保存元数据
+            render_workers: 同时渲染的最大页面数（每个渲染协程占用一个浏览器）
+            download_workers: 同时下载的最大图片数
+            queue_size: 候选图片队列容量，队列满时渲染阶段等待
+            adaptive: 是否自适应调整并发数（从较低并发开始加性增，遇到403/429/超时乘性减）；
+                为False时固定使用 render_workers / download_workers
+            cancel_token: 取消令牌
+            on_page_done: 页面处理完成回调 (页面URL, 结果字典)
+        """
+        self.crawler = crawler
+        self.max_images = max_images
+        self.use_selenium = use_selenium
+        self.save_metadata = save_metadata
+        self.render_workers = max(1, render_workers)
+        self.download_workers = max(1, download_workers)
+        self.queue_size = queue_size
+        self.token = cancel_token or CancellationToken()
+        self.on_page_done = on_page_done
+        if adaptive:
+            # 浏览器开销大，渲染从1个开始；渲染耗时包含等待候选队列的时间，不使用耗时信号
+            self.render_limit = AIMDController('renders', self.render_workers, initial=1,
+                                               latency_tolerance=None, on_change=self._on_limit_change)
+            self.download_limit = AIMDController('downloads', self.download_workers,
+                                                 initial=max(1, self.download_workers // 2),
+                                                 on_change=self._on_limit_change)
+        else:
+            self.render_limit = AIMDController('renders', self.render_workers, minimum=self.render_workers)
+            self.download_limit = AIMDController('downloads', self.download_workers, minimum=self.download_workers)
+        self._pages: Dict[str, Dict] = {}
+        self._downloaded = 0
+        self._decreases: Dict[str, int] = {}
+
+    def _on_limit_change(self, controller: AIMDController):
+        """并发上限变化：更新指标并推送到进度"""
+        if controller.decreases > self._decreases.get(controller.name, 0):
+            CONCURRENCY_DECREASES.inc(stage=controller.name)
+            logger.info("检测到过载，%s 并发上限降为 %s", controller.name, controller.limit)
+        self._decreases[controller.name] = controller.decreases
+        self._report_limits()
+
+    def _report_limits(self):
+        limits = {}
+        for controller in (self.render_limit, self.download_limit):
+            CONCURRENCY_LIMIT.set(controller.limit, stage=controller.name)
+            limits[controller.name] = {'limit': controller.limit, 'maximum': controller.maximum}
+        self.crawler._report_progress('concurrency', limits=limits)
+
+    def concurrency_snapshot(self) -> Dict[str, Dict]:
+        """渲染和下载并发控制器的当前状态"""
+        return {controller.name: controller.snapshot() for controller in (self.render_limit, self.download_limit)}
+
+    def _first_backend(self) -> str:
+        if self.use_selenium and self.crawler._selenium_usable():
+            return BACKEND_SELENIUM
+        return BACKEND_CRAWL4AI
+
+    @staticmethod
+    def _new_page(page_url: str, backend: str) -> Dict:
+        return {
+            'results': {
+                "user_url": page_url,
+                "total_images": 0,
+                "downloaded_images": 0,
+                "failed_downloads": 0,
+                "images_metadata": [],
+                "retries": 0,
+                "circuit_breakers": {},
+                "method_used": backend
+            },
+            'rendering': True,   # 渲染中（或等待渲染）
+            'pending': 0,        # 已入队、尚未下载完成的图片数
+            'queued': 0,         # 已入队的图片总数（作为下载序号）
+            'backend': backend,
+            'fallback': False,   # 是否已回退到Crawl4AI
+            'finished': False
+        }
+
+    async def run(self, page_urls: Union[List[str], LinkFeed]) -> List[Dict]:
+        """
+        运行流水线
+
+        Args:
+            page_urls: 用户主页URL列表，或仍在增长的 LinkFeed（上传文件边解析边爬取，关闭后结束）
+
+        Returns:
+            每个页面的结果字典（与输入顺序一致，重复URL只处理一次）
+        """
+        feed = page_urls if isinstance(page_urls, LinkFeed) else None
+        if feed is not None:
+            # 链接目录去重且只追加，快照长度即为读取线程继续读取的起点
+            page_urls = feed.snapshot()
+            feed_position = len(page_urls)
+        page_urls = list(dict.fromkeys(page_urls))
+        if not page_urls and feed is None:
+            return []
+
+        self._loop = asyncio.get_running_loop()
+        self._render_queue: asyncio.Queue = asyncio.Queue()
+        self._candidates: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._remaining = 0
+        self._input_closed = feed is None
+        self._finished = asyncio.Event()
+        self._backend = self._first_backend()
+        for page_url in page_urls:
+            self._add_page(page_url)
+
+        self._report_limits()
+        # 协程数为最大并发数，实际同时工作的数量由控制器的当前上限决定
+        workers = [asyncio.ensure_future(self._render_worker()) for _ in range(self.render_workers)]
+        workers += [asyncio.ensure_future(self._download_worker()) for _ in range(self.download_workers)]
+        if feed is not None:
+            workers.append(asyncio.ensure_future(self._feed_worker(feed, page_urls, feed_position)))
+        try:
+            with self.crawler._cancel_task_on(self.token):
+                waiter = asyncio.ensure_future(self._finished.wait())
+                done, _ = await asyncio.wait([waiter, *workers], return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                # 工作协程（读取链接的协程除外）只会因取消而提前结束，取出其异常
+                for task in done:
+                    if task is not waiter:
+                        task.result()
+        except (asyncio.CancelledError, CrawlCancelled):
+            if not self.token.cancelled:
+                raise
+            await self._finish_cancelled()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return [self._pages[page_url]['results'] for page_url in page_urls]
+
+    def _add_page(self, page_url: str):
+        self._pages[page_url] = self._new_page(page_url, self._backend)
+        self._remaining += 1
+        self._render_queue.put_nowait((page_url, self._backend))
+
+    async def _feed_worker(self, feed: LinkFeed, page_urls: List[str], position: int):
+        """输入阶段：把上传文件中陆续解析出的URL（从快照之后的第 position 个开始）加入渲染队列，读取结束后允许流水线完成"""
+        closed = False
+        while not closed:
+            # 等待放在线程池中，超时后重新检查，取消时不会长时间阻塞
+            links, closed = await self._loop.run_in_executor(None, feed.wait, position, 0.5)
+            position += len(links)
+            for page_url in links:
+                if page_url not in self._pages:
+                    page_urls.append(page_url)
+                    self._add_page(page_url)
+        if feed.error:
+            logger.warning("上传文件解析中断，只爬取已读到的 %s 个URL: %s", len(page_urls), feed.error)
+        self._input_closed = True
+        if self._remaining == 0:
+            self._finished.set()
+        # 保持运行，与其他工作协程一起在结束时取消
+        await asyncio.Event().wait()
+
+    async def _render_worker(self):
+        """渲染阶段：获取页面的候选图片并放入候选队列"""
+        while True:
+            page_url, backend = await self._render_queue.get()
+            page = self._pages[page_url]
+            started_at = await self.render_limit.acquire()
+            signal = SIGNAL_NEUTRAL
+            try:
+                queued_before = page['queued']
+                rendered = await self._render(page_url, backend)
+                if page['queued'] > queued_before:
+                    signal = SIGNAL_OK
+                elif not rendered:
+                    signal = SIGNAL_OVERLOAD
+            except CrawlCancelled:
+                raise
+            except Exception as e:
+                signal = SIGNAL_OVERLOAD
+                logger.error("渲染页面出错: %s %s", page_url, e)
+            finally:
+                self.render_limit.release(started_at, signal)
+            page['rendering'] = False
+            await self._maybe_finish(page_url)
+
+    async def _render(self, page_url: str, backend: str) -> bool:
+        """渲染页面并把候选图片放入队列，页面渲染失败时返回False"""
+        page = self._pages[page_url]
+        results = page['results']
+        page['backend'] = results["method_used"] = backend
+
+        if (backend == BACKEND_SELENIUM and self.crawler.acquisition_mode == ACQUISITION_HEDGED
+                and not page['fallback']):
+            winner, acquired, info = await self.crawler._acquire_hedged(
+                page_url, self.max_images, [BACKEND_SELENIUM, BACKEND_CRAWL4AI], self.token
+            )
+            results["acquisition"] = info
+            page['fallback'] = True
+            if winner is None:
+                return False
+            page['backend'] = results["method_used"] = winner
+            candidates, results["total_images"] = acquired
+            await self._enqueue(page_url, candidates, winner)
+            return True
+
+        if backend == BACKEND_SELENIUM:
+            logger.info("使用Selenium方法获取图片: %s", page_url)
+
+            def on_batch(urls: List[str]):
+                # 在Selenium线程中调用：等待候选图片进入队列（队列满时阻塞滚动，形成背压）
+                base = page['queued']
+                candidates = [self.crawler._selenium_candidate(url, base + i) for i, url in enumerate(urls, 1)]
+                self._wait_threadsafe(asyncio.run_coroutine_threadsafe(
+                    self._enqueue(page_url, candidates, BACKEND_SELENIUM), self._loop
+                ))
+
+            acquired = await self.crawler._acquire_timed(BACKEND_SELENIUM, page_url, self.max_images,
+                                                         self.token, on_batch=on_batch)
+            if acquired:
+                results["total_images"] = acquired[1]
+            if page['queued']:
+                return True
+            logger.warning("Selenium未获取到图片，回退到Crawl4AI方法: %s", page_url)
+            page['fallback'] = True
+            backend = page['backend'] = results["method_used"] = BACKEND_CRAWL4AI
+
+        logger.info("使用Crawl4AI方法获取图片: %s", page_url)
+        acquired = await self.crawler._acquire_timed(BACKEND_CRAWL4AI, page_url, self.max_images, self.token)
+        if acquired is None:
+            return False
+        candidates, results["total_images"] = acquired
+        await self._enqueue(page_url, candidates, BACKEND_CRAWL4AI)
+        return True
+
+    def _wait_threadsafe(self, future: concurrent.futures.Future):
+        """在非事件循环线程中等待协程完成，取消时立即返回"""
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.token.cancelled:
+                    future.cancel()
+                    raise CrawlCancelled(self.token.reason)
+
+    async def _enqueue(self, page_url: str, candidates: List[Dict], backend: str):
+        """候选图片放入下载队列（队列满时等待）"""
+        page = self._pages[page_url]
+        for img in candidates:
+            page['queued'] += 1
+            page['pending'] += 1
+            await self._candidates.put((page_url, page['queued'], img, backend))
+        # 待下载数量 = 尚未完成的已入队图片
+        self.crawler._report_progress('candidates', page_url=page_url, count=page['pending'])
+
+    async def _download_worker(self):
+        """下载阶段：从候选队列取图片下载（写盘由 DiskWriter 线程池完成）"""
+        while True:
+            page_url, index, img, backend = await self._candidates.get()
+            page = self._pages[page_url]
+            try:
+                self.token.raise_if_cancelled()
+                if self.crawler.storage is not None:
+                    # 磁盘空间不足时在占用并发名额之前暂停，暂停时间不计入下载耗时
+                    await self.crawler._wait_for_storage(self.token)
+                started_at = await self.download_limit.acquire()
+                success = False
+                try:
+                    success = await self.crawler._download_douyin_image(img, page_url, index, method=backend,
+                                                                        cancel_token=self.token)
+                finally:
+                    self.download_limit.release(started_at, self._download_signal(img, success))
+                self.crawler._apply_download_result(page['results'], img, success, self.save_metadata)
+                await self._pace(backend)
+            finally:
+                self._candidates.task_done()
+            page['pending'] -= 1
+            await self._maybe_finish(page_url)
+
+    @staticmethod
+    def _download_signal(img: Dict, success: bool) -> str:
+        """下载结果对应的并发信号：重试过程中遇到403/429/超时即视为过载（即使最终成功）"""
+        if img.get('failure_reason') in OVERLOAD_REASONS:
+            return SIGNAL_OVERLOAD
+        return SIGNAL_OK if success else SIGNAL_NEUTRAL
+
+    async def _pace(self, backend: str):
+        """按获取方式的节奏插入随机延迟（只暂停当前下载协程）"""
+        if not self.crawler.enable_delays:
+            return
+        self._downloaded += 1
+        every, min_delay, max_delay = DOWNLOAD_DELAYS[backend]
+        if self._downloaded % every == 0:
+            if await self.token.sleep(random.uniform(min_delay, max_delay)):
+                raise CrawlCancelled(self.token.reason)
+
+    async def _maybe_finish(self, page_url: str):
+        """渲染结束且所有候选图片下载完成后，收尾该页面"""
+        page = self._pages[page_url]
+        if page['rendering'] or page['pending'] or page['finished']:
+            return
+        results = page['results']
+
+        # 与顺序模式一致：Selenium的图片一张都没下载成功时再用Crawl4AI渲染一次
+        if page['backend'] == BACKEND_SELENIUM and results["downloaded_images"] == 0 and not page['fallback']:
+            logger.warning("Selenium获取的图片均未下载成功，回退到Crawl4AI方法: %s", page_url)
+            page['fallback'] = True
+            page['rendering'] = True
+            self._render_queue.put_nowait((page_url, BACKEND_CRAWL4AI))
+            return
+
+        page['finished'] = True
+        if self.crawler.catalog:
+            self.crawler.catalog.flush()
+        results["circuit_breakers"] = self.crawler.circuit_breakers.snapshot()
+        await self.crawler._save_user_metadata(results, self.save_metadata, page['backend'])
+        self.crawler._report_progress('page_done', page_url=page_url)
+        if self.on_page_done:
+            self.on_page_done(page_url, results)
+
+        self._remaining -= 1
+        if self._remaining == 0 and self._input_closed:
+            self._finished.set()
+
+    async def _finish_cancelled(self):
+        """取消后收尾：未完成页面标记为已取消，已下载部分写入部分元数据"""
+        unfinished = [page['results'] for page in self._pages.values() if not page['finished']]
+        partial = {
+            "user_urls": [results["user_url"] for results in unfinished],
+            "images_metadata": [item for results in unfinished for item in results["images_metadata"]]
+        }
+        for key in ("total_images", "downloaded_images", "failed_downloads", "retries"):
+            partial[key] = sum(results[key] for results in unfinished)
+        await self.crawler._finish_cancelled(partial, self.save_metadata, self.token)
+        for results in unfinished:
+            results["cancelled"] = True
+            results["cancel_reason"] = self.token.reason
+            results["circuit_breakers"] = partial["circuit_breakers"]
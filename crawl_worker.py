@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 分布式爬取worker
+从共享任务队列（task_queue.py）租用主页URL任务并爬取，爬取期间定期心跳续租，
+结果写回队列由Web协调端汇总。可在多个节点上各运行一个或多个worker
+
+用法:
+    python crawl_worker.py --broker sqlite:///douyin_tasks.db --save-dir douyin_images
+    python crawl_worker.py --broker redis://10.0.0.5:6379/0 --worker-id node-a-1
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from cancellation import CancellationToken
+from crawl_logging import get_logger, setup_logging
+from douyin_image_crawler import DouyinImageCrawler
+from task_queue import TaskBroker, open_broker
+
+logger = get_logger('worker')
+
+# 写回队列的结果字段（图片元数据较大，保存在worker本地的元数据文件中）
+RESULT_FIELDS = ('total_images', 'downloaded_images', 'failed_downloads', 'retries', 'method_used', 'acquisition')
+# 租约丢失时的取消原因
+LEASE_LOST = '租约已失效'
+
+
+class CrawlWorker:
+    """租用任务 → 爬取 → 提交结果的循环"""
+
+    def __init__(self, broker: TaskBroker, save_dir: str, worker_id: Optional[str] = None,
+                 visibility_timeout: float = 300.0, heartbeat_interval: Optional[float] = None,
+                 poll_interval: float = 2.0, catalog_path: Optional[str] = "douyin_catalog.db",
+                 crawler_options: Optional[Dict] = None):
+        """
+        Args:
+            broker: 任务队列
+            save_dir: 保存根目录，每个作业的图片保存在 <save_dir>/<作业ID>
+            worker_id: worker标识，默认为 主机名-进程号
+            visibility_timeout: 租约时长（秒），worker失联超过该时间后任务重新入队
+            heartbeat_interval: 续租间隔（秒），默认为租约时长的1/3
+            poll_interval: 队列为空时的轮询间隔（秒）
+            catalog_path: 图片元数据目录路径，为None时不记录
+            crawler_options: 传给 DouyinImageCrawler 的其他参数
+        """
+        self.broker = broker
+        self.save_dir = Path(save_dir)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat_interval = heartbeat_interval or visibility_timeout / 3
+        self.poll_interval = poll_interval
+        self.catalog_path = catalog_path
+        self.crawler_options = crawler_options or {}
+
+        self.tasks_done = 0
+        self.tasks_failed = 0
+        self.current_task: Optional[Dict] = None
+        # 停止：不再租用新任务；中止：同时取消当前任务（重新入队）
+        self._stopping = threading.Event()
+        self._task_token: Optional[CancellationToken] = None
+
+    def stop(self):
+        """当前任务完成后退出"""
+        self._stopping.set()
+
+    def abort(self):
+        """立即取消当前任务（归还到队列）并退出"""
+        self._stopping.set()
+        token = self._task_token
+        if token is not None:
+            token.cancel('worker停止')
+
+    def _info(self) -> Dict:
+        return {
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'current_url': (self.current_task or {}).get('payload', {}).get('url'),
+            'tasks_done': self.tasks_done,
+            'tasks_failed': self.tasks_failed
+        }
+
+    def run(self, max_tasks: Optional[int] = None, exit_when_idle: bool = False) -> int:
+        """
+        主循环
+
+        Args:
+            max_tasks: 处理多少个任务后退出，None表示不限
+            exit_when_idle: 队列为空时退出
+
+        Returns:
+            处理的任务数
+        """
+        processed = 0
+        logger.info("worker %s 已启动", self.worker_id)
+        while not self._stopping.is_set() and (max_tasks is None or processed < max_tasks):
+            self.broker.touch_worker(self.worker_id, self._info())
+            task = self.broker.lease(self.worker_id, self.visibility_timeout)
+            if task is None:
+                if exit_when_idle:
+                    break
+                self._stopping.wait(self.poll_interval)
+                continue
+            self._run_task(task)
+            processed += 1
+        self.broker.touch_worker(self.worker_id, self._info())
+        logger.info("worker %s 已退出，共处理 %s 个任务", self.worker_id, processed)
+        return processed
+
+    def _heartbeat_loop(self, task: Dict, token: CancellationToken, done: threading.Event):
+        """续租；租约丢失（过期后被他人租用或作业被取消）时取消当前任务"""
+        while not done.wait(self.heartbeat_interval):
+            try:
+                held = self.broker.heartbeat(task['task_id'], task['lease_token'], self.visibility_timeout)
+                self.broker.touch_worker(self.worker_id, self._info())
+            except Exception as e:
+                # 队列暂时不可用：保留任务继续爬取，租约过期前恢复即可
+                logger.warning("续租失败: %s", e)
+                continue
+            if not held:
+                logger.warning("任务租约已失效，停止爬取: %s", task['payload'].get('url'))
+                token.cancel(LEASE_LOST)
+                return
+
+    def _run_task(self, task: Dict):
+        payload = task['payload']
+        url = payload['url']
+        logger.info("租用任务 %s（第 %s 次尝试）: %s", task['task_id'], task['attempts'], url)
+
+        token = CancellationToken()
+        self._task_token = token
+        self.current_task = task
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(task, token, done),
+                                     name='lease-heartbeat', daemon=True)
+        heartbeat.start()
+
+        crawler = None
+        started = time.monotonic()
+        try:
+            crawler = DouyinImageCrawler(
+                download_dir=str(self.save_dir / task['job_id']),
+                catalog_path=self.catalog_path,
+                **dict(self.crawler_options, **payload.get('crawler_options', {}))
+            )
+            result = asyncio.run(crawler.crawl_douyin_user_images(
+                user_url=url,
+                max_images=payload.get('max_images', 50),
+                save_metadata=payload.get('save_metadata', True),
+                use_selenium=payload.get('use_selenium', True),
+                cancel_token=token
+            ))
+        except Exception as e:
+            logger.error("任务失败: %s %s", url, e)
+            self.tasks_failed += 1
+            self.broker.fail(task['task_id'], task['lease_token'], str(e))
+            return
+        finally:
+            done.set()
+            heartbeat.join()
+            if crawler is not None:
+                crawler.close()
+            self._task_token = None
+            self.current_task = None
+
+        if result.get('cancelled'):
+            # 租约已失效时无需处理；worker停止时归还任务由其他worker重新爬取
+            if token.reason != LEASE_LOST:
+                self.broker.fail(task['task_id'], task['lease_token'], f"已取消: {token.reason}")
+            self.tasks_failed += 1
+            return
+
+        summary = {key: result[key] for key in RESULT_FIELDS if key in result}
+        summary.update({
+            'url': url,
+            'worker_id': self.worker_id,
+            'save_dir': str((self.save_dir / task['job_id']).absolute()),
+            'seconds': round(time.monotonic() - started, 3)
+        })
+        if self.broker.complete(task['task_id'], task['lease_token'], summary):
+            self.tasks_done += 1
+            logger.info("任务完成: %s，下载 %s 张图片", url, result.get('downloaded_images', 0))
+        else:
+            logger.warning("提交结果时租约已失效，结果被丢弃: %s", url)
+
+
+def install_signal_handlers(worker: CrawlWorker):
+    """第一次 SIGINT/SIGTERM 完成当前任务后退出，第二次取消当前任务（归还队列）并退出"""
+    def handle_signal(signum, frame):
+        if worker._stopping.is_set():
+            logger.warning("再次收到停止信号，取消当前任务")
+            worker.abort()
+            return
+        logger.info("收到停止信号，完成当前任务后退出（再次发送信号立即退出）")
+        worker.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抖音图片爬虫 - 分布式爬取worker')
+    parser.add_argument('--broker', default='sqlite:///douyin_tasks.db',
+                        help='任务队列：sqlite:///路径（单机）或 redis://主机:端口/库（多节点）')
+    parser.add_argument('--save-dir', default='douyin_images', help='保存根目录（按作业ID分子目录）')
+    parser.add_argument('--worker-id', default=None, help='worker标识，默认为 主机名-进程号')
+    parser.add_argument('--visibility-timeout', type=float, default=300, help='租约时长（秒）')
+    parser.add_argument('--heartbeat-interval', type=float, default=None, help='续租间隔（秒），默认为租约时长的1/3')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='队列为空时的轮询间隔（秒）')
+    parser.add_argument('--max-tasks', type=int, default=None, help='处理多少个任务后退出')
+    parser.add_argument('--exit-when-idle', action='store_true', help='队列为空时退出')
+    parser.add_argument('--catalog', default='douyin_catalog.db', help='图片元数据目录路径')
+    parser.add_argument('--log-level', default='INFO', help='日志级别')
+    args = parser.parse_args()
+
+    setup_logging(args.log_level)
+    broker = open_broker(args.broker)
+    worker = CrawlWorker(
+        broker, args.save_dir, worker_id=args.worker_id,
+        visibility_timeout=args.visibility_timeout, heartbeat_interval=args.heartbeat_interval,
+        poll_interval=args.poll_interval, catalog_path=args.catalog
+    )
+    install_signal_handlers(worker)
+    try:
+        worker.run(max_tasks=args.max_tasks, exit_when_idle=args.exit_when_idle)
+    finally:
+        broker.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 磁盘写入器
+将图片和元数据的写盘操作从事件循环线程移到独立的线程池，
+通过有界的待写队列向下载协程施加背压
+"""
+
+import asyncio
+import errno
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, Set, Union
+
+from metrics import time_stage
+
+PathLike = Union[str, Path]
+
+# 表示磁盘（或用户磁盘配额）已满的错误码
+DISK_FULL_ERRNOS = {errno.ENOSPC, getattr(errno, 'EDQUOT', errno.ENOSPC)}
+
+
+class DiskFullError(OSError):
+    """磁盘空间不足，文件无法写入"""
+
+    def __init__(self, message: str):
+        super().__init__(errno.ENOSPC, message)
+
+
+class DiskWriter:
+    """磁盘写入器：有界队列 + 线程池"""
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64):
+        """
+        初始化磁盘写入器
+
+        Args:
+            max_workers: 写盘线程数
+            max_pending: 允许排队（含正在写入）的最大任务数，超过后提交方等待
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='disk-writer')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # 队列已满时在该线程池中等待空位（与写盘线程分开，等待不占用写盘线程）
+        self._slot_waiters = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='disk-writer-wait')
+        self._created_dirs: Set[str] = set()
+        self._dir_lock = threading.Lock()
+        self._closed = False
+
+    def prepare_dirs(self, dirs: Iterable[PathLike]):
+        """
+        批量创建目录，已创建过的目录不会重复调用mkdir
+
+        Args:
+            dirs: 目录列表
+        """
+        with self._dir_lock:
+            for directory in dirs:
+                key = str(directory)
+                if key in self._created_dirs:
+                    continue
+                os.makedirs(key, exist_ok=True)
+                self._created_dirs.add(key)
+
+    def _ensure_parent(self, path: Path):
+        parent = str(path.parent)
+        if parent in self._created_dirs:
+            return
+        self.prepare_dirs([parent])
+
+    def _write_bytes(self, path: Path, data: bytes) -> int:
+        with time_stage('disk_write'):
+            self._ensure_parent(path)
+            # 先写临时文件再替换，避免中断时留下残缺图片
+            tmp_path = path.with_name(path.name + '.part')
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+            except OSError as e:
+                if e.errno not in DISK_FULL_ERRNOS:
+                    raise
+                # 删除写了一半的临时文件，归还已占用的空间
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise DiskFullError(f"磁盘空间不足，无法写入 {path}") from e
+            os.replace(tmp_path, path)
+        return len(data)
+
+    def _write_json(self, path: Path, obj: Any) -> int:
+        data = json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+        return self._write_bytes(path, data)
+
+    def _submit(self, fn, *args) -> Future:
+        if self._closed:
+            raise RuntimeError("DiskWriter已关闭")
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def _acquire_slot(self):
+        # 快速路径：有空位时不切换线程
+        if self._slots.acquire(blocking=False):
+            return
+        future = self._slot_waiters.submit(self._slots.acquire)
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 协程被取消时等待线程可能已经（或即将）拿到空位，拿到后立即归还
+            if not future.cancel():
+                future.add_done_callback(lambda _: self._slots.release())
+            raise
+
+    async def write_bytes(self, path: PathLike, data: bytes) -> int:
+        """
+        异步写入二进制文件（队列已满时等待，形成背压）
+
+        Args:
+            path: 目标路径
+            data: 文件内容
+
+        Returns:
+            写入的字节数
+        """
+        await self._acquire_slot()
+        future = self._submit(self._write_bytes, Path(path), data)
+        return await asyncio.wrap_future(future)
+
+    async def write_json(self, path: PathLike, obj: Any) -> int:
+        """
+        异步写入JSON文件（序列化也在写盘线程中完成）
+
+        Args:
+            path: 目标路径
+            obj: 可JSON序列化的对象
+
+        Returns:
+            写入的字节数
+        """
+        await self._acquire_slot()
+        future = self._submit(self._write_json, Path(path), obj)
+        return await asyncio.wrap_future(future)
+
+    def write_json_sync(self, path: PathLike, obj: Any) -> int:
+        """在当前线程同步写入JSON（用于非异步上下文）"""
+        return self._write_json(Path(path), obj)
+
+    def close(self, wait: bool = True):
+        """
+        关闭写入器
+
+        Args:
+            wait: 是否等待已提交的写入完成
+        """
+        self._closed = True
+        self._executor.shutdown(wait=wait)
+        self._slot_waiters.shutdown(wait=wait, cancel_futures=True)
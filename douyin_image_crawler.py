@@ -6,43 +6,188 @@
 注意：请遵守抖音平台的使用条款和相关法律法规
 """
 
+import argparse
 import asyncio
-import json
+import hashlib
+import importlib.util
 import os
 import requests
 import time
 import random
+from contextlib import aclosing, contextmanager
+from types import SimpleNamespace
 from pathlib import Path
 from urllib.parse import urljoin, urlparse, parse_qs
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Tuple
 
-from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode, BrowserConfig
 from linkrush import extract_links_from_file
+from image_catalog import ImageCatalog, probe_image_size
+from disk_writer import DiskFullError, DiskWriter
+from retry_policy import RetryPolicy, HostCircuitBreakers, parse_retry_after
+from page_cache import PageCache, CACHE_BYPASS
+from replay import FixtureElement, FixturePlayer, FixtureRecorder
+from metrics import (
+    ACQUISITION_SECONDS, ACQUISITION_WINS, DOWNLOADED_BYTES, DOWNLOADED_IMAGES, DOWNLOAD_FAILURES,
+    DOWNLOAD_RETRIES, IMAGE_PHASE_SECONDS, SIGNED_URL_FALLBACKS, STAGE_SECONDS,
+    connection_timing, create_instrumented_session, reset_connection_timing, time_stage
+)
+from crawl_logging import fields, get_logger, setup_logging
+from profiling import JobProfiler, PROFILE_MODES
+from cancellation import CancellationToken, CrawlCancelled
+from storage_budget import DISK_FULL_REASON, JobStorage, QuotaExceeded
+from browser_session import BrowserSession, BrowserSessionPool
+from acquisition_stats import (
+    ACQUISITION_HEDGED, ACQUISITION_MODES, ACQUISITION_SEQUENTIAL, BACKEND_CRAWL4AI, BACKEND_SELENIUM,
+    OUTCOME_CANCELLED, OUTCOME_EMPTY, OUTCOME_ERROR, OUTCOME_USABLE, BackendStats
+)
 
-# Selenium相关导入
-try:
-    from selenium import webdriver
+logger = get_logger('crawler')
+# 单张图片级别的高频日志，按 setup_logging(sample_rate=...) 采样
+SAMPLED = fields(sampled=True)
+
+if TYPE_CHECKING:
+    from crawl4ai import BrowserConfig, CrawlerRunConfig
     from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.webdriver.chrome.service import Service
-    from selenium.common.exceptions import TimeoutException, NoSuchElementException
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    print("警告: Selenium未安装，部分功能将不可用。请运行: pip install selenium")
-    SELENIUM_AVAILABLE = False
+
+# Crawl4AI和Selenium导入开销较大（浏览器驱动栈），只检查是否安装，
+# 首次实际使用对应方法时才导入，Web服务和命令行启动不再为此等待
+CRAWL4AI_AVAILABLE = importlib.util.find_spec('crawl4ai') is not None
+SELENIUM_AVAILABLE = importlib.util.find_spec('selenium') is not None
+if not CRAWL4AI_AVAILABLE:
+    logger.warning("警告: Crawl4AI未安装，Crawl4AI方法将不可用。请运行: pip install crawl4ai")
+if not SELENIUM_AVAILABLE:
+    logger.warning("警告: Selenium未安装，部分功能将不可用。请运行: pip install selenium")
+
+_backends: Dict[str, SimpleNamespace] = {}
+
+# 对冲模式下没有足够统计样本时，主后端的延迟预算（秒）
+DEFAULT_HEDGE_DELAY = 20.0
+# 各获取方式的下载延迟节奏：(每N张, 最小延迟, 最大延迟)
+DOWNLOAD_DELAYS = {BACKEND_SELENIUM: (3, 2, 4), BACKEND_CRAWL4AI: (5, 2, 5)}
+# 用户主页元数据文件名
+METADATA_FILES = {BACKEND_SELENIUM: "douyin_metadata_selenium.json", BACKEND_CRAWL4AI: "douyin_metadata.json"}
+
+
+def page_dir_name(page_url: str) -> str:
+    """
+    页面的保存子目录名：URL最后一段路径（用户ID或视频ID）加URL哈希
+    
+    同一页面每次爬取使用相同的目录，同时下载的多个页面互不覆盖
+    
+    Args:
+        page_url: 用户主页或视频页URL
+        
+    Returns:
+        目录名
+    """
+    last_segment = urlparse(page_url).path.rstrip('/').rsplit('/', 1)[-1]
+    slug = "".join(c for c in last_segment if c.isalnum() or c in ('-', '_'))[:32]
+    digest = hashlib.sha1(page_url.encode('utf-8')).hexdigest()[:10]
+    return f"{slug}_{digest}" if slug else digest
+
+
+def load_crawl4ai() -> SimpleNamespace:
+    """
+    按需导入Crawl4AI（结果缓存）
+    
+    Returns:
+        包含 AsyncWebCrawler / CrawlerRunConfig / CacheMode / BrowserConfig / MemoryAdaptiveDispatcher 的命名空间
+    """
+    if 'crawl4ai' not in _backends:
+        from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode, BrowserConfig, MemoryAdaptiveDispatcher
+        _backends['crawl4ai'] = SimpleNamespace(
+            AsyncWebCrawler=AsyncWebCrawler, CrawlerRunConfig=CrawlerRunConfig,
+            CacheMode=CacheMode, BrowserConfig=BrowserConfig, MemoryAdaptiveDispatcher=MemoryAdaptiveDispatcher
+        )
+    return _backends['crawl4ai']
+
+
+def load_selenium() -> SimpleNamespace:
+    """
+    按需导入Selenium（结果缓存）
+    
+    Returns:
+        包含 webdriver / Options / By / WebDriverWait / EC / Service / TimeoutException 的命名空间
+    """
+    if 'selenium' not in _backends:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.chrome.service import Service
+        from selenium.common.exceptions import TimeoutException
+        _backends['selenium'] = SimpleNamespace(
+            webdriver=webdriver, Options=Options, By=By, WebDriverWait=WebDriverWait,
+            EC=EC, Service=Service, TimeoutException=TimeoutException
+        )
+    return _backends['selenium']
 
 class DouyinImageCrawler:
-    def __init__(self, download_dir: str = "douyin_images"):
+    def __init__(self, download_dir: str = "douyin_images",
+                 catalog_path: Optional[str] = "douyin_catalog.db",
+                 disk_workers: int = 4, max_pending_writes: int = 64,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 page_cache_mode: str = CACHE_BYPASS, page_cache_ttl: float = 24 * 3600,
+                 page_cache_dir: str = ".douyin_page_cache", enable_delays: bool = True,
+                 progress_callback: Optional[Callable[[Dict], None]] = None,
+                 acquisition_mode: str = ACQUISITION_SEQUENTIAL, hedge_delay: Optional[float] = None,
+                 acquisition_stats_path: Optional[str] = None, storage: Optional[JobStorage] = None):
         """
         初始化抖音图片爬虫
         
         Args:
             download_dir: 图片下载目录
+            catalog_path: 图片元数据目录（SQLite）路径，为None时不记录
+            disk_workers: 写盘线程数
+            max_pending_writes: 最大待写入任务数，超过后下载协程等待
+            retry_policy: 图片下载的重试策略，默认最多重试3次
+            page_cache_mode: Crawl4AI页面结果缓存模式（bypass/enabled/read_only/write_only/offline）
+            page_cache_ttl: 页面缓存有效期（秒）
+            page_cache_dir: 页面缓存目录
+            enable_delays: 是否在下载间插入随机延迟（离线重放和基准测试时关闭）
+            progress_callback: 进度回调，确定待下载图片（candidates）和每张图片完成（image）时调用
+            acquisition_mode: 候选图片获取模式，sequential（Selenium失败后再用Crawl4AI）或
+                hedged（主后端超出延迟预算后并行启动另一个后端，先返回者胜出）
+            hedge_delay: 对冲延迟预算（秒），为None时按主后端历史耗时的p90自动确定
+            acquisition_stats_path: 后端耗时/胜率统计的持久化文件，为None时只在内存中统计
+            storage: 本任务的存储记账（见 storage_budget.py），下载前检查配额和磁盘剩余空间，为None时不限制
         """
+        if acquisition_mode not in ACQUISITION_MODES:
+            raise ValueError(f"无效的获取模式: {acquisition_mode}，可选: {', '.join(ACQUISITION_MODES)}")
         self.download_dir = Path(download_dir)
-        self.download_dir.mkdir(exist_ok=True)
+        
+        # 磁盘写入器：写盘操作不占用事件循环线程
+        self.disk_writer = DiskWriter(max_workers=disk_workers, max_pending=max_pending_writes)
+        self.disk_writer.prepare_dirs([self.download_dir])
+        # 存储预算：配额已满时不再请求图片，磁盘空间不足时暂停下载
+        self.storage = storage
+        
+        # 图片元数据目录
+        self.catalog = ImageCatalog(catalog_path) if catalog_path else None
+        
+        # 下载重试策略与按CDN域名的熔断器
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breakers = HostCircuitBreakers()
+        
+        # Crawl4AI页面结果缓存（缓存提取到的图片列表，而非HTML）
+        self.page_cache = PageCache(page_cache_dir, mode=page_cache_mode, ttl=page_cache_ttl)
+        self.enable_delays = enable_delays
+        self.progress_callback = progress_callback
+        
+        # 候选图片获取方式与各后端统计（对冲模式据此调整后端顺序和延迟预算）
+        self.acquisition_mode = acquisition_mode
+        self.hedge_delay = hedge_delay
+        self.acquisition_stats = BackendStats(acquisition_stats_path)
+        
+        # 图片下载使用的连接池（记录DNS/建连/首字节/传输耗时）
+        self.http_session = create_instrumented_session()
+        # 加载页面的浏览器会话（Cookie、User-Agent），按页面使用各自的下载连接池
+        self.browser_sessions = BrowserSessionPool(create_instrumented_session)
+        
+        # 离线录制/重放（见 replay.py）
+        self.fixture_recorder: Optional[FixtureRecorder] = None
+        self.fixture_player: Optional[FixturePlayer] = None
         
         # 抖音相关的User-Agent
         self.user_agents = [
@@ -52,14 +197,129 @@ class DouyinImageCrawler:
             "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         ]
         
+    def close(self):
+        """释放爬虫持有的资源（等待写盘完成，写入并关闭元数据目录）"""
+        self.disk_writer.close(wait=True)
+        self.http_session.close()
+        self.browser_sessions.close()
+        if self.catalog:
+            self.catalog.close()
+            self.catalog = None
+    
+    def _selenium_usable(self) -> bool:
+        """Selenium路径是否可用（已安装，或处于重放模式）；离线缓存模式只读页面缓存，不启动浏览器"""
+        if self.fixture_player is not None:
+            return True
+        return SELENIUM_AVAILABLE and not self.page_cache.offline
+    
+    def _report_progress(self, event: str, **data):
+        """
+        调用进度回调（在下载路径上调用，回调应尽量轻量）
+        
+        Args:
+            event: 事件类型，candidates / image
+            **data: 事件数据
+        """
+        if self.progress_callback is None:
+            return
+        data['event'] = event
+        try:
+            self.progress_callback(data)
+        except Exception as e:
+            logger.debug("进度回调出错: %s", e)
+    
+    def _page_dir(self, page_url: str) -> Path:
+        """页面的图片和元数据保存目录（下载目录下按页面区分的子目录）"""
+        return self.download_dir / page_dir_name(page_url)
+    
     def _get_random_user_agent(self) -> str:
         """获取随机User-Agent"""
         return random.choice(self.user_agents)
     
-    def _add_random_delay(self, min_delay: float = 1.0, max_delay: float = 3.0):
-        """添加随机延迟，避免被检测"""
+    def _add_random_delay(self, min_delay: float = 1.0, max_delay: float = 3.0,
+                          cancel_token: Optional[CancellationToken] = None):
+        """添加随机延迟，避免被检测（取消时提前结束）"""
+        if not self.enable_delays:
+            return
         delay = random.uniform(min_delay, max_delay)
-        time.sleep(delay)
+        if cancel_token is not None:
+            cancel_token.wait(delay)
+        else:
+            time.sleep(delay)
+    
+    @contextmanager
+    def _cancel_task_on(self, cancel_token: CancellationToken):
+        """
+        令牌取消时取消当前协程（从其他线程安全地调度到事件循环），
+        正在等待的页面渲染、下载和重试退避会立即抛出 CancelledError
+        
+        Args:
+            cancel_token: 取消令牌
+        """
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        active = True
+        
+        def cancel_task():
+            # 在事件循环线程中执行，退出上下文后不再取消
+            if active:
+                task.cancel()
+        
+        callback = cancel_token.add_callback(lambda: loop.call_soon_threadsafe(cancel_task))
+        try:
+            yield
+        finally:
+            active = False
+            cancel_token.remove_callback(callback)
+    
+    @staticmethod
+    def _metadata_payload(results: Dict) -> Dict:
+        """
+        写入元数据文件的内容：批量结果中每个视频的 images_metadata 已包含在顶层列表中，不再重复写入
+        
+        Args:
+            results: 爬取结果字典
+            
+        Returns:
+            写入文件的字典
+        """
+        if "videos" not in results:
+            return results
+        videos = [{key: value for key, value in video.items() if key != "images_metadata"}
+                  for video in results["videos"]]
+        return {**results, "videos": videos}
+    
+    async def _finish_cancelled(self, results: Dict, save_metadata: bool, cancel_token: CancellationToken) -> Dict:
+        """
+        任务被取消后收尾：写入已完成部分的元数据
+        
+        Args:
+            results: 已完成部分的结果字典
+            save_metadata: 是否保存元数据
+            cancel_token: 取消令牌
+            
+        Returns:
+            标记为已取消的结果字典
+        """
+        task = asyncio.current_task()
+        if task is not None and hasattr(task, 'uncancel'):
+            # 已处理取消请求，后续的写盘等待不应再被取消
+            while task.cancelling():
+                task.uncancel()
+        
+        results["cancelled"] = True
+        results["cancel_reason"] = cancel_token.reason
+        results["circuit_breakers"] = self.circuit_breakers.snapshot()
+        if self.catalog:
+            self.catalog.flush()
+        if save_metadata and results["images_metadata"]:
+            page_url = results.get('user_url') or results.get('video_url')
+            metadata_dir = self._page_dir(page_url) if page_url else self.download_dir
+            metadata_file = metadata_dir / "douyin_metadata_partial.json"
+            await self.disk_writer.write_json(metadata_file, self._metadata_payload(results))
+            logger.info("部分元数据已保存到: %s", metadata_file)
+        logger.warning("爬取已取消（%s），已下载 %s 张图片", cancel_token.reason, results["downloaded_images"])
+        return results
     
     def _validate_and_clean_url(self, url: str) -> str:
         """
@@ -114,7 +374,7 @@ class DouyinImageCrawler:
             if parsed.fragment:
                 cleaned_url += f"#{parsed.fragment}"
             
-            print(f"URL验证通过: {url} -> {cleaned_url}")
+            logger.debug("URL验证通过: %s -> %s", url, cleaned_url)
             return cleaned_url
             
         except Exception as e:
@@ -136,7 +396,7 @@ class DouyinImageCrawler:
         """
         import re
         
-        print(f"正在从文本中提取URL: {text}")
+        logger.debug("正在从文本中提取URL: %s", text)
         
         # 专门针对抖音URL的正则表达式模式
         douyin_patterns = [
@@ -159,10 +419,10 @@ class DouyinImageCrawler:
                 cleaned_match = re.sub(r'[`\'"]+$', '', match.strip())
                 try:
                     validated_url = self._validate_and_clean_url(cleaned_match)
-                    print(f"找到抖音URL: {cleaned_match} -> {validated_url}")
+                    logger.info("找到抖音URL: %s -> %s", cleaned_match, validated_url)
                     return validated_url
                 except ValueError as e:
-                    print(f"抖音URL验证失败: {cleaned_match}, 错误: {e}")
+                    logger.debug("抖音URL验证失败: %s, 错误: %s", cleaned_match, e)
                     continue
         
         # 如果没有找到抖音URL，尝试通用模式
@@ -173,17 +433,18 @@ class DouyinImageCrawler:
                 cleaned_match = re.sub(r'[`\'"]+$', '', match.strip())
                 try:
                     validated_url = self._validate_and_clean_url(cleaned_match)
-                    print(f"找到通用URL: {cleaned_match} -> {validated_url}")
+                    logger.info("找到通用URL: %s -> %s", cleaned_match, validated_url)
                     return validated_url
                 except ValueError as e:
-                    print(f"通用URL验证失败: {cleaned_match}, 错误: {e}")
+                    logger.debug("通用URL验证失败: %s, 错误: %s", cleaned_match, e)
                     continue
         
         # 如果没有找到有效URL，抛出异常
         raise ValueError(f"无法从文本中提取有效URL: {text}")
     
     async def crawl_douyin_user_images(self, user_url: str, max_images: int = 50, 
-                                     save_metadata: bool = True, use_selenium: bool = True) -> Dict:
+                                     save_metadata: bool = True, use_selenium: bool = True,
+                                     cancel_token: Optional[CancellationToken] = None) -> Dict:
         """
         爬取抖音用户主页的图片
         
@@ -192,11 +453,12 @@ class DouyinImageCrawler:
             max_images: 最大爬取图片数量
             save_metadata: 是否保存元数据
             use_selenium: 是否使用Selenium获取真实图片URL
+            cancel_token: 取消令牌，取消后中止浏览器会话和剩余下载，返回已完成部分（cancelled=True）
             
         Returns:
             包含爬取结果的字典
         """
-        print(f"开始爬取抖音用户: {user_url}")
+        logger.info("开始爬取抖音用户: %s", user_url)
         
         results = {
             "user_url": user_url,
@@ -204,62 +466,257 @@ class DouyinImageCrawler:
             "downloaded_images": 0,
             "failed_downloads": 0,
             "images_metadata": [],
-            "method_used": "selenium" if use_selenium and SELENIUM_AVAILABLE else "crawl4ai"
+            "retries": 0,
+            "circuit_breakers": {},
+            "method_used": "selenium" if use_selenium and self._selenium_usable() else "crawl4ai"
         }
         
+        token = cancel_token or CancellationToken()
+        try:
+            with self._cancel_task_on(token):
+                return await self._crawl_user_images(user_url, max_images, save_metadata, use_selenium,
+                                                     token, results)
+        except (asyncio.CancelledError, CrawlCancelled):
+            if not token.cancelled:
+                raise
+            return await self._finish_cancelled(results, save_metadata, token)
+    
+    async def _crawl_user_images(self, user_url: str, max_images: int, save_metadata: bool,
+                                 use_selenium: bool, token: CancellationToken, results: Dict) -> Dict:
+        """crawl_douyin_user_images 的主体，结果累加到传入的 results 中"""
+        backends = [BACKEND_CRAWL4AI]
+        if use_selenium and self._selenium_usable():
+            backends.insert(0, BACKEND_SELENIUM)
+        
+        if self.acquisition_mode == ACQUISITION_HEDGED and len(backends) > 1:
+            return await self._crawl_user_images_hedged(user_url, max_images, save_metadata, backends,
+                                                        token, results)
+        
         # 优先使用Selenium获取真实图片URL
-        if use_selenium and SELENIUM_AVAILABLE:
-            print("使用Selenium方法获取图片...")
+        if BACKEND_SELENIUM in backends:
+            logger.info("使用Selenium方法获取图片...")
             try:
-                # 使用Selenium获取真实图片URL
-                selenium_urls = self.get_real_image_urls_with_selenium(user_url, max_images)
+                acquired = await self._acquire_timed(BACKEND_SELENIUM, user_url, max_images, token)
                 
-                if selenium_urls:
-                    print(f"Selenium获取到 {len(selenium_urls)} 个图片URL")
-                    results["total_images"] = len(selenium_urls)
-                    
-                    # 下载Selenium获取的图片
-                    for i, img_url in enumerate(selenium_urls, 1):
-                        # 构造图片数据字典
-                        img_data = {
-                            'src': img_url,
-                            'alt': f'douyin_image_{i}',
-                            'width': 'unknown',
-                            'height': 'unknown',
-                            'score': 1.0
-                        }
-                        
-                        success = await self._download_douyin_image(img_data, user_url, i)
-                        if success:
-                            results["downloaded_images"] += 1
-                            if save_metadata:
-                                results["images_metadata"].append(img_data)
-                        else:
-                            results["failed_downloads"] += 1
-                        
-                        # 添加延迟避免被封
-                        if i % 3 == 0:  # 每3张图片后延迟
-                            self._add_random_delay(2, 4)
+                if acquired and acquired[0]:
+                    candidates, results["total_images"] = acquired
+                    logger.info("Selenium获取到 %s 个图片URL", len(candidates))
+                    await self._download_candidates(user_url, candidates, BACKEND_SELENIUM, results,
+                                                    save_metadata, token)
                     
                     # 如果Selenium成功获取到图片，直接返回结果
                     if results["downloaded_images"] > 0:
-                        print(f"Selenium方法成功下载 {results['downloaded_images']} 张图片")
-                        if save_metadata and results["images_metadata"]:
-                            metadata_file = self.download_dir / "douyin_metadata_selenium.json"
-                            with open(metadata_file, 'w', encoding='utf-8') as f:
-                                json.dump(results, f, ensure_ascii=False, indent=2)
-                            print(f"元数据已保存到: {metadata_file}")
+                        logger.info("Selenium方法成功下载 %s 张图片", results['downloaded_images'])
+                        await self._save_user_metadata(results, save_metadata, BACKEND_SELENIUM)
                         return results
                     
+            except CrawlCancelled:
+                raise
             except Exception as e:
-                print(f"Selenium方法失败: {str(e)}，回退到Crawl4AI方法")
+                logger.warning("Selenium方法失败: %s，回退到Crawl4AI方法", e)
         
         # 回退到原有的Crawl4AI方法
-        print("使用Crawl4AI方法获取图片...")
+        logger.info("使用Crawl4AI方法获取图片...")
         results["method_used"] = "crawl4ai"
         
+        try:
+            acquired = await self._acquire_timed(BACKEND_CRAWL4AI, user_url, max_images, token)
+            if acquired is None:
+                return results
+            candidates, results["total_images"] = acquired
+            await self._download_candidates(user_url, candidates, BACKEND_CRAWL4AI, results,
+                                            save_metadata, token)
+            await self._save_user_metadata(results, save_metadata, BACKEND_CRAWL4AI)
+            
+        except CrawlCancelled:
+            raise
+        except Exception as e:
+            logger.error("爬取过程中出现错误: %s", e)
+            
+        return results
+    
+    async def _crawl_user_images_hedged(self, user_url: str, max_images: int, save_metadata: bool,
+                                        backends: List[str], token: CancellationToken, results: Dict) -> Dict:
+        """对冲模式：先得到可用候选列表的后端胜出，只用胜出者的列表下载"""
+        try:
+            winner, acquired, info = await self._acquire_hedged(user_url, max_images, backends, token)
+            results["acquisition"] = info
+            if winner is None:
+                logger.warning("所有后端都未获取到候选图片: %s", user_url)
+                return results
+            
+            results["method_used"] = winner
+            candidates, results["total_images"] = acquired
+            await self._download_candidates(user_url, candidates, winner, results, save_metadata, token)
+            await self._save_user_metadata(results, save_metadata, winner)
+            
+        except CrawlCancelled:
+            raise
+        except Exception as e:
+            logger.error("爬取过程中出现错误: %s", e)
+        
+        return results
+    
+    async def _acquire_hedged(self, page_url: str, max_images: int, backends: List[str],
+                              cancel_token: CancellationToken) -> Tuple[Optional[str], Optional[Tuple], Dict]:
+        """
+        对冲获取候选图片：先启动主后端，超过延迟预算仍未返回时并行启动另一个后端，
+        先得到非空候选列表者胜出，落败者通过子取消令牌关闭浏览器并取消协程
+        
+        Args:
+            page_url: 页面URL
+            max_images: 最大图片数量
+            backends: 可用后端（默认顺序）
+            cancel_token: 任务取消令牌
+            
+        Returns:
+            (胜出后端, (候选列表, 发现数量), 获取过程信息)；都失败时胜出后端为None
+        """
+        order = self.acquisition_stats.preferred_order(backends)
+        primary = order[0]
+        delay = (self.hedge_delay if self.hedge_delay is not None
+                 else self.acquisition_stats.hedge_delay(primary, DEFAULT_HEDGE_DELAY))
+        info = {'mode': ACQUISITION_HEDGED, 'order': order, 'hedge_delay': round(delay, 3),
+                'hedged': False, 'winner': None, 'backends': {}}
+        
+        tokens = {backend: cancel_token.child() for backend in order}
+        tasks: Dict[asyncio.Future, str] = {}
+        
+        def launch(backend: str):
+            logger.info("启动 %s 获取候选图片: %s", backend, page_url)
+            task = asyncio.ensure_future(
+                self._acquire_timed(backend, page_url, max_images, tokens[backend], info['backends'])
+            )
+            tasks[task] = backend
+        
+        def usable(task: asyncio.Future) -> bool:
+            return not task.cancelled() and task.exception() is None and bool(task.result() and task.result()[0])
+        
+        winner, acquired = None, None
+        launch(primary)
+        try:
+            done, pending = await asyncio.wait(list(tasks), timeout=delay)
+            if not done:
+                logger.info("%s 超过 %.1f 秒未返回候选图片，并行启动 %s", primary, delay, order[1])
+                info['hedged'] = True
+                launch(order[1])
+            elif not usable(next(iter(done))):
+                logger.info("%s 未获取到可用的候选图片，改用 %s", primary, order[1])
+                launch(order[1])
+            
+            pending = {task for task in tasks if not task.done()}
+            finished = [task for task in tasks if task.done()]
+            while winner is None:
+                # 同时完成时按后端顺序优先
+                for task in sorted(finished, key=lambda item: order.index(tasks[item])):
+                    if usable(task):
+                        winner, acquired = tasks[task], task.result()
+                        break
+                    if not task.cancelled() and task.exception() is not None:
+                        logger.warning("%s 获取候选图片失败: %s", tasks[task], task.exception())
+                if winner is not None or not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished = list(done)
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                tokens[tasks[task]].cancel('对冲获取落败')
+                task.cancel()
+            if losers:
+                await asyncio.wait(losers)
+            for task in tasks:
+                # 取走异常，避免 "Task exception was never retrieved"
+                if task.done() and not task.cancelled():
+                    task.exception()
+        
+        if info['hedged']:
+            self.acquisition_stats.record_race(order, winner)
+            if winner:
+                ACQUISITION_WINS.inc(backend=winner)
+        info['winner'] = winner
+        if winner:
+            logger.info("候选图片由 %s 获取（%s 个）", winner, len(acquired[0]))
+        return winner, acquired, info
+    
+    async def _acquire_timed(self, backend: str, page_url: str, max_images: int,
+                             cancel_token: CancellationToken, timings: Optional[Dict] = None,
+                             on_batch: Optional[Callable[[List[str]], None]] = None) -> Optional[Tuple]:
+        """
+        调用一个后端获取候选图片，记录耗时和结果
+        
+        Args:
+            backend: selenium / crawl4ai
+            page_url: 页面URL
+            max_images: 最大图片数量
+            cancel_token: 取消令牌
+            timings: 可选，写入 {后端: {'seconds', 'outcome'}}
+            on_batch: 可选，Selenium滚动过程中以新发现的图片URL调用（见 get_real_image_urls_with_selenium）
+            
+        Returns:
+            (候选图片列表, 发现的图片数量)；页面渲染失败时返回None
+        """
+        start = time.perf_counter()
+        outcome = OUTCOME_ERROR
+        try:
+            if backend == BACKEND_SELENIUM:
+                acquired = await self._acquire_with_selenium(page_url, max_images, cancel_token, on_batch)
+            else:
+                acquired = await self._acquire_with_crawl4ai(page_url, max_images)
+            outcome = OUTCOME_USABLE if acquired and acquired[0] else OUTCOME_EMPTY
+            return acquired
+        except (asyncio.CancelledError, CrawlCancelled):
+            outcome = OUTCOME_CANCELLED
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            # Selenium被取消时关闭浏览器后返回空列表，同样按取消处理
+            if cancel_token.cancelled:
+                outcome = OUTCOME_CANCELLED
+            ACQUISITION_SECONDS.observe(elapsed, backend=backend, outcome=outcome)
+            self.acquisition_stats.record(backend, elapsed, outcome)
+            if timings is not None:
+                timings[backend] = {'seconds': round(elapsed, 3), 'outcome': outcome}
+    
+    async def _acquire_with_selenium(self, page_url: str, max_images: int, cancel_token: CancellationToken,
+                                     on_batch: Optional[Callable[[List[str]], None]] = None) -> Tuple[List[Dict], int]:
+        """
+        使用Selenium获取候选图片（在线程池中运行，不阻塞事件循环）
+        
+        Returns:
+            (候选图片列表, 发现的图片数量)
+        """
+        loop = asyncio.get_running_loop()
+        selenium_urls = await loop.run_in_executor(
+            None, self.get_real_image_urls_with_selenium, page_url, max_images, cancel_token, on_batch
+        )
+        cancel_token.raise_if_cancelled()
+        
+        candidates = [self._selenium_candidate(img_url, i) for i, img_url in enumerate(selenium_urls, 1)]
+        return candidates, len(candidates)
+    
+    @staticmethod
+    def _selenium_candidate(img_url: str, index: int) -> Dict:
+        """Selenium获取的图片URL构造为图片数据字典"""
+        return {
+            'src': img_url,
+            'alt': f'douyin_image_{index}',
+            'width': 'unknown',
+            'height': 'unknown',
+            'score': 1.0
+        }
+    
+    async def _acquire_with_crawl4ai(self, page_url: str, max_images: int) -> Optional[Tuple[List[Dict], int]]:
+        """
+        使用Crawl4AI渲染页面并过滤出候选图片
+        
+        Returns:
+            (候选图片列表, 过滤前的图片数量)；渲染失败时返回None
+        """
+        c4a = load_crawl4ai()
+        
         # 配置浏览器 - 模拟移动端
-        browser_config = BrowserConfig(
+        browser_config = c4a.BrowserConfig(
             headless=True,
             viewport_width=375,   # iPhone宽度
             viewport_height=812,  # iPhone高度
@@ -268,9 +725,9 @@ class DouyinImageCrawler:
             verbose=True
         )
         
-        # 配置爬虫
-        crawler_config = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
+        # 配置爬虫（页面结果由 self.page_cache 缓存，Crawl4AI自身缓存保持绕过）
+        crawler_config = c4a.CrawlerRunConfig(
+            cache_mode=c4a.CacheMode.BYPASS,
             exclude_external_images=False,
             wait_for="() => document.querySelectorAll('img').length > 5",  # 等待图片加载
             js_code="""
@@ -282,54 +739,229 @@ class DouyinImageCrawler:
             screenshot=False
         )
         
+        images = await self._render_page_images(page_url, browser_config, crawler_config, variant='user')
+        if images is None:
+            return None
+        
+        logger.info("发现 %s 张图片", len(images))
+        
+        # 过滤抖音相关图片（排除UI元素）
+        with time_stage('filter'):
+            douyin_images = self._filter_douyin_images(images)
+        logger.info("过滤后剩余 %s 张抖音内容图片", len(douyin_images))
+        
+        # 限制下载数量
+        if max_images > 0:
+            douyin_images = douyin_images[:max_images]
+            logger.info("限制下载数量为 %s 张", len(douyin_images))
+        return douyin_images, len(images)
+    
+    async def _download_candidates(self, page_url: str, candidates: List[Dict], method: str, results: Dict,
+                                   save_metadata: bool, cancel_token: CancellationToken, paced: bool = True):
+        """
+        依次下载候选图片，结果累加到 results
+        
+        Args:
+            page_url: 页面URL
+            candidates: 候选图片列表
+            method: 获取方式（selenium / crawl4ai），决定延迟节奏并记入元数据
+            results: 结果字典
+            save_metadata: 是否记录图片元数据
+            cancel_token: 取消令牌
+            paced: 是否按获取方式的节奏插入随机延迟
+        """
+        self._report_progress('candidates', page_url=page_url, count=len(candidates))
+        every, min_delay, max_delay = DOWNLOAD_DELAYS[method]
+        
+        for i, img in enumerate(candidates, 1):
+            cancel_token.raise_if_cancelled()
+            success = await self._download_douyin_image(img, page_url, i, method=method,
+                                                        cancel_token=cancel_token)
+            self._apply_download_result(results, img, success, save_metadata)
+            
+            # 添加延迟避免被封
+            if paced and i % every == 0:
+                self._add_random_delay(min_delay, max_delay, cancel_token)
+        
+        if self.catalog:
+            self.catalog.flush()
+        results["circuit_breakers"] = self.circuit_breakers.snapshot()
+    
+    async def _save_user_metadata(self, results: Dict, save_metadata: bool, method: str):
+        """保存用户主页爬取的元数据（文件名按获取方式区分）"""
+        if save_metadata and results["images_metadata"]:
+            metadata_file = self._page_dir(results["user_url"]) / METADATA_FILES[method]
+            await self.disk_writer.write_json(metadata_file, results)
+            logger.info("元数据已保存到: %s", metadata_file)
+    
+    async def _render_page_images(self, page_url: str, browser_config: 'BrowserConfig',
+                                  crawler_config: 'CrawlerRunConfig', variant: str) -> Optional[List[Dict]]:
+        """
+        使用Crawl4AI渲染页面并提取图片列表，按缓存模式读写页面结果缓存
+        
+        Args:
+            page_url: 页面URL
+            browser_config: 浏览器配置
+            crawler_config: 爬虫配置
+            variant: 页面类型（user / video），用于区分缓存
+            
+        Returns:
+            过滤前的原始图片列表；渲染失败时返回None
+        """
+        resolved, images = self._lookup_page_images(page_url, variant)
+        if resolved:
+            return images
+        
+        with time_stage('browser_launch'):
+            crawler = load_crawl4ai().AsyncWebCrawler(config=browser_config)
+            self._capture_crawl4ai_sessions(crawler)
+            await crawler.start()
+        try:
+            # Crawl4AI在一次arun中完成加载、滚动脚本和DOM提取
+            with time_stage('page_load'):
+                result = await crawler.arun(url=page_url, config=crawler_config)
+        finally:
+            await crawler.close()
+        
+        if not result.success:
+            logger.error("爬取失败: %s", result.error_message)
+            return None
+        
+        images = result.media.get("images", [])
+        await self._store_page_images(page_url, variant, images)
+        return images
+    
+    def _capture_crawl4ai_sessions(self, crawler: 'AsyncWebCrawler'):
+        """
+        页面加载后导出浏览器会话（Cookie、User-Agent），按请求的页面URL保存，供下载使用
+        
+        Args:
+            crawler: 尚未启动的Crawl4AI爬虫
+        """
+        async def after_goto(page, context=None, url=None, **kwargs):
+            try:
+                self.browser_sessions.put(await BrowserSession.from_playwright(page, context, url))
+            except Exception as e:
+                logger.debug("导出浏览器会话失败: %s %s", url, e)
+            return page
+        
+        crawler.crawler_strategy.set_hook('after_goto', after_goto)
+    
+    def _capture_selenium_session(self, driver, page_url: str):
+        """导出Selenium会话（Cookie、User-Agent），按页面URL保存，供下载使用"""
+        try:
+            self.browser_sessions.put(BrowserSession.from_selenium(driver, page_url))
+        except Exception as e:
+            logger.debug("导出浏览器会话失败: %s %s", page_url, e)
+    
+    def _lookup_page_images(self, page_url: str, variant: str) -> Tuple[bool, Optional[List[Dict]]]:
+        """
+        从重放fixture或页面缓存中查找页面图片列表
+        
+        Args:
+            page_url: 页面URL
+            variant: 页面类型（user / video）
+            
+        Returns:
+            (是否无需渲染, 图片列表)；无需渲染但没有结果时图片列表为None
+        """
+        if self.fixture_player:
+            images = self.fixture_player.get_page(page_url, variant)
+            if images is None:
+                logger.warning("fixture中没有该页面的录制: %s", page_url)
+            return True, images
+        
+        cached_images = self.page_cache.get(page_url, variant)
+        if cached_images is not None:
+            logger.info("页面缓存命中: %s (%s 张图片)", page_url, len(cached_images))
+            if self.fixture_recorder:
+                self.fixture_recorder.record_page(page_url, variant, cached_images)
+            return True, cached_images
+        
+        if self.page_cache.offline:
+            logger.warning("离线缓存模式下未找到页面缓存: %s", page_url)
+            return True, None
+        return False, None
+    
+    async def _store_page_images(self, page_url: str, variant: str, images: List[Dict]):
+        """渲染得到的图片列表写入录制fixture和页面缓存"""
+        if self.fixture_recorder:
+            self.fixture_recorder.record_page(page_url, variant, images)
+        if self.page_cache.writable:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.page_cache.put, page_url, images, variant)
+    
+    async def _render_pages_batch(self, page_urls: List[str], browser_config: 'BrowserConfig',
+                                  crawler_config: 'CrawlerRunConfig', variant: str,
+                                  max_concurrency: int = 4, memory_threshold_percent: float = 85.0):
+        """
+        在同一个浏览器中并发渲染多个页面（arun_many + 内存自适应调度），按完成顺序产出结果
+        
+        Args:
+            page_urls: 页面URL列表
+            browser_config: 浏览器配置
+            crawler_config: 爬虫配置
+            variant: 页面类型（user / video），用于区分缓存
+            max_concurrency: 同时渲染的最大页面数
+            memory_threshold_percent: 系统内存占用超过该比例时暂停派发新页面
+            
+        Yields:
+            (页面URL, 过滤前的原始图片列表)；渲染失败时图片列表为None
+        """
+        misses = []
+        for page_url in page_urls:
+            resolved, images = self._lookup_page_images(page_url, variant)
+            if resolved:
+                yield page_url, images
+            else:
+                misses.append(page_url)
+        if not misses:
+            return
+        
+        c4a = load_crawl4ai()
+        dispatcher = c4a.MemoryAdaptiveDispatcher(
+            memory_threshold_percent=memory_threshold_percent,
+            max_session_permit=max_concurrency
+        )
+        with time_stage('browser_launch'):
+            crawler = c4a.AsyncWebCrawler(config=browser_config)
+            self._capture_crawl4ai_sessions(crawler)
+            await crawler.start()
+        remaining = list(misses)
         try:
-            async with AsyncWebCrawler(config=browser_config) as crawler:
-                result = await crawler.arun(url=user_url, config=crawler_config)
+            # 流式返回：先渲染完的页面先开始下载，其余页面继续在浏览器中渲染
+            stream = await crawler.arun_many(urls=misses, config=crawler_config.clone(stream=True),
+                                             dispatcher=dispatcher)
+            async for result in stream:
+                page_url = result.url if result.url in remaining else remaining[0]
+                remaining.remove(page_url)
+                self._observe_render_time(result)
                 
                 if not result.success:
-                    print(f"爬取失败: {result.error_message}")
-                    return results
+                    logger.error("爬取失败: %s %s", page_url, result.error_message)
+                    yield page_url, None
+                    continue
                 
-                # 获取图片列表
                 images = result.media.get("images", [])
-                results["total_images"] = len(images)
-                
-                print(f"发现 {len(images)} 张图片")
-                
-                # 过滤抖音相关图片（排除UI元素）
-                douyin_images = self._filter_douyin_images(images)
-                print(f"过滤后剩余 {len(douyin_images)} 张抖音内容图片")
-                
-                # 限制下载数量
-                if max_images > 0:
-                    douyin_images = douyin_images[:max_images]
-                    print(f"限制下载数量为 {len(douyin_images)} 张")
-                
-                # 下载图片
-                for i, img in enumerate(douyin_images, 1):
-                    success = await self._download_douyin_image(img, user_url, i)
-                    if success:
-                        results["downloaded_images"] += 1
-                        if save_metadata:
-                            results["images_metadata"].append(img)
-                    else:
-                        results["failed_downloads"] += 1
-                    
-                    # 添加延迟避免被封
-                    if i % 5 == 0:  # 每5张图片后延迟
-                        self._add_random_delay(2, 5)
-                
-                # 保存元数据
-                if save_metadata and results["images_metadata"]:
-                    metadata_file = self.download_dir / "douyin_metadata.json"
-                    with open(metadata_file, 'w', encoding='utf-8') as f:
-                        json.dump(results, f, ensure_ascii=False, indent=2)
-                    print(f"元数据已保存到: {metadata_file}")
-                
-        except Exception as e:
-            print(f"爬取过程中出现错误: {str(e)}")
-            
-        return results
+                await self._store_page_images(page_url, variant, images)
+                yield page_url, images
+        finally:
+            await crawler.close()
+        
+        for page_url in remaining:
+            logger.warning("页面没有返回渲染结果: %s", page_url)
+            yield page_url, None
+    
+    @staticmethod
+    def _observe_render_time(result):
+        """按调度器记录的起止时间统计单个页面的渲染耗时"""
+        dispatch = getattr(result, 'dispatch_result', None)
+        if dispatch is None:
+            return
+        elapsed = dispatch.end_time - dispatch.start_time
+        if hasattr(elapsed, 'total_seconds'):
+            elapsed = elapsed.total_seconds()
+        STAGE_SECONDS.observe(max(0.0, elapsed), stage='page_load')
     
     def _filter_douyin_images(self, images: List[Dict]) -> List[Dict]:
         """
@@ -382,7 +1014,9 @@ class DouyinImageCrawler:
         
         return filtered_images
     
-    async def _download_douyin_image(self, img_data: Dict, base_url: str, index: int) -> bool:
+    async def _download_douyin_image(self, img_data: Dict, base_url: str, index: int,
+                                     method: Optional[str] = None,
+                                     cancel_token: Optional[CancellationToken] = None) -> bool:
         """
         下载抖音图片
         
@@ -390,18 +1024,28 @@ class DouyinImageCrawler:
             img_data: 图片数据字典
             base_url: 基础URL
             index: 图片索引
+            method: 图片获取方式，写入元数据目录
+            cancel_token: 取消令牌，取消时抛出 CrawlCancelled
             
         Returns:
             下载是否成功
         """
+        if self.storage is not None:
+            await self._wait_for_storage(cancel_token)
+        reserved = 0
         try:
             img_url = img_data.get('src', '')
             if not img_url:
-                print(f"图片 {index}: 缺少src属性")
+                logger.warning("图片 %s: 缺少src属性", index, extra=SAMPLED)
                 return False
             
-            # 处理抖音图片URL
+            # 处理抖音图片URL：先用浏览器加载时的带签名URL，被拒绝（403）时再用去签名的URL
+            signed_url = self._process_douyin_image_url(img_url, base_url, strip_signature=False)
             img_url = self._process_douyin_image_url(img_url, base_url)
+            if self.fixture_player and not self.fixture_player.has_response(signed_url):
+                # 较早录制的fixture中只有去签名的URL
+                signed_url = img_url
+            host = urlparse(img_url).netloc
             
             # 获取文件扩展名
             parsed_url = urlparse(img_url)
@@ -418,7 +1062,19 @@ class DouyinImageCrawler:
             else:
                 filename = f"douyin_{index:03d}_image{file_ext}"
             
-            file_path = self.download_dir / filename
+            # 每个页面保存到各自的子目录，同时下载的页面不会写同一个文件
+            file_path = self._page_dir(base_url) / filename
+            
+            # 超出存储配额时不发出请求
+            if self.storage is not None:
+                try:
+                    reserved = self.storage.reserve()
+                except QuotaExceeded as e:
+                    logger.warning("图片 %s: 跳过 - %s", index, e, extra=SAMPLED)
+                    img_data['download_error'] = str(e)
+                    img_data['failure_reason'] = 'quota_exceeded'
+                    DOWNLOAD_FAILURES.inc(host=host, reason='quota_exceeded')
+                    return False
             
             # 下载图片 - 使用抖音兼容的请求头
             headers = {
@@ -433,42 +1089,296 @@ class DouyinImageCrawler:
                 'Sec-Fetch-Site': 'cross-site'
             }
             
-            response = requests.get(img_url, headers=headers, timeout=30)
-            response.raise_for_status()
+            # 使用加载该页面的浏览器会话：相同的User-Agent，Cookie由该页面专用的连接池发送
+            http_session = None
+            browser_session = self.browser_sessions.get(base_url)
+            if browser_session is not None:
+                headers.update(browser_session.headers())
+                http_session = self.browser_sessions.http_session(base_url)
+            
+            response = await self._fetch_with_retry(
+                signed_url, headers, img_data, index, cancel_token, http_session=http_session,
+                fallback_url=img_url if img_url != signed_url else None
+            )
+            if response is None:
+                DOWNLOAD_FAILURES.inc(host=host, reason=img_data.get('failure_reason', 'error'))
+                return False
+            img_url = img_data['fetched_url']
+            
+            if self.fixture_recorder:
+                self.fixture_recorder.record_response(
+                    img_url, response.status_code, dict(response.headers), response.content
+                )
             
             # 检查内容类型
             content_type = response.headers.get('content-type', '')
             if not content_type.startswith('image/'):
-                print(f"图片 {index}: 不是有效的图片文件 (Content-Type: {content_type})")
+                logger.warning("图片 %s: 不是有效的图片文件 (Content-Type: %s)", index, content_type, extra=SAMPLED)
+                DOWNLOAD_FAILURES.inc(host=host, reason='content_type')
                 return False
             
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
+            # 保存文件（交给磁盘写入器，事件循环不等待磁盘I/O）
+            await self.disk_writer.write_bytes(file_path, response.content)
             
             file_size = len(response.content)
-            print(f"图片 {index}: 下载成功 - {filename} ({file_size} bytes)")
-            print(f"  URL: {img_url}")
-            print(f"  尺寸: {img_data.get('width', 'N/A')}x{img_data.get('height', 'N/A')}")
-            print(f"  评分: {img_data.get('score', 'N/A')}")
-            print()
+            if self.storage is not None:
+                self.storage.commit(file_path, file_size, reserved)
+                reserved = 0
+            DOWNLOADED_BYTES.inc(file_size, host=host)
+            DOWNLOADED_IMAGES.inc(host=host)
+            self._record_to_catalog(img_data, base_url, img_url, response.content, file_path, method)
+            logger.debug("图片 %s: 下载成功 - %s (%s bytes)", index, filename, file_size,
+                         extra=fields(sampled=True, url=img_url, score=img_data.get('score'),
+                                      size=f"{img_data.get('width', 'N/A')}x{img_data.get('height', 'N/A')}"))
             
             return True
             
+        except CrawlCancelled:
+            raise
+        except DiskFullError as e:
+            img_data['download_error'] = str(e)
+            img_data['failure_reason'] = 'disk_full'
+            DOWNLOAD_FAILURES.inc(host=urlparse(img_data.get('src', '')).netloc, reason='disk_full')
+            if self.storage is None:
+                self._abort_disk_full(e, cancel_token)
+            # 之后的下载先等待空间恢复（或淘汰旧文件）
+            logger.warning("图片 %s: 下载失败 - 磁盘已满", index)
+            self.storage.note_disk_full()
+            return False
         except requests.exceptions.RequestException as e:
-            print(f"图片 {index}: 下载失败 - 网络错误: {str(e)}")
+            logger.warning("图片 %s: 下载失败 - 网络错误: %s", index, e, extra=SAMPLED)
+            DOWNLOAD_FAILURES.inc(host=urlparse(img_data.get('src', '')).netloc, reason='network')
             return False
         except Exception as e:
-            print(f"图片 {index}: 下载失败 - {str(e)}")
+            logger.warning("图片 %s: 下载失败 - %s", index, e, extra=SAMPLED)
+            DOWNLOAD_FAILURES.inc(host=urlparse(img_data.get('src', '')).netloc, reason='error')
             return False
+        finally:
+            if reserved:
+                self.storage.release(reserved)
+    
+    async def _wait_for_storage(self, cancel_token: Optional[CancellationToken] = None):
+        """磁盘剩余空间不足时暂停下载，长时间未恢复则中止任务"""
+        def on_pause(paused: bool, free_bytes: int):
+            self._report_progress('storage', paused=paused, free_bytes=free_bytes)
+        
+        try:
+            await self.storage.wait_for_space(cancel_token, on_pause=on_pause)
+        except DiskFullError as e:
+            self._abort_disk_full(e, cancel_token)
+    
+    def _abort_disk_full(self, error: DiskFullError, cancel_token: Optional[CancellationToken] = None):
+        """磁盘已满时中止整个任务，不再逐张请求无法保存的图片"""
+        logger.error("磁盘空间不足，中止任务: %s", error)
+        if cancel_token is None:
+            raise error
+        cancel_token.cancel(DISK_FULL_REASON)
+        raise CrawlCancelled(cancel_token.reason)
+    
+    def _http_get(self, url: str, headers: Dict, http_session: Optional[requests.Session] = None) -> requests.Response:
+        """
+        通过连接池请求URL，并记录DNS/建连/首字节/传输各阶段耗时
+        
+        Args:
+            url: 请求URL
+            headers: 请求头
+            http_session: 使用的连接池，默认为共享连接池
+            
+        Returns:
+            已读取完响应体的响应
+        """
+        reset_connection_timing()
+        start = time.perf_counter()
+        response = (http_session or self.http_session).get(url, headers=headers, timeout=30, stream=True)
+        headers_done = time.perf_counter()
+        try:
+            response.content  # 读取响应体
+        finally:
+            response.close()
+        
+        dns = connection_timing.dns
+        connect = connection_timing.connect
+        if dns is not None:
+            IMAGE_PHASE_SECONDS.observe(dns, phase='dns')
+        if connect is not None:
+            IMAGE_PHASE_SECONDS.observe(connect, phase='connect')
+        IMAGE_PHASE_SECONDS.observe(
+            max(0.0, headers_done - start - (dns or 0) - (connect or 0)), phase='ttfb'
+        )
+        IMAGE_PHASE_SECONDS.observe(time.perf_counter() - headers_done, phase='transfer')
+        return response
+    
+    async def _fetch_with_retry(self, img_url: str, headers: Dict, img_data: Dict, index: int,
+                                cancel_token: Optional[CancellationToken] = None,
+                                http_session: Optional[requests.Session] = None,
+                                fallback_url: Optional[str] = None) -> Optional[requests.Response]:
+        """
+        按重试策略请求图片，并在域名熔断器打开时快速失败
+        
+        请求在线程池中执行，事件循环不被阻塞，协程被取消时不再等待进行中的请求
+        
+        Args:
+            img_url: 图片URL
+            headers: 请求头
+            img_data: 图片数据字典（写回重试次数、失败原因和实际成功的URL fetched_url）
+            index: 图片索引
+            cancel_token: 取消令牌，重试退避期间取消会立即抛出 CrawlCancelled
+            http_session: 使用的连接池（带浏览器Cookie），默认为共享连接池
+            fallback_url: 可选，img_url 返回403时在同一次尝试中改用的URL（去签名的地址），
+                之后的重试都使用该URL
+            
+        Returns:
+            成功的响应；不可重试的失败、重试耗尽或熔断时返回None
+        """
+        policy = self.retry_policy
+        breaker = self.circuit_breakers.get(urlparse(img_url).netloc)
+        img_data['retries'] = 0
+        loop = asyncio.get_running_loop()
+        
+        for attempt in range(policy.max_retries + 1):
+            if not breaker.allow():
+                logger.warning("图片 %s: 域名 %s 熔断中，跳过下载", index, breaker.host, extra=SAMPLED)
+                img_data['download_error'] = 'circuit_open'
+                img_data['failure_reason'] = 'circuit_open'
+                return None
+            
+            retry_after = None
+            recorded = False
+            try:
+                request_url = self.fixture_player.rewrite_url(img_url) if self.fixture_player else img_url
+                response = await loop.run_in_executor(None, self._http_get, request_url, headers, http_session)
+                if response.status_code == 403 and fallback_url:
+                    # 签名过期或与会话不匹配，与域名健康无关：在同一次尝试中改用去签名的URL
+                    logger.info("图片 %s: 带签名的URL被拒绝，改用去签名的URL", index, extra=SAMPLED)
+                    SIGNED_URL_FALLBACKS.inc(host=breaker.host)
+                    img_data['signature_fallback'] = True
+                    img_url, fallback_url = fallback_url, None
+                    request_url = self.fixture_player.rewrite_url(img_url) if self.fixture_player else img_url
+                    response = await loop.run_in_executor(None, self._http_get, request_url, headers, http_session)
+                if not policy.should_retry_status(response.status_code):
+                    response.raise_for_status()
+                    breaker.record_success()
+                    recorded = True
+                    img_data['fetched_url'] = img_url
+                    return response
+                error = f"HTTP {response.status_code}"
+                reason = f"http_{response.status_code}"
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                breaker.record_failure()
+                recorded = True
+            except requests.exceptions.HTTPError as e:
+                # 不可重试的状态码（如404）与域名健康无关，说明域名能正常响应
+                breaker.record_success()
+                recorded = True
+                logger.warning("图片 %s: 下载失败 - %s", index, e, extra=SAMPLED)
+                img_data['download_error'] = str(e)
+                img_data['failure_reason'] = f"http_{e.response.status_code}" if e.response is not None else 'http'
+                return None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                breaker.record_failure()
+                recorded = True
+                error = f"{type(e).__name__}: {str(e)}"
+                reason = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'connection'
+            except requests.exceptions.RequestException:
+                # 其他请求错误（如重定向过多）计为失败，由调用方记录
+                breaker.record_failure()
+                recorded = True
+                raise
+            finally:
+                if not recorded:
+                    # 请求被取消或出现意外错误：释放试探名额，否则半开的熔断器不再放行任何请求
+                    breaker.release_probe()
+            
+            img_data['download_error'] = error
+            img_data['failure_reason'] = reason
+            if attempt >= policy.max_retries:
+                logger.warning("图片 %s: 重试 %s 次后仍失败 - %s", index, attempt, error, extra=SAMPLED)
+                return None
+            
+            delay = policy.compute_delay(attempt + 1, retry_after)
+            img_data['retries'] += 1
+            DOWNLOAD_RETRIES.inc(host=breaker.host)
+            logger.info("图片 %s: %s，%.1f 秒后第 %s 次重试", index, error, delay, attempt + 1, extra=SAMPLED)
+            if cancel_token is None:
+                await asyncio.sleep(delay)
+            elif await cancel_token.sleep(delay):
+                raise CrawlCancelled(cancel_token.reason)
+        
+        return None
+    
+    def _apply_download_result(self, results: Dict, img_data: Dict, success: bool, save_metadata: bool):
+        """
+        将单张图片的下载结果累加到结果字典
+        
+        Args:
+            results: 爬取结果字典
+            img_data: 图片数据字典
+            success: 是否下载成功
+            save_metadata: 是否保存元数据
+        """
+        results["retries"] += img_data.get('retries', 0)
+        if success:
+            results["downloaded_images"] += 1
+            if save_metadata:
+                results["images_metadata"].append(img_data)
+        else:
+            results["failed_downloads"] += 1
+        self._report_progress(
+            'image',
+            page_url=results.get('user_url') or results.get('video_url'),
+            success=success,
+            bytes=img_data.get('file_size', 0) if success else 0,
+            retries=img_data.get('retries', 0)
+        )
     
-    def _process_douyin_image_url(self, img_url: str, base_url: str) -> str:
+    def _record_to_catalog(self, img_data: Dict, source_url: str, img_url: str,
+                           content: bytes, file_path: Path, method: Optional[str]):
+        """
+        将下载成功的图片记录到元数据目录，同时把哈希和路径写回图片数据字典
+        
+        Args:
+            img_data: 图片数据字典
+            source_url: 来源页面URL
+            img_url: 实际下载的图片URL
+            content: 图片内容
+            file_path: 本地保存路径
+            method: 图片获取方式
+        """
+        content_hash = hashlib.sha256(content).hexdigest()
+        width, height = probe_image_size(content)
+        
+        img_data['content_hash'] = content_hash
+        img_data['local_path'] = str(file_path)
+        img_data['file_size'] = len(content)
+        if width and height:
+            img_data['actual_width'] = width
+            img_data['actual_height'] = height
+        
+        if not self.catalog:
+            return
+        
+        try:
+            self.catalog.add_image(
+                source_url=source_url,
+                image_url=img_url,
+                content_hash=content_hash,
+                width=width,
+                height=height,
+                file_path=str(file_path.absolute()),
+                file_size=len(content),
+                method=method
+            )
+        except Exception as e:
+            logger.error("写入元数据目录失败: %s", e)
+    
+    def _process_douyin_image_url(self, img_url: str, base_url: str, strip_signature: bool = True) -> str:
         """
         处理抖音图片URL，确保可以正常访问
         
         Args:
             img_url: 原始图片URL
             base_url: 基础URL
+            strip_signature: 是否移除签名相关参数（x-expires / x-signature / x-tt-token）
             
         Returns:
             处理后的图片URL
@@ -482,7 +1392,7 @@ class DouyinImageCrawler:
             img_url = urljoin(base_url, img_url)
         
         # 处理抖音CDN URL参数
-        if 'douyin.com' in img_url or 'bytedance.com' in img_url:
+        if strip_signature and ('douyin.com' in img_url or 'bytedance.com' in img_url):
             # 移除可能导致403的参数
             parsed = urlparse(img_url)
             query_params = parse_qs(parsed.query)
@@ -502,38 +1412,158 @@ class DouyinImageCrawler:
         
         return img_url
     
-    def get_real_image_urls_with_selenium(self, page_url: str, max_images: int = 20) -> List[str]:
+    def get_real_image_urls_with_selenium(self, page_url: str, max_images: int = 20,
+                                          cancel_token: Optional[CancellationToken] = None,
+                                          on_batch: Optional[Callable[[List[str]], None]] = None) -> List[str]:
         """
         使用Selenium获取真实的图片URL
         
         Args:
             page_url: 页面URL
             max_images: 最大获取图片数量
+            cancel_token: 取消令牌，取消时立即关闭浏览器会话（进行中的页面加载会抛出异常）
+            on_batch: 可选，页面加载后和每次滚动后以新发现的图片URL调用（在本线程中），
+                使下载可以在滚动结束前开始；返回值中包含所有已报告的URL
             
         Returns:
             图片URL列表
         """
+        reported: List[str] = []
+        
+        def report(urls: List[str]):
+            if on_batch is None:
+                return
+            new_urls = [url for url in urls if url not in reported][:max(0, max_images - len(reported))]
+            if new_urls:
+                reported.extend(new_urls)
+                on_batch(new_urls)
+        
+        # 重放模式：使用录制的元素属性快照，不启动浏览器
+        if self.fixture_player:
+            img_elements = self.fixture_player.get_selenium_elements(page_url)
+            if img_elements is None:
+                logger.warning("fixture中没有该页面的Selenium录制: %s", page_url)
+                return []
+            image_urls = self._collect_selenium_image_urls(img_elements, page_url, max_images)
+            report(image_urls)
+            return image_urls
+        
         if not SELENIUM_AVAILABLE:
-            print("错误: Selenium未安装，无法使用此功能")
+            logger.error("错误: Selenium未安装，无法使用此功能")
             return []
         
         # 验证和清理URL
         try:
             validated_url = self._validate_and_clean_url(page_url)
-            print(f"使用Selenium获取真实图片URL: {validated_url}")
+            logger.info("使用Selenium获取真实图片URL: %s", validated_url)
         except ValueError as e:
-            print(f"URL验证失败: {e}")
+            logger.warning("URL验证失败: %s", e)
             # 尝试从文本中提取有效URL
             try:
                 validated_url = self._extract_valid_url_from_text(page_url)
-                print(f"从文本中提取到有效URL: {validated_url}")
+                logger.info("从文本中提取到有效URL: %s", validated_url)
             except ValueError as extract_error:
-                print(f"无法提取有效URL: {extract_error}")
+                logger.error("无法提取有效URL: %s", extract_error)
                 return []
         
-        # 配置Chrome选项
-        chrome_options = Options()
-        chrome_options.binary_location = os.path.join(os.getcwd(), 'GoogleChromePortable', 'App', 'Chrome-bin', 'chrome.exe')
+        sel = load_selenium()
+        driver = None
+        image_urls = []
+        quit_callback = None
+        
+        try:
+            with time_stage('browser_launch'):
+                driver = self._create_chrome_driver(self._build_chrome_options())
+            if cancel_token is not None:
+                quit_callback = cancel_token.add_callback(driver.quit)
+                cancel_token.raise_if_cancelled()
+            driver.set_page_load_timeout(30)
+            
+            with time_stage('page_load'):
+                # 访问页面 - 使用验证后的URL
+                driver.get(validated_url)
+                
+                # 等待页面加载
+                sel.WebDriverWait(driver, 10).until(
+                    sel.EC.presence_of_element_located((sel.By.TAG_NAME, "img"))
+                )
+            # 流式模式下下载随即开始，先导出会话
+            self._capture_selenium_session(driver, page_url)
+            if on_batch is not None:
+                report(self._collect_selenium_image_urls(
+                    driver.find_elements(sel.By.TAG_NAME, "img"), page_url, max_images))
+            
+            # 模拟滚动加载更多内容
+            with time_stage('scroll'):
+                for i in range(3):
+                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                    if cancel_token is not None:
+                        if cancel_token.wait(2):
+                            cancel_token.raise_if_cancelled()
+                    else:
+                        time.sleep(2)
+                    
+                    # 等待新内容加载
+                    try:
+                        sel.WebDriverWait(driver, 5).until(
+                            lambda d: len(d.find_elements(sel.By.TAG_NAME, "img")) > i * 5
+                        )
+                    except sel.TimeoutException:
+                        pass
+                    
+                    # 流式模式：每次滚动后把新出现的图片交给下载阶段
+                    if on_batch is not None and len(reported) < max_images:
+                        report(self._collect_selenium_image_urls(
+                            driver.find_elements(sel.By.TAG_NAME, "img"), page_url, max_images))
+            
+            with time_stage('dom_extract'):
+                # 获取所有图片元素
+                img_elements = driver.find_elements(sel.By.TAG_NAME, "img")
+                logger.info("找到 %s 个图片元素", len(img_elements))
+                
+                # 录制模式：保存元素属性快照，后续提取直接使用快照
+                if self.fixture_recorder:
+                    img_elements = self._snapshot_selenium_elements(img_elements)
+                    self.fixture_recorder.record_page(
+                        page_url, 'selenium', [element.attributes for element in img_elements]
+                    )
+                
+                # 提取图片URL
+                image_urls = self._collect_selenium_image_urls(img_elements, page_url, max_images)
+                # 滚动过程中可能设置了新的Cookie，下载前更新会话
+                self._capture_selenium_session(driver, page_url)
+                report(image_urls)
+            
+        except sel.TimeoutException:
+            logger.warning("页面加载超时")
+        except Exception as e:
+            if cancel_token is not None and cancel_token.cancelled:
+                logger.info("Selenium会话已因取消而关闭")
+            else:
+                logger.error("Selenium获取图片URL时出错: %s", e)
+        finally:
+            if quit_callback is not None:
+                cancel_token.remove_callback(quit_callback)
+            if driver:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass  # 取消时会话可能已被关闭
+        
+        # 流式模式下以已报告的URL为准（出错前报告的URL可能已开始下载）
+        return list(reported) if on_batch is not None else image_urls
+    
+    def _build_chrome_options(self) -> 'Options':
+        """
+        构建Chrome选项（无头、移动端模拟）
+        
+        Returns:
+            Chrome选项
+        """
+        chrome_options = load_selenium().Options()
+        portable_chrome = os.path.join(os.getcwd(), 'GoogleChromePortable', 'App', 'Chrome-bin', 'chrome.exe')
+        if os.path.exists(portable_chrome):
+            chrome_options.binary_location = portable_chrome
         chrome_options.add_argument('--headless')  # 无头模式
         chrome_options.add_argument('--no-sandbox')
         chrome_options.add_argument('--disable-dev-shm-usage')
@@ -556,98 +1586,96 @@ class DouyinImageCrawler:
             "userAgent": user_agent
         }
         chrome_options.add_experimental_option("mobileEmulation", mobile_emulation)
+        return chrome_options
+    
+    def _create_chrome_driver(self, chrome_options: 'Options'):
+        """
+        创建Chrome WebDriver（本地ChromeDriver -> 系统PATH -> Selenium Manager）
         
-        driver = None
-        image_urls = []
+        Args:
+            chrome_options: Chrome选项
+            
+        Returns:
+            WebDriver实例
+        """
+        # 设置ChromeDriver路径 - 修复路径问题
+        chromedriver_path = os.path.join(os.getcwd(), 'chromedriver', 'chromedriver-win64 (1)', 'chromedriver-win64', 'chromedriver.exe')
+        
+        sel = load_selenium()
         
+        # 创建WebDriver实例
+        if os.path.exists(chromedriver_path):
+            logger.info("使用本地ChromeDriver: %s", chromedriver_path)
+            service = sel.Service(chromedriver_path)
+            return sel.webdriver.Chrome(service=service, options=chrome_options)
+        
+        logger.warning("本地ChromeDriver不存在: %s", chromedriver_path)
+        logger.info("尝试使用系统PATH中的chromedriver...")
         try:
-            # 设置ChromeDriver路径 - 修复路径问题
-            chromedriver_path = os.path.join(os.getcwd(), 'chromedriver', 'chromedriver-win64 (1)', 'chromedriver-win64', 'chromedriver.exe')
-            
-            # 创建WebDriver实例
-            if os.path.exists(chromedriver_path):
-                print(f"使用本地ChromeDriver: {chromedriver_path}")
-                service = Service(chromedriver_path)
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-            else:
-                print(f"本地ChromeDriver不存在: {chromedriver_path}")
-                print("尝试使用系统PATH中的chromedriver...")
-                try:
-                    # 如果本地路径不存在，使用系统PATH中的chromedriver
-                    driver = webdriver.Chrome(options=chrome_options)
-                except Exception as path_error:
-                    print(f"系统PATH中也找不到ChromeDriver: {str(path_error)}")
-                    # 尝试使用Selenium Manager自动下载
-                    print("尝试使用Selenium Manager自动管理ChromeDriver...")
-                    from selenium.webdriver.chrome.service import Service as ChromeService
-                    service = ChromeService()
-                    driver = webdriver.Chrome(service=service, options=chrome_options)
-            
-            driver.set_page_load_timeout(30)
-            
-            # 访问页面 - 使用验证后的URL
-            driver.get(validated_url)
-            
-            # 等待页面加载
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "img"))
-            )
+            # 如果本地路径不存在，使用系统PATH中的chromedriver
+            return sel.webdriver.Chrome(options=chrome_options)
+        except Exception as path_error:
+            logger.warning("系统PATH中也找不到ChromeDriver: %s", path_error)
+            # 尝试使用Selenium Manager自动下载
+            logger.info("尝试使用Selenium Manager自动管理ChromeDriver...")
+            service = sel.Service()
+            return sel.webdriver.Chrome(service=service, options=chrome_options)
+    
+    def _collect_selenium_image_urls(self, img_elements: List, page_url: str, max_images: int) -> List[str]:
+        """
+        从图片元素中提取有效的图片URL
+        
+        Args:
+            img_elements: 图片元素列表（WebElement或属性快照）
+            page_url: 页面URL
+            max_images: 最大获取图片数量
             
-            # 模拟滚动加载更多内容
-            for i in range(3):
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
+        Returns:
+            图片URL列表
+        """
+        image_urls = []
+        for img in img_elements:
+            try:
+                # 获取src属性
+                src = img.get_attribute('src')
+                if not src:
+                    # 尝试获取data-src属性（懒加载）
+                    src = img.get_attribute('data-src')
+                if not src:
+                    # 尝试获取data-original属性
+                    src = img.get_attribute('data-original')
                 
-                # 等待新内容加载
-                try:
-                    WebDriverWait(driver, 5).until(
-                        lambda d: len(d.find_elements(By.TAG_NAME, "img")) > i * 5
-                    )
-                except TimeoutException:
-                    pass
-            
-            # 获取所有图片元素
-            img_elements = driver.find_elements(By.TAG_NAME, "img")
-            print(f"找到 {len(img_elements)} 个图片元素")
-            
-            # 提取图片URL
-            for img in img_elements:
-                try:
-                    # 获取src属性
-                    src = img.get_attribute('src')
-                    if not src:
-                        # 尝试获取data-src属性（懒加载）
-                        src = img.get_attribute('data-src')
-                    if not src:
-                        # 尝试获取data-original属性
-                        src = img.get_attribute('data-original')
-                    
-                    if src and self._is_valid_douyin_image(src, img):
-                        # 处理URL
-                        processed_url = self._process_douyin_image_url(src, page_url)
-                        if processed_url not in image_urls:
-                            image_urls.append(processed_url)
-                            print(f"获取到图片URL: {processed_url}")
+                if src and self._is_valid_douyin_image(src, img):
+                    # 处理URL
+                    # 保留签名参数，下载时优先使用浏览器实际加载的带签名URL
+                    processed_url = self._process_douyin_image_url(src, page_url, strip_signature=False)
+                    if processed_url not in image_urls:
+                        image_urls.append(processed_url)
+                        logger.debug("获取到图片URL: %s", processed_url, extra=SAMPLED)
+                        
+                        if len(image_urls) >= max_images:
+                            break
                             
-                            if len(image_urls) >= max_images:
-                                break
-                                
-                except Exception as e:
-                    print(f"处理图片元素时出错: {str(e)}")
-                    continue
-            
-            print(f"成功获取 {len(image_urls)} 个有效图片URL")
-            
-        except TimeoutException:
-            print("页面加载超时")
-        except Exception as e:
-            print(f"Selenium获取图片URL时出错: {str(e)}")
-        finally:
-            if driver:
-                driver.quit()
+            except Exception as e:
+                logger.debug("处理图片元素时出错: %s", e, extra=SAMPLED)
+                continue
         
+        logger.info("成功获取 %s 个有效图片URL", len(image_urls))
         return image_urls
     
+    def _snapshot_selenium_elements(self, img_elements: List) -> List[FixtureElement]:
+        """读取图片元素的相关属性，生成可序列化的快照"""
+        snapshots = []
+        for img in img_elements:
+            try:
+                snapshots.append(FixtureElement({
+                    name: img.get_attribute(name)
+                    for name in ('src', 'data-src', 'data-original', 'width', 'height')
+                }))
+            except Exception as e:
+                logger.debug("读取图片元素属性时出错: %s", e, extra=SAMPLED)
+        return snapshots
+    
     def _is_valid_douyin_image(self, src: str, img_element) -> bool:
         """
         判断是否为有效的抖音图片
@@ -686,20 +1714,11 @@ class DouyinImageCrawler:
         
         return any(indicator in src.lower() for indicator in douyin_indicators)
     
-    async def crawl_douyin_video_images(self, video_url: str, save_metadata: bool = True) -> Dict:
-        """
-        爬取单个抖音视频的图片（封面等）
-        
-        Args:
-            video_url: 抖音视频URL
-            save_metadata: 是否保存元数据
-            
-        Returns:
-            包含爬取结果的字典
-        """
-        print(f"开始爬取抖音视频: {video_url}")
+    def _video_render_configs(self) -> Tuple['BrowserConfig', 'CrawlerRunConfig']:
+        """视频页面的浏览器配置和爬虫配置"""
+        c4a = load_crawl4ai()
         
-        browser_config = BrowserConfig(
+        browser_config = c4a.BrowserConfig(
             headless=True,
             viewport_width=375,
             viewport_height=812,
@@ -707,53 +1726,155 @@ class DouyinImageCrawler:
             java_script_enabled=True
         )
         
-        crawler_config = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
+        crawler_config = c4a.CrawlerRunConfig(
+            cache_mode=c4a.CacheMode.BYPASS,
             exclude_external_images=False,
             wait_for="() => document.querySelector('video') !== null",
             screenshot=False
         )
-        
-        results = {
+        return browser_config, crawler_config
+    
+    @staticmethod
+    def _new_video_results(video_url: str) -> Dict:
+        """单个视频的结果字典"""
+        return {
             "video_url": video_url,
             "total_images": 0,
             "downloaded_images": 0,
             "failed_downloads": 0,
-            "images_metadata": []
+            "images_metadata": [],
+            "retries": 0,
+            "circuit_breakers": {}
         }
+    
+    @staticmethod
+    def _filter_video_images(images: List[Dict]) -> List[Dict]:
+        """过滤视频页面的封面/帧图片（降低要求，只排除小图标）"""
+        return [img for img in images if
+                (img.get('width') or 0) > 50 and (img.get('height') or 0) > 50]
+    
+    async def crawl_douyin_video_images(self, video_url: str, save_metadata: bool = True,
+                                        cancel_token: Optional[CancellationToken] = None) -> Dict:
+        """
+        爬取单个抖音视频的图片（封面等）
         
+        Args:
+            video_url: 抖音视频URL
+            save_metadata: 是否保存元数据
+            cancel_token: 取消令牌
+            
+        Returns:
+            包含爬取结果的字典
+        """
+        logger.info("开始爬取抖音视频: %s", video_url)
+        browser_config, crawler_config = self._video_render_configs()
+        results = self._new_video_results(video_url)
+        
+        token = cancel_token or CancellationToken()
         try:
-            async with AsyncWebCrawler(config=browser_config) as crawler:
-                result = await crawler.arun(url=video_url, config=crawler_config)
-                
-                if not result.success:
-                    print(f"爬取失败: {result.error_message}")
+            with self._cancel_task_on(token):
+                images = await self._render_page_images(video_url, browser_config, crawler_config, variant='video')
+                if images is None:
                     return results
                 
-                images = result.media.get("images", [])
                 results["total_images"] = len(images)
+                await self._download_candidates(video_url, self._filter_video_images(images), BACKEND_CRAWL4AI,
+                                                results, save_metadata, token, paced=False)
                 
-                # 过滤视频相关图片（降低要求）
-                video_images = [img for img in images if 
-                              (img.get('width') or 0) > 50 and (img.get('height') or 0) > 50]
+                if save_metadata and results["images_metadata"]:
+                    metadata_file = self._page_dir(video_url) / "video_metadata.json"
+                    await self.disk_writer.write_json(metadata_file, results)
                 
-                for i, img in enumerate(video_images, 1):
-                    success = await self._download_douyin_image(img, video_url, i)
-                    if success:
-                        results["downloaded_images"] += 1
-                        if save_metadata:
-                            results["images_metadata"].append(img)
-                    else:
-                        results["failed_downloads"] += 1
+        except (asyncio.CancelledError, CrawlCancelled):
+            if not token.cancelled:
+                raise
+            return await self._finish_cancelled(results, save_metadata, token)
+        except Exception as e:
+            logger.error("爬取过程中出现错误: %s", e)
+        
+        return results
+    
+    async def crawl_douyin_video_images_batch(self, video_urls: List[str], save_metadata: bool = True,
+                                              max_concurrency: int = 4, memory_threshold_percent: float = 85.0,
+                                              cancel_token: Optional[CancellationToken] = None) -> Dict:
+        """
+        批量爬取抖音视频的图片：在同一个浏览器中并发渲染视频页面，
+        先渲染完成的页面先进入下载，其余页面继续渲染
+        
+        Args:
+            video_urls: 抖音视频URL列表
+            save_metadata: 是否保存元数据
+            max_concurrency: 同时渲染的最大页面数
+            memory_threshold_percent: 系统内存占用超过该比例时暂停派发新页面
+            cancel_token: 取消令牌
+            
+        Returns:
+            汇总结果字典，videos 为每个视频的结果（按完成顺序）
+        """
+        video_urls = list(dict.fromkeys(video_urls))
+        logger.info("开始批量爬取 %s 个抖音视频（最多同时渲染 %s 个页面）", len(video_urls), max_concurrency)
+        results = {
+            "video_urls": video_urls,
+            "total_images": 0,
+            "downloaded_images": 0,
+            "failed_downloads": 0,
+            "images_metadata": [],
+            "retries": 0,
+            "circuit_breakers": {},
+            "method_used": BACKEND_CRAWL4AI,
+            "videos": []
+        }
+        if not video_urls:
+            return results
+        
+        def merge(video_results: Dict):
+            for key in ("total_images", "downloaded_images", "failed_downloads", "retries"):
+                results[key] += video_results[key]
+            results["images_metadata"].extend(video_results["images_metadata"])
+            # 保留每个视频自己的 images_metadata，供按URL查看结果；写元数据文件时去掉以免重复
+            results["videos"].append({key: value for key, value in video_results.items()
+                                      if key != "circuit_breakers"})
+        
+        token = cancel_token or CancellationToken()
+        current = None
+        try:
+            with self._cancel_task_on(token):
+                browser_config, crawler_config = self._video_render_configs()
+                pages = self._render_pages_batch(video_urls, browser_config, crawler_config, 'video',
+                                                 max_concurrency, memory_threshold_percent)
+                # aclosing 保证取消或出错时浏览器被关闭
+                async with aclosing(pages):
+                    async for video_url, images in pages:
+                        token.raise_if_cancelled()
+                        current = self._new_video_results(video_url)
+                        if images is None:
+                            current["error"] = "页面渲染失败"
+                        else:
+                            current["total_images"] = len(images)
+                            await self._download_candidates(video_url, self._filter_video_images(images),
+                                                            BACKEND_CRAWL4AI, current, save_metadata, token,
+                                                            paced=False)
+                        merge(current)
+                        current = None
+                        self._report_progress('page_done', page_url=video_url)
                 
+                results["circuit_breakers"] = self.circuit_breakers.snapshot()
                 if save_metadata and results["images_metadata"]:
-                    metadata_file = self.download_dir / f"video_metadata_{int(time.time())}.json"
-                    with open(metadata_file, 'w', encoding='utf-8') as f:
-                        json.dump(results, f, ensure_ascii=False, indent=2)
+                    metadata_file = self.download_dir / f"video_batch_metadata_{int(time.time())}.json"
+                    await self.disk_writer.write_json(metadata_file, self._metadata_payload(results))
+                    logger.info("元数据已保存到: %s", metadata_file)
                 
+        except (asyncio.CancelledError, CrawlCancelled):
+            if not token.cancelled:
+                raise
+            if current is not None:
+                merge(current)
+            return await self._finish_cancelled(results, save_metadata, token)
         except Exception as e:
-            print(f"爬取过程中出现错误: {str(e)}")
+            logger.error("批量爬取过程中出现错误: %s", e)
+            results["error"] = str(e)
         
+        logger.info("批量爬取完成: %s 个视频，下载 %s 张图片", len(results["videos"]), results["downloaded_images"])
         return results
     
     def print_summary(self, results: Dict):
@@ -766,10 +1887,15 @@ class DouyinImageCrawler:
         print("\n" + "="*60)
         print("抖音图片爬取结果摘要")
         print("="*60)
-        print(f"目标URL: {results.get('user_url') or results.get('video_url')}")
+        print(f"目标URL: {results.get('user_url') or results.get('video_url') or ', '.join(results.get('video_urls', []))}")
         print(f"发现图片总数: {results['total_images']}")
         print(f"成功下载: {results['downloaded_images']}")
         print(f"下载失败: {results['failed_downloads']}")
+        print(f"重试次数: {results.get('retries', 0)}")
+        open_hosts = [host for host, state in results.get('circuit_breakers', {}).items()
+                      if state['state'] != 'closed']
+        if open_hosts:
+            print(f"熔断中的域名: {', '.join(open_hosts)}")
         print(f"下载目录: {self.download_dir.absolute()}")
         print("="*60)
 
@@ -779,12 +1905,27 @@ async def main():
     """
     主函数 - 抖音图片爬虫示例
     """
+    parser = argparse.ArgumentParser(description='抖音图片爬虫 - 基于Crawl4AI')
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=None,
+                        help='性能剖析模式：cprofile（确定性）或 sampling（低开销采样）')
+    parser.add_argument('--profile-interval', type=float, default=0.01, help='采样间隔（秒）')
+    parser.add_argument('--log-level', default='INFO', help='日志级别')
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
     print("抖音图片爬虫 - 基于Crawl4AI")
 
     print()
     
     # 创建抖音图片爬虫实例
     crawler = DouyinImageCrawler(download_dir="douyin_images")
+    
+    # 性能剖析：产物保存在下载目录中（采样包含线程池中的请求、Selenium会话和写盘）
+    profiler = None
+    if args.profile:
+        profiler = JobProfiler(str(crawler.download_dir), time.strftime('%Y%m%d_%H%M%S'),
+                               args.profile, interval=args.profile_interval, all_threads=True)
+        profiler.start()
 
 
     txt_path = r"C:\Users\qing\Desktop\爬虫_数据集\bug\lins.txt"  # 使用原始字符串避免转义问题
@@ -804,21 +1945,26 @@ async def main():
         
         crawler.print_summary(results)
     
-    # 示例2: 爬取单个视频图片
+    # 示例2: 批量爬取视频图片（同一浏览器中并发渲染）
     video_urls = [
 
     ]
     
-    for video_url in video_urls:
-        print(f"\n开始处理视频: {video_url}")
+    if video_urls:
+        print(f"\n开始批量处理 {len(video_urls)} 个视频")
         
-        results = await crawler.crawl_douyin_video_images(
-            video_url=video_url,
-            save_metadata=True
+        results = await crawler.crawl_douyin_video_images_batch(
+            video_urls=video_urls,
+            save_metadata=True,
+            max_concurrency=4
         )
         
         crawler.print_summary(results)
     
+    if profiler:
+        for kind, path in profiler.stop().items():
+            print(f"剖析结果({kind}): {path}")
+    crawler.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 图片元数据目录
+基于SQLite的索引目录，记录每张已下载图片的来源、哈希、尺寸和保存路径
+"""
+
+import sqlite3
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+# 规范化图片URL时需要移除的签名/时效参数
+VOLATILE_QUERY_PARAMS = {'x-expires', 'x-signature', 'x-tt-token'}
+
+CATALOG_COLUMNS = [
+    'id', 'source_url', 'image_url', 'original_url', 'content_hash',
+    'width', 'height', 'file_path', 'file_size', 'method', 'crawl_time'
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_url TEXT NOT NULL,
+    image_url TEXT NOT NULL,
+    original_url TEXT,
+    content_hash TEXT,
+    width INTEGER,
+    height INTEGER,
+    file_path TEXT,
+    file_size INTEGER,
+    method TEXT,
+    crawl_time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_source_url ON images(source_url);
+CREATE INDEX IF NOT EXISTS idx_images_image_url ON images(image_url);
+CREATE INDEX IF NOT EXISTS idx_images_content_hash ON images(content_hash);
+CREATE INDEX IF NOT EXISTS idx_images_crawl_time ON images(crawl_time);
+"""
+
+# 同一来源页面的同一张图片只保留一条记录（重复爬取时更新）
+UNIQUE_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_images_source_image ON images(source_url, image_url)"
+
+
+def normalize_image_url(img_url: str) -> str:
+    """
+    规范化图片URL，使同一张图片的不同签名链接映射到同一个键
+
+    Args:
+        img_url: 图片URL
+
+    Returns:
+        规范化后的URL（小写协议和域名、去除签名参数、参数排序、去除片段）
+    """
+    if not img_url:
+        return ''
+
+    parsed = urlparse(img_url.strip())
+    scheme = (parsed.scheme or 'https').lower()
+    netloc = parsed.netloc.lower()
+
+    query_params = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in VOLATILE_QUERY_PARAMS
+    ]
+    query_params.sort()
+
+    normalized = f"{scheme}://{netloc}{parsed.path}"
+    if query_params:
+        normalized += '?' + urlencode(query_params)
+    return normalized
+
+
+def probe_image_size(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """
+    从图片文件头解析宽高，支持PNG、GIF、JPEG和WebP
+
+    Args:
+        data: 图片二进制内容
+
+    Returns:
+        (宽, 高)，无法识别时返回 (None, None)
+    """
+    try:
+        # PNG: IHDR块紧随签名之后
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+            width, height = struct.unpack('>II', data[16:24])
+            return width, height
+
+        # GIF
+        if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+            width, height = struct.unpack('<HH', data[6:10])
+            return width, height
+
+        # WebP: RIFF容器，分VP8 / VP8L / VP8X三种
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+            chunk = data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(data[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                width = int.from_bytes(data[24:27], 'little') + 1
+                height = int.from_bytes(data[27:30], 'little') + 1
+                return width, height
+
+        # JPEG: 查找SOF段
+        if data[:2] == b'\xff\xd8':
+            offset = 2
+            while offset + 9 < len(data):
+                if data[offset] != 0xFF:
+                    offset += 1
+                    continue
+                marker = data[offset + 1]
+                if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                    offset += 1 if marker == 0xFF else 2
+                    continue
+                segment_length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+                    return width, height
+                offset += 2 + segment_length
+    except (struct.error, IndexError):
+        pass
+
+    return None, None
+
+
+class ImageCatalog:
+    """图片元数据目录（SQLite，WAL模式，批量写入）"""
+
+    def __init__(self, db_path: str = "douyin_catalog.db", batch_size: int = 50):
+        """
+        初始化图片目录
+
+        Args:
+            db_path: SQLite数据库文件路径
+            batch_size: 批量写入的记录数，达到后自动提交
+        """
+        self.db_path = Path(db_path)
+        if self.db_path.parent and not self.db_path.parent.exists():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(1, batch_size)
+
+        self._lock = threading.RLock()
+        self._pending: List[Tuple] = []
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """为旧版本数据库建立唯一索引（先删除重复记录，保留每组最新的一条）"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_images_source_image'"
+        ).fetchone()
+        if exists:
+            return
+        self._conn.execute(
+            "DELETE FROM images WHERE id NOT IN (SELECT MAX(id) FROM images GROUP BY source_url, image_url)"
+        )
+        self._conn.execute(UNIQUE_INDEX)
+
+    def add_image(self, source_url: str, image_url: str, content_hash: Optional[str] = None,
+                  width: Optional[int] = None, height: Optional[int] = None,
+                  file_path: Optional[str] = None, file_size: Optional[int] = None,
+                  method: Optional[str] = None, crawl_time: Optional[float] = None):
+        """
+        添加一条图片记录（先进入缓冲区，达到批量大小后统一写入；
+        同一来源页面的同一张图片已有记录时更新哈希、路径和爬取时间）
+
+        Args:
+            source_url: 来源页面URL（用户主页或视频页）
+            image_url: 图片原始URL
+            content_hash: 图片内容SHA-256
+            width: 图片宽度
+            height: 图片高度
+            file_path: 本地保存路径
+            file_size: 文件大小（字节）
+            method: 获取方式（selenium / crawl4ai）
+            crawl_time: 爬取时间戳，默认当前时间
+        """
+        row = (
+            source_url,
+            normalize_image_url(image_url),
+            image_url,
+            content_hash,
+            width,
+            height,
+            file_path,
+            file_size,
+            method,
+            crawl_time if crawl_time is not None else time.time()
+        )
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        """将缓冲区中的记录写入数据库"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO images (source_url, image_url, original_url, content_hash, width, height, "
+                "file_path, file_size, method, crawl_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(source_url, image_url) DO UPDATE SET original_url = excluded.original_url, "
+                "content_hash = excluded.content_hash, width = excluded.width, height = excluded.height, "
+                "file_path = excluded.file_path, file_size = excluded.file_size, method = excluded.method, "
+                "crawl_time = excluded.crawl_time",
+                rows
+            )
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Dict]:
+        with self._lock:
+            self._flush_locked()
+            cursor = self._conn.execute(sql, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def find_by_source(self, source_url: str, limit: int = 1000, offset: int = 0) -> List[Dict]:
+        """查询某个来源页面已下载的图片"""
+        return self.query(source_url=source_url, limit=limit, offset=offset)
+
+    def find_by_image_url(self, image_url: str) -> List[Dict]:
+        """按图片URL（规范化后）查询记录"""
+        return self.query(image_url=image_url)
+
+    def find_by_hash(self, content_hash: str) -> List[Dict]:
+        """按内容哈希查询记录（可用于发现重复图片）"""
+        return self.query(content_hash=content_hash)
+
+    def has_image(self, image_url: str, source_url: Optional[str] = None) -> bool:
+        """
+        判断图片是否已经下载过
+
+        Args:
+            image_url: 图片URL
+            source_url: 限定来源页面，为None时不限定
+
+        Returns:
+            是否存在记录
+        """
+        sql = "SELECT 1 FROM images WHERE image_url = ?"
+        params: Tuple = (normalize_image_url(image_url),)
+        if source_url:
+            sql += " AND source_url = ?"
+            params += (source_url,)
+        return bool(self._query(sql + " LIMIT 1", params))
+
+    def query(self, source_url: Optional[str] = None, image_url: Optional[str] = None,
+              content_hash: Optional[str] = None, since: Optional[float] = None,
+              limit: int = 100, offset: int = 0) -> List[Dict]:
+        """
+        按条件查询图片记录，结果按爬取时间倒序
+
+        Args:
+            source_url: 来源页面URL
+            image_url: 图片URL（会先规范化）
+            content_hash: 内容哈希
+            since: 只返回该时间戳之后的记录
+            limit: 返回数量上限
+            offset: 偏移量
+
+        Returns:
+            记录字典列表
+        """
+        conditions = []
+        params: List = []
+        if source_url:
+            conditions.append("source_url = ?")
+            params.append(source_url)
+        if image_url:
+            conditions.append("image_url = ?")
+            params.append(normalize_image_url(image_url))
+        if content_hash:
+            conditions.append("content_hash = ?")
+            params.append(content_hash)
+        if since is not None:
+            conditions.append("crawl_time >= ?")
+            params.append(since)
+
+        sql = f"SELECT {', '.join(CATALOG_COLUMNS)} FROM images"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY crawl_time DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([max(0, int(limit)), max(0, int(offset))])
+        return self._query(sql, tuple(params))
+
+    def count(self, source_url: Optional[str] = None) -> int:
+        """统计记录数"""
+        if source_url:
+            rows = self._query("SELECT COUNT(*) AS n FROM images WHERE source_url = ?", (source_url,))
+        else:
+            rows = self._query("SELECT COUNT(*) AS n FROM images")
+        return rows[0]['n'] if rows else 0
+
+    def stats(self) -> Dict:
+        """
+        获取目录统计信息
+
+        Returns:
+            包含图片数、来源数、总字节数的字典
+        """
+        rows = self._query(
+            "SELECT COUNT(*) AS total_images, COUNT(DISTINCT source_url) AS total_sources, "
+            "COUNT(DISTINCT content_hash) AS unique_images, COALESCE(SUM(file_size), 0) AS total_bytes "
+            "FROM images"
+        )
+        result = rows[0] if rows else {}
+        result['db_path'] = str(self.db_path.absolute())
+        return result
+
+    def close(self):
+        """写入剩余记录并关闭数据库连接"""
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
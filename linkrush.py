@@ -1,8 +1,27 @@
 import re
 from typing import List
 
+import codecs
+import csv
+import os
 import re
-from typing import List
+import tempfile
+import threading
+import zipfile
+from typing import Callable, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from crawl_logging import get_logger
+
+logger = get_logger('linkrush')
+
+# 正则表达式匹配常见的链接格式（http、https）
+LINK_PATTERN = re.compile(r'https?://[^\s)>\]}\'"<>]+')
+# 支持流式解析的上传文件格式（其他扩展名按文本处理）
+TEXT_EXTENSIONS = ('.txt', '.csv', '.tsv')
+XLSX_EXTENSION = '.xlsx'
+# XLSX需要读取文件末尾的目录才能解析，先缓存在内存中，超过该大小时转存到匿名临时文件（关闭后删除）
+XLSX_SPOOL_BYTES = 8 * 1024 * 1024
 
 def extract_links_from_file(file_path: str) -> List[str]:
     """
@@ -18,14 +37,207 @@ def extract_links_from_file(file_path: str) -> List[str]:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
     except FileNotFoundError:
-        print(f"文件未找到: {file_path}")
+        logger.error("文件未找到: %s", file_path)
         return []
     except Exception as e:
-        print(f"读取文件出错: {e}")
+        logger.error("读取文件出错: %s", e)
         return []
 
-    # 正则表达式匹配常见的链接格式（http、https）
-    link_pattern = r'https?://[^\s)>\]}\'"<>]+'
-    links = re.findall(link_pattern, content)
+    return extract_links_from_text(content)
+
+
+def extract_links_from_text(text: str) -> List[str]:
+    """
+    从文本中提取所有链接（如网页表单中粘贴的多行链接）。
+
+    参数:
+        text (str): 文本内容。
+
+    返回:
+        List[str]: 提取到的链接列表。
+    """
+    return LINK_PATTERN.findall(text)
+
+
+class LinkStreamParser:
+    """
+    从上传文件的字节流中增量提取链接（分块解码，不落盘）。
+
+    txt / csv 按完整的行提取，每喂入一块数据即可返回其中的链接；
+    xlsx 是zip格式，需要完整文件才能解析，关闭时才返回链接。
+    """
+
+    def __init__(self, filename: str = ''):
+        """
+        参数:
+            filename (str): 上传的文件名，按扩展名选择解析方式。
+
+        异常:
+            ValueError: 不支持的文件格式（如旧版 .xls）。
+        """
+        extension = os.path.splitext(filename or '')[1].lower()
+        if extension == '.xls':
+            raise ValueError('不支持旧版Excel格式（.xls），请另存为 .xlsx 或 .csv')
+        self.extension = extension
+        self.bytes_read = 0
+        self._delimiter = {'.csv': ',', '.tsv': '\t'}.get(extension)
+        # utf-8-sig 去掉Excel导出CSV的BOM；链接只含ASCII，无法解码的字节替换掉即可
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+        self._tail = ''
+        self._spool = (tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES)
+                       if extension == XLSX_EXTENSION else None)
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        喂入一块数据。
+
+        返回:
+            List[str]: 这块数据中已完整出现的链接。
+        """
+        self.bytes_read += len(data)
+        if self._spool is not None:
+            self._spool.write(data)
+            return []
+        text = self._tail + self._decoder.decode(data)
+        # 链接不会跨行，最后一个不完整的行留到下一块
+        head, newline, self._tail = text.rpartition('\n')
+        return self._extract(head + newline) if newline else []
+
+    def close(self) -> List[str]:
+        """
+        数据结束。
+
+        返回:
+            List[str]: 剩余的链接（xlsx为全部链接）。
+        """
+        if self._spool is not None:
+            spool, self._spool = self._spool, None
+            try:
+                spool.seek(0)
+                return extract_links_from_xlsx(spool)
+            finally:
+                spool.close()
+        text, self._tail = self._tail + self._decoder.decode(b'', final=True), ''
+        return self._extract(text)
+
+    def _extract(self, text: str) -> List[str]:
+        if self._delimiter is None:
+            return extract_links_from_text(text)
+        # CSV按单元格提取，避免把逗号后的下一列拼进链接
+        links = []
+        for row in csv.reader(text.splitlines(), delimiter=self._delimiter):
+            for cell in row:
+                links.extend(extract_links_from_text(cell))
+        return links
 
+
+def extract_links_from_xlsx(file) -> List[str]:
+    """
+    从xlsx文件中提取链接（单元格文本和超链接目标，不依赖openpyxl）。
+
+    参数:
+        file: 文件路径或可随机读取的文件对象。
+
+    返回:
+        List[str]: 提取到的链接列表。
+    """
+    links = []
+    with zipfile.ZipFile(file) as archive:
+        names = archive.namelist()
+        # 共享字符串表中的文本即单元格文本，直接提取，不必再对照单元格
+        for name in names:
+            if name == 'xl/sharedStrings.xml' or (name.startswith('xl/worksheets/') and name.endswith('.xml')):
+                with archive.open(name) as part:
+                    for _, element in ElementTree.iterparse(part):
+                        # 共享字符串 <t>、内联字符串 <is><t>、公式结果 <v> 和 HYPERLINK 公式 <f>
+                        if element.tag.rsplit('}', 1)[-1] in ('t', 'v', 'f') and element.text:
+                            links.extend(extract_links_from_text(element.text))
+                        element.clear()
+            elif name.startswith('xl/worksheets/_rels/') and name.endswith('.rels'):
+                # 显示文本不是链接的超链接单元格
+                with archive.open(name) as part:
+                    for _, element in ElementTree.iterparse(part):
+                        if element.get('TargetMode') == 'External':
+                            links.extend(extract_links_from_text(element.get('Target', '')))
+                        element.clear()
     return links
+
+
+class LinkFeed:
+    """
+    逐步增长的链接列表（线程安全，自动去重）。
+
+    上传文件仍在解析时爬取线程即可开始处理已读到的链接；迭代时等待新链接，直到关闭。
+    """
+
+    def __init__(self):
+        self._links: List[str] = []
+        self._seen = set()
+        self._closed = False
+        self.error: Optional[str] = None
+        self._condition = threading.Condition()
+        self._listeners: List[Callable[[int], None]] = []
+
+    def put(self, links: List[str]) -> int:
+        """
+        追加链接。
+
+        返回:
+            int: 新增（未重复）的链接数。
+        """
+        with self._condition:
+            added = [link for link in dict.fromkeys(links) if link not in self._seen]
+            self._seen.update(added)
+            self._links.extend(added)
+            total = len(self._links)
+            if added:
+                self._condition.notify_all()
+            listeners = list(self._listeners) if added else []
+        for listener in listeners:
+            listener(total)
+        return len(added)
+
+    def close(self, error: Optional[str] = None):
+        """链接读取结束（error 为解析中途出错的原因，已读到的链接仍然有效）。"""
+        with self._condition:
+            self._closed = True
+            self.error = error
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def add_listener(self, listener: Callable[[int], None]):
+        """注册链接数变化的回调（参数为当前链接总数）。"""
+        with self._condition:
+            self._listeners.append(listener)
+
+    def snapshot(self) -> List[str]:
+        """当前已读到的链接。"""
+        with self._condition:
+            return list(self._links)
+
+    def wait(self, position: int, timeout: Optional[float] = None) -> Tuple[List[str], bool]:
+        """
+        等待第 position 个之后的新链接。
+
+        返回:
+            Tuple[List[str], bool]: (新链接, 是否已关闭)；超时时新链接为空。
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._links) > position or self._closed, timeout)
+            return self._links[position:], self._closed
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._links)
+
+    def __iter__(self) -> Iterator[str]:
+        position = 0
+        while True:
+            links, closed = self.wait(position)
+            yield from links
+            position += len(links)
+            if closed and not links:
+                return
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 指标采集
+轻量的Prometheus风格指标（计数器、仪表、直方图），无第三方依赖，
+由Web服务的 /metrics 接口以文本格式导出
+"""
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # 每组标签: [各桶计数..., 总和, 总数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文：退出时记录耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        """获取某组标签的总数和总和"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return {'count': 0, 'sum': 0.0}
+            return {'count': state[-1], 'sum': state[-2]}
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标已注册: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """以Prometheus文本格式导出所有指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# 爬取各阶段耗时：browser_launch / page_load / scroll / dom_extract / filter / disk_write
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'douyin_stage_seconds', '爬取各阶段耗时（秒）', ['stage']
+))
+# 单张图片网络各阶段耗时：dns / connect / ttfb / transfer
+IMAGE_PHASE_SECONDS = REGISTRY.register(Histogram(
+    'douyin_image_phase_seconds', '单张图片下载各网络阶段耗时（秒）', ['phase'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+))
+DOWNLOADED_BYTES = REGISTRY.register(Counter(
+    'douyin_downloaded_bytes_total', '按域名统计的下载字节数', ['host']
+))
+DOWNLOADED_IMAGES = REGISTRY.register(Counter(
+    'douyin_downloaded_images_total', '按域名统计的下载成功图片数', ['host']
+))
+DOWNLOAD_RETRIES = REGISTRY.register(Counter(
+    'douyin_download_retries_total', '按域名统计的下载重试次数', ['host']
+))
+DOWNLOAD_FAILURES = REGISTRY.register(Counter(
+    'douyin_download_failures_total', '按域名和原因统计的下载失败次数', ['host', 'reason']
+))
+SIGNED_URL_FALLBACKS = REGISTRY.register(Counter(
+    'douyin_signed_url_fallbacks_total', '带签名的图片URL被拒绝（403）后改用去签名URL的次数', ['host']
+))
+# 候选图片获取：各后端（selenium / crawl4ai）耗时与结果（usable / empty / error / cancelled）
+ACQUISITION_SECONDS = REGISTRY.register(Histogram(
+    'douyin_acquisition_seconds', '各后端获取候选图片列表的耗时（秒）', ['backend', 'outcome']
+))
+ACQUISITION_WINS = REGISTRY.register(Counter(
+    'douyin_acquisition_wins_total', '对冲获取中各后端胜出次数', ['backend']
+))
+# 自适应并发：下载（downloads）和页面渲染（renders）当前的并发上限
+CONCURRENCY_LIMIT = REGISTRY.register(Gauge(
+    'douyin_concurrency_limit', 'AIMD控制器当前的并发上限', ['stage']
+))
+CONCURRENCY_DECREASES = REGISTRY.register(Counter(
+    'douyin_concurrency_decreases_total', 'AIMD控制器因过载减小并发上限的次数', ['stage']
+))
+CRAWL_JOBS_RUNNING = REGISTRY.register(Gauge(
+    'douyin_crawl_jobs_running', '正在运行的爬取任务数'
+))
+CRAWL_JOBS_RUNNING.set(0)
+# 存储预算：索引中已下载文件的总字节数、淘汰的文件数、因磁盘空间不足暂停下载
+STORAGE_USED_BYTES = REGISTRY.register(Gauge(
+    'douyin_storage_used_bytes', '存储索引中已下载文件的总字节数'
+))
+STORAGE_EVICTIONS = REGISTRY.register(Counter(
+    'douyin_storage_evictions_total', '按原因（quota / low_disk / expired）统计的淘汰文件数', ['reason']
+))
+DOWNLOADS_PAUSED = REGISTRY.register(Gauge(
+    'douyin_downloads_paused', '下载阶段是否因磁盘空间不足而暂停（1为暂停）'
+))
+DOWNLOADS_PAUSED.set(0)
+
+
+def time_stage(stage: str):
+    """记录一个爬取阶段的耗时"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+# 当前线程最近一次新建连接的DNS/建连耗时，由计时连接写入、下载代码读取
+connection_timing = threading.local()
+
+
+def reset_connection_timing():
+    """清空当前线程的连接计时"""
+    connection_timing.dns = None
+    connection_timing.connect = None
+
+
+# 计时连接建连期间当前线程的DNS解析耗时；其他线程和其他时刻的解析直接透传
+_dns_timer = threading.local()
+_original_getaddrinfo = socket.getaddrinfo
+_dns_timer_lock = threading.Lock()
+
+
+def _timed_getaddrinfo(*args, **kwargs):
+    if not getattr(_dns_timer, 'active', False):
+        return _original_getaddrinfo(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return _original_getaddrinfo(*args, **kwargs)
+    finally:
+        _dns_timer.seconds = (_dns_timer.seconds or 0.0) + time.perf_counter() - start
+
+
+def _install_dns_timer():
+    """把 socket.getaddrinfo 换成计时版本（只安装一次）"""
+    with _dns_timer_lock:
+        if socket.getaddrinfo is not _timed_getaddrinfo:
+            socket.getaddrinfo = _timed_getaddrinfo
+
+
+def create_instrumented_session():
+    """
+    创建记录DNS解析和建立连接耗时的requests会话（连接池复用）
+
+    Returns:
+        requests.Session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _TimedConnectionMixin:
+        """在urllib3自身的建连过程中打开当前线程的DNS计时，解析、建连和异常处理都交给基类"""
+
+        _dns_seconds = None
+
+        def _new_conn(self):
+            _install_dns_timer()
+            _dns_timer.active = True
+            _dns_timer.seconds = None
+            try:
+                return super()._new_conn()
+            finally:
+                # 基类不经过 socket.getaddrinfo 时（如未来版本的urllib3）DNS耗时为None，建连耗时包含解析
+                self._dns_seconds = _dns_timer.seconds
+                _dns_timer.active = False
+
+        def connect(self):
+            # 建连耗时包括TCP连接和TLS握手，不含DNS解析
+            self._dns_seconds = None
+            start = time.perf_counter()
+            super().connect()
+            connection_timing.dns = self._dns_seconds
+            connection_timing.connect = time.perf_counter() - start - (self._dns_seconds or 0.0)
+
+    class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+        pass
+
+    class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+        pass
+
+    class _TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+
+    class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _TimedHTTPSConnection
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': _TimedHTTPConnectionPool,
+                'https': _TimedHTTPSConnectionPool
+            }
+
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=16, pool_maxsize=16)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
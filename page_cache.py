@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 页面结果缓存
+按规范化页面URL缓存浏览器渲染后提取到的图片列表，
+重复运行同一批链接时可以跳过无头浏览器渲染，直接重放过滤和下载流程
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+# 缓存模式
+CACHE_BYPASS = 'bypass'          # 不读不写（原有行为）
+CACHE_ENABLED = 'enabled'        # 命中则使用缓存，未命中渲染后写入
+CACHE_READ_ONLY = 'read_only'    # 只读缓存，未命中时渲染但不写入
+CACHE_WRITE_ONLY = 'write_only'  # 总是渲染并刷新缓存
+CACHE_OFFLINE = 'offline'        # 只读缓存且忽略过期时间，未命中时不启动浏览器
+
+CACHE_MODES = (CACHE_BYPASS, CACHE_ENABLED, CACHE_READ_ONLY, CACHE_WRITE_ONLY, CACHE_OFFLINE)
+
+# 规范化页面URL时丢弃的分享/追踪参数
+TRACKING_QUERY_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'share_token', 'share_app_id', 'share_iid', 'share_link_id', 'sec_uid_share',
+    'u_code', 'did', 'iid', 'timestamp', 'from_ssr', 'from', 'previous_page',
+    'enter_from', 'enter_method', 'extra_params', 'with_sec_did', 'titleType', 'ts'
+}
+
+
+def canonicalize_page_url(url: str) -> str:
+    """
+    规范化页面URL作为缓存键
+
+    Args:
+        url: 页面URL
+
+    Returns:
+        小写协议和域名、去除片段和追踪参数、参数排序、去除末尾斜杠后的URL
+    """
+    parsed = urlparse(url.strip())
+    scheme = (parsed.scheme or 'https').lower()
+    netloc = parsed.netloc.lower()
+    path = parsed.path.rstrip('/') or '/'
+
+    query_params = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key not in TRACKING_QUERY_PARAMS and not key.startswith('utm_')
+    ]
+    query_params.sort()
+
+    canonical = f"{scheme}://{netloc}{path}"
+    if query_params:
+        canonical += '?' + urlencode(query_params)
+    return canonical
+
+
+class PageCache:
+    """页面图片列表缓存（每个页面一个JSON文件）"""
+
+    def __init__(self, cache_dir: str = ".douyin_page_cache", mode: str = CACHE_BYPASS,
+                 ttl: float = 24 * 3600):
+        """
+        初始化页面缓存
+
+        Args:
+            cache_dir: 缓存目录
+            mode: 缓存模式，见 CACHE_MODES
+            ttl: 缓存有效期（秒），<=0 表示永不过期
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"无效的缓存模式: {mode}，可选: {', '.join(CACHE_MODES)}")
+        self.cache_dir = Path(cache_dir)
+        self.mode = mode
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def readable(self) -> bool:
+        """当前模式是否读取缓存"""
+        return self.mode in (CACHE_ENABLED, CACHE_READ_ONLY, CACHE_OFFLINE)
+
+    @property
+    def writable(self) -> bool:
+        """当前模式是否写入缓存"""
+        return self.mode in (CACHE_ENABLED, CACHE_WRITE_ONLY)
+
+    @property
+    def offline(self) -> bool:
+        """当前模式是否禁止启动浏览器"""
+        return self.mode == CACHE_OFFLINE
+
+    def _entry_path(self, page_url: str, variant: str) -> Path:
+        key = hashlib.sha256(f"{variant}|{canonicalize_page_url(page_url)}".encode('utf-8')).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, page_url: str, variant: str = 'page') -> Optional[List[Dict]]:
+        """
+        读取页面的缓存图片列表
+
+        Args:
+            page_url: 页面URL
+            variant: 页面类型（user / video），不同渲染配置分别缓存
+
+        Returns:
+            图片列表；未命中、已过期或当前模式不读缓存时返回None
+        """
+        if not self.readable:
+            return None
+
+        entry_path = self._entry_path(page_url, variant)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        expired = self.ttl > 0 and time.time() - entry.get('cached_at', 0) > self.ttl
+        if expired and not self.offline:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return entry.get('images', [])
+
+    def put(self, page_url: str, images: List[Dict], variant: str = 'page'):
+        """
+        写入页面的图片列表
+
+        Args:
+            page_url: 页面URL
+            images: 浏览器提取到的原始图片列表（过滤前）
+            variant: 页面类型
+        """
+        if not self.writable:
+            return
+
+        entry_path = self._entry_path(page_url, variant)
+        entry = {
+            'page_url': page_url,
+            'canonical_url': canonicalize_page_url(page_url),
+            'variant': variant,
+            'cached_at': time.time(),
+            'images': images
+        }
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_path.with_name(entry_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            return {'mode': self.mode, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 任务级性能剖析
+把一次爬取任务包在剖析器中执行，结束后在下载目录（与元数据文件同级）保存：
+    profile_<job_id>.prof       cProfile结果（pstats格式，仅cprofile模式）
+    profile_<job_id>.collapsed  折叠栈文件，可直接交给 flamegraph.pl / speedscope
+    profile_<job_id>.json       摘要：耗时、采样数、最热函数
+"""
+
+import cProfile
+import json
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
+
+PROFILE_CPROFILE = 'cprofile'
+PROFILE_SAMPLING = 'sampling'
+PROFILE_MODES = (PROFILE_CPROFILE, PROFILE_SAMPLING)
+
+
+class StackSampler:
+    """低开销采样剖析器：后台线程定期读取目标线程的调用栈"""
+
+    def __init__(self, interval: float = 0.01, thread_ids: Optional[set] = None,
+                 all_threads: bool = False):
+        """
+        Args:
+            interval: 采样间隔（秒）
+            thread_ids: 要采样的线程ID，默认为调用 start() 的线程
+            all_threads: 是否采样所有线程（如写盘线程、日志线程）
+        """
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.all_threads = all_threads
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """开始采样"""
+        if self.thread_ids is None and not self.all_threads:
+            self.thread_ids = {threading.get_ident()}
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if not self.all_threads and thread_id not in self.thread_ids:
+                    continue
+                self.stacks[self._collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _collapse(frame, thread_name: str) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        # 折叠栈格式以分号分隔，由外到内
+        return ';'.join(reversed(parts)).replace(' ', '_')
+
+    def write_collapsed(self, path: Path):
+        """写出折叠栈文件（每行：栈 次数）"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit: int = 20) -> list:
+        """按自身采样数排序的最热函数"""
+        leaf_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaf_counts[stack.rsplit(';', 1)[-1]] += count
+        return [{'function': name, 'samples': count} for name, count in leaf_counts.most_common(limit)]
+
+
+class JobProfiler:
+    """爬取任务剖析器（上下文管理器）"""
+
+    def __init__(self, output_dir: str, job_id: str, mode: str = PROFILE_SAMPLING,
+                 interval: float = 0.01, all_threads: bool = False):
+        """
+        Args:
+            output_dir: 剖析结果输出目录（通常为下载目录）
+            job_id: 任务ID，用于文件命名
+            mode: cprofile（确定性，开销较大）或 sampling（采样，开销低）
+            interval: 采样间隔（秒）
+            all_threads: 采样模式下是否包含所有线程
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的剖析模式: {mode}")
+        self.output_dir = Path(output_dir)
+        self.job_id = job_id
+        self.mode = mode
+        self.sampler = StackSampler(interval=interval, all_threads=all_threads)
+        self.profiler = cProfile.Profile() if mode == PROFILE_CPROFILE else None
+        self.artifacts: Dict[str, str] = {}
+        self._start = 0.0
+        self._running = False
+        self.elapsed = 0.0
+
+    def __enter__(self) -> 'JobProfiler':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        """开始剖析（当前线程）"""
+        self._start = time.perf_counter()
+        self._running = True
+        # cprofile模式同样运行采样器，用于生成折叠栈
+        self.sampler.start()
+        if self.profiler:
+            self.profiler.enable()
+
+    def stop(self) -> Dict[str, str]:
+        """
+        停止剖析并保存结果
+
+        Returns:
+            产物类型到文件路径的映射
+        """
+        if not self._running:
+            return self.artifacts
+        self._running = False
+        if self.profiler:
+            self.profiler.disable()
+        self.sampler.stop()
+        self.elapsed = time.perf_counter() - self._start
+        return self.save()
+
+    def save(self) -> Dict[str, str]:
+        """保存剖析产物"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = f"profile_{self.job_id}"
+
+        summary = {
+            'job_id': self.job_id,
+            'mode': self.mode,
+            'seconds': round(self.elapsed, 3),
+            'samples': self.sampler.samples,
+            'interval': self.sampler.interval,
+            'all_threads': self.sampler.all_threads,
+            'top_sampled': self.sampler.top_functions()
+        }
+
+        if self.profiler:
+            prof_path = self.output_dir / f"{prefix}.prof"
+            self.profiler.dump_stats(str(prof_path))
+            self.artifacts['prof'] = str(prof_path)
+            # cProfile只记录调用 start() 的线程，线程池中的工作只出现在采样结果中
+            summary['cprofile_scope'] = '仅事件循环线程（线程池中的图片请求、Selenium会话和写盘见 top_sampled 和折叠栈）'
+            stats = pstats.Stats(self.profiler)
+            summary['top_cumulative'] = [
+                {'function': f"{func[2]} ({Path(func[0]).name}:{func[1]})", 'calls': nc,
+                 'tottime': round(tt, 4), 'cumtime': round(ct, 4)}
+                for func, (cc, nc, tt, ct, callers) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True
+                )[:20]
+            ]
+
+        collapsed_path = self.output_dir / f"{prefix}.collapsed"
+        self.sampler.write_collapsed(collapsed_path)
+        self.artifacts['collapsed'] = str(collapsed_path)
+
+        summary_path = self.output_dir / f"{prefix}.json"
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        self.artifacts['summary'] = str(summary_path)
+        return self.artifacts
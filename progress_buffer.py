@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 进度事件缓冲区
+替代无界消息队列：日志只保留最近N条，进度类事件按键合并（只保留最新一条），
+每个事件带递增序号，SSE客户端断线重连或中途加入时可按序号补发
+"""
+
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# 按最新值合并的事件类型
+COALESCED_TYPES = ('progress',)
+
+
+class ProgressEventBuffer:
+    """有界、可合并、可回放的进度事件缓冲区"""
+
+    def __init__(self, max_logs: int = 500):
+        """
+        Args:
+            max_logs: 保留的最近日志条数
+        """
+        self.max_logs = max_logs
+        self._logs: deque = deque(maxlen=max_logs)
+        # 合并键 -> (序号, 事件)
+        self._latest: Dict[str, Tuple[int, Dict]] = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.coalesced = 0
+
+    @property
+    def last_id(self) -> int:
+        """最新事件序号"""
+        with self._cond:
+            return self._seq
+
+    @staticmethod
+    def _coalesce_key(event: Dict) -> Optional[str]:
+        if event.get('type') not in COALESCED_TYPES:
+            return None
+        # 带 key 的进度事件（如单个URL的子进度）各自合并
+        return f"{event['type']}:{event.get('key', '')}"
+
+    def put(self, event: Dict):
+        """
+        加入一个事件（接口与 Queue.put 相同，可直接作为日志转发目标）
+
+        Args:
+            event: 事件字典，需包含 type
+        """
+        with self._cond:
+            self._seq += 1
+            key = self._coalesce_key(event)
+            if key is not None:
+                if key in self._latest:
+                    self.coalesced += 1
+                self._latest[key] = (self._seq, event)
+            else:
+                if len(self._logs) == self._logs.maxlen:
+                    self.dropped += 1
+                self._logs.append((self._seq, event))
+            self._cond.notify_all()
+
+    def events_since(self, last_id: int = 0) -> List[Tuple[int, Dict]]:
+        """
+        获取序号大于 last_id 的事件（按序号排序）
+
+        Args:
+            last_id: 客户端已收到的最后一个序号，0表示从保留的历史开始
+
+        Returns:
+            [(序号, 事件), ...]
+        """
+        with self._cond:
+            return self._collect(last_id)
+
+    def _collect(self, last_id: int) -> List[Tuple[int, Dict]]:
+        events = [item for item in self._logs if item[0] > last_id]
+        events.extend(item for item in self._latest.values() if item[0] > last_id)
+        events.sort(key=lambda item: item[0])
+        return events
+
+    def wait(self, last_id: int, timeout: float) -> Tuple[List[Tuple[int, Dict]], int]:
+        """
+        等待新事件
+
+        Args:
+            last_id: 客户端已收到的最后一个序号
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            (事件列表, 当前最新序号)，客户端下次以该序号继续等待
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > last_id, timeout)
+            return self._collect(last_id), max(last_id, self._seq)
+
+    def clear(self):
+        """清空事件（序号继续递增，避免旧客户端的 Last-Event-ID 误匹配）"""
+        with self._cond:
+            self._logs.clear()
+            self._latest.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """缓冲区统计"""
+        with self._cond:
+            return {
+                'last_id': self._seq,
+                'logs': len(self._logs),
+                'max_logs': self.max_logs,
+                'coalesced_keys': len(self._latest),
+                'dropped_logs': self.dropped,
+                'coalesced_events': self.coalesced
+            }
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 离线录制与重放
+录制真实爬取时的页面图片列表和图片响应，之后在无网络的机器上
+通过本地替身服务重放，走与线上相同的 DouyinImageCrawler 代码路径
+
+用法:
+    python replay.py record lins.txt fixtures/run1 --max-images 20
+    python replay.py replay fixtures/run1 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from standin_server import StandInServer
+
+MANIFEST_NAME = 'manifest.json'
+FIXTURE_VERSION = 1
+
+
+class FixtureElement:
+    """模拟Selenium图片元素，只提供 get_attribute"""
+
+    def __init__(self, attributes: Dict[str, Optional[str]]):
+        self.attributes = attributes
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        return self.attributes.get(name)
+
+
+class FixtureRecorder:
+    """录制页面图片列表和图片响应到fixture目录"""
+
+    def __init__(self, fixture_dir: str, options: Optional[Dict] = None):
+        """
+        初始化录制器
+
+        Args:
+            fixture_dir: fixture目录
+            options: 录制时的爬取参数（写入manifest，重放时沿用）
+        """
+        self.fixture_dir = Path(fixture_dir)
+        self.bodies_dir = self.fixture_dir / 'bodies'
+        self.bodies_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = {
+            'version': FIXTURE_VERSION,
+            'recorded_at': time.time(),
+            'options': options or {},
+            'pages': [],
+            'responses': {}
+        }
+        self._lock = threading.Lock()
+
+    def record_page(self, page_url: str, variant: str, images: List[Dict]):
+        """
+        记录一个页面提取到的图片列表
+
+        Args:
+            page_url: 页面URL
+            variant: 页面类型（user / video / selenium）
+            images: 图片列表（selenium类型为元素属性列表）
+        """
+        with self._lock:
+            self.manifest['pages'] = [
+                page for page in self.manifest['pages']
+                if not (page['url'] == page_url and page['variant'] == variant)
+            ]
+            self.manifest['pages'].append({'url': page_url, 'variant': variant, 'images': images})
+
+    def record_response(self, img_url: str, status: int, headers: Dict[str, str], body: bytes):
+        """
+        记录一个图片响应
+
+        Args:
+            img_url: 图片URL（处理后、重写前）
+            status: HTTP状态码
+            headers: 响应头
+            body: 响应体
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        body_path = self.bodies_dir / f"{digest}.bin"
+        if not body_path.exists():
+            body_path.write_bytes(body)
+        with self._lock:
+            self.manifest['responses'][img_url] = {
+                'status': status,
+                'content_type': headers.get('content-type') or headers.get('Content-Type', ''),
+                'body': body_path.name,
+                'size': len(body)
+            }
+
+    def save(self):
+        """写入manifest"""
+        with self._lock:
+            with open(self.fixture_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+
+
+class FixturePlayer:
+    """从fixture目录读取录制结果，并作为替身服务的响应源"""
+
+    def __init__(self, fixture_dir: str):
+        """
+        Args:
+            fixture_dir: fixture目录
+        """
+        self.fixture_dir = Path(fixture_dir)
+        with open(self.fixture_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.options = self.manifest.get('options', {})
+        self._pages = {(page['url'], page['variant']): page['images'] for page in self.manifest['pages']}
+        self._responses = self.manifest.get('responses', {})
+        self._bodies: Dict[str, bytes] = {}
+        self.base_url = ''
+
+    @property
+    def pages(self) -> List[Dict]:
+        """录制的页面列表"""
+        return self.manifest['pages']
+
+    def get_page(self, page_url: str, variant: str) -> Optional[List[Dict]]:
+        """获取录制的页面图片列表"""
+        images = self._pages.get((page_url, variant))
+        return [dict(img) for img in images] if images is not None else None
+
+    def get_selenium_elements(self, page_url: str) -> Optional[List[FixtureElement]]:
+        """获取录制的Selenium图片元素（属性快照）"""
+        attributes = self._pages.get((page_url, 'selenium'))
+        if attributes is None:
+            return None
+        return [FixtureElement(attrs) for attrs in attributes]
+
+    def has_response(self, img_url: str) -> bool:
+        """是否录制了该图片URL的响应"""
+        return img_url in self._responses
+
+    def rewrite_url(self, img_url: str) -> str:
+        """把图片URL重写为指向本地替身服务"""
+        return f"{self.base_url}/fetch?u={quote(img_url, safe='')}"
+
+    def resolve(self, path: str, query: Dict) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """替身服务的响应函数"""
+        if path != '/fetch' or 'u' not in query:
+            return None
+        entry = self._responses.get(query['u'][0])
+        if entry is None:
+            return None
+        body = self._bodies.get(entry['body'])
+        if body is None:
+            body = (self.fixture_dir / 'bodies' / entry['body']).read_bytes()
+            self._bodies[entry['body']] = body
+        return entry['status'], {'Content-Type': entry['content_type']}, body
+
+
+async def record(links_file: str, fixture_dir: str, max_images: int, use_selenium: bool) -> Dict:
+    """
+    真实爬取一批链接并录制
+
+    Args:
+        links_file: 链接文件
+        fixture_dir: fixture输出目录
+        max_images: 每个链接最大图片数
+        use_selenium: 是否使用Selenium
+
+    Returns:
+        各链接的爬取结果
+    """
+    from douyin_image_crawler import DouyinImageCrawler
+    from linkrush import extract_links_from_file
+
+    recorder = FixtureRecorder(fixture_dir, {'max_images': max_images, 'use_selenium': use_selenium})
+    download_dir = tempfile.mkdtemp(prefix='douyin_record_')
+    crawler = DouyinImageCrawler(download_dir=download_dir, catalog_path=None)
+    crawler.fixture_recorder = recorder
+
+    results = []
+    try:
+        for url in extract_links_from_file(links_file):
+            results.append(await crawler.crawl_douyin_user_images(
+                user_url=url, max_images=max_images, save_metadata=False, use_selenium=use_selenium
+            ))
+    finally:
+        crawler.close()
+        recorder.save()
+        shutil.rmtree(download_dir, ignore_errors=True)
+    return {'fixture_dir': fixture_dir, 'pages': len(recorder.manifest['pages']),
+            'responses': len(recorder.manifest['responses'])}
+
+
+async def replay(fixture_dir: str, latency: float = 0.0, bandwidth: Optional[float] = None,
+                 download_dir: Optional[str] = None) -> Dict:
+    """
+    通过本地替身服务重放fixture，返回耗时统计
+
+    Args:
+        fixture_dir: fixture目录
+        latency: 替身服务每个请求的延迟（秒）
+        bandwidth: 替身服务带宽（字节/秒）
+        download_dir: 下载目录，默认临时目录（结束后删除）
+
+    Returns:
+        耗时和下载统计
+    """
+    from douyin_image_crawler import DouyinImageCrawler
+
+    player = FixturePlayer(fixture_dir)
+    temp_dir = None
+    if download_dir is None:
+        temp_dir = download_dir = tempfile.mkdtemp(prefix='douyin_replay_')
+
+    pages = []
+    with StandInServer(player.resolve, latency=latency, bandwidth=bandwidth) as server:
+        player.base_url = server.base_url
+        crawler = DouyinImageCrawler(download_dir=download_dir, catalog_path=None, enable_delays=False)
+        crawler.fixture_player = player
+
+        max_images = player.options.get('max_images', 50)
+        start = time.perf_counter()
+        # 同一主页可能同时录制了 selenium 和 user（Selenium失败回退或对冲获取）两种结果，
+        # 每个主页只重放一次：有Selenium录制时从Selenium开始，回退由爬虫自行重放
+        crawls: Dict[Tuple[str, str], str] = {}
+        for page in player.pages:
+            kind = 'video' if page['variant'] == 'video' else 'user'
+            if crawls.get((page['url'], kind)) != 'selenium':
+                crawls[(page['url'], kind)] = page['variant']
+        try:
+            for (url, kind), variant in crawls.items():
+                page_start = time.perf_counter()
+                if kind == 'video':
+                    result = await crawler.crawl_douyin_video_images(url, save_metadata=False)
+                else:
+                    result = await crawler.crawl_douyin_user_images(
+                        user_url=url, max_images=max_images, save_metadata=False,
+                        use_selenium=variant == 'selenium'
+                    )
+                pages.append({
+                    'url': url,
+                    'variant': variant,
+                    'seconds': round(time.perf_counter() - page_start, 4),
+                    'downloaded_images': result['downloaded_images'],
+                    'failed_downloads': result['failed_downloads']
+                })
+        finally:
+            crawler.close()
+        elapsed = time.perf_counter() - start
+
+    if temp_dir:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    downloaded = sum(page['downloaded_images'] for page in pages)
+    return {
+        'fixture_dir': str(fixture_dir),
+        'latency': latency,
+        'bandwidth': bandwidth,
+        'seconds': round(elapsed, 4),
+        'downloaded_images': downloaded,
+        'failed_downloads': sum(page['failed_downloads'] for page in pages),
+        'images_per_second': round(downloaded / elapsed, 2) if elapsed > 0 else 0,
+        'pages': pages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抖音图片爬虫 - 离线录制与重放')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='真实爬取并录制fixture')
+    record_parser.add_argument('links_file', help='链接文件（txt）')
+    record_parser.add_argument('fixture_dir', help='fixture输出目录')
+    record_parser.add_argument('--max-images', type=int, default=20, help='每个链接最大图片数')
+    record_parser.add_argument('--no-selenium', action='store_true', help='只使用Crawl4AI')
+
+    replay_parser = subparsers.add_parser('replay', help='离线重放fixture')
+    replay_parser.add_argument('fixture_dir', help='fixture目录')
+    replay_parser.add_argument('--latency', type=float, default=0.0, help='替身服务延迟（秒）')
+    replay_parser.add_argument('--bandwidth', type=float, default=None, help='替身服务带宽（字节/秒）')
+    replay_parser.add_argument('--download-dir', default=None, help='下载目录，默认使用临时目录')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        summary = asyncio.run(record(args.links_file, args.fixture_dir, args.max_images, not args.no_selenium))
+    else:
+        summary = asyncio.run(replay(args.fixture_dir, args.latency, args.bandwidth, args.download_dir))
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 爬取结果的分页视图
+任务完成后对结果建立一次索引：状态轮询和SSE完成事件只返回汇总，
+各URL的结果和图片元数据按游标分页读取（结果不变时以ETag判断客户端缓存是否有效）
+"""
+
+import base64
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+# URL结果状态
+URL_DONE = 'done'            # 完成
+URL_FAILED = 'failed'        # 出错
+URL_CANCELLED = 'cancelled'  # 任务取消时未完成
+URL_STATES = (URL_DONE, URL_FAILED, URL_CANCELLED)
+
+# 汇总中不包含的大字段（分页读取）
+DETAIL_FIELDS = ('url_results',)
+# URL结果条目中的计数字段
+ENTRY_FIELDS = ('total_images', 'downloaded_images', 'failed_downloads', 'retries', 'method_used')
+
+# 每次发布结果时递增，作为游标和ETag的版本号
+_versions = itertools.count(1)
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析，或属于已被替换的结果"""
+
+
+class CrawlResultsView:
+    """一次任务结果的只读分页视图（创建后不再修改，可在多个请求线程中共享）"""
+
+    def __init__(self, job_id: Optional[str], results: Dict):
+        """
+        Args:
+            job_id: 任务ID
+            results: run_crawl_task / run_distributed_job 生成的结果字典
+        """
+        self.job_id = job_id
+        self.version = next(_versions)
+        self.etag = f"{job_id or 'job'}-{self.version}"
+        self._entries = [self._entry(index, item) for index, item in enumerate(results.get('url_results') or [])]
+        self._images: Dict[str, List[Dict]] = {}
+        for item in results.get('url_results') or []:
+            self._images.setdefault(item.get('url'), []).extend(
+                (item.get('result') or {}).get('images_metadata') or [])
+
+        states = {state: 0 for state in URL_STATES}
+        for entry in self._entries:
+            states[entry['status']] += 1
+        self._summary = {key: value for key, value in results.items() if key not in DETAIL_FIELDS}
+        self._summary.update({
+            'job_id': job_id,
+            'url_count': len(self._entries),
+            'url_states': states,
+            'image_count': sum(len(images) for images in self._images.values())
+        })
+
+    @staticmethod
+    def _entry(index: int, item: Dict) -> Dict:
+        """URL结果条目（不含图片元数据）"""
+        result = item.get('result')
+        if result is None:
+            status = URL_FAILED
+        elif result.get('cancelled'):
+            status = URL_CANCELLED
+        else:
+            status = URL_DONE
+        entry = {'index': index, 'url': item.get('url'), 'status': status}
+        if result is None:
+            entry['error'] = item.get('error')
+        else:
+            entry.update({key: result[key] for key in ENTRY_FIELDS if key in result})
+            entry['images'] = len(result.get('images_metadata') or [])
+            if result.get('error'):
+                entry['error'] = result['error']
+        return entry
+
+    def summary(self) -> Dict:
+        """结果汇总（大小与URL数量无关）"""
+        return dict(self._summary, results_version=self.version)
+
+    def _encode_cursor(self, position: int) -> str:
+        return base64.urlsafe_b64encode(f"{self.version}:{position}".encode()).decode().rstrip('=')
+
+    def _decode_cursor(self, cursor: Optional[str]) -> int:
+        if not cursor:
+            return 0
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            version, position = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+            version, position = int(version), int(position)
+        except (ValueError, UnicodeDecodeError):
+            raise InvalidCursor('游标无效')
+        if version != self.version:
+            raise InvalidCursor('结果已更新，游标已失效，请从第一页重新读取')
+        return max(0, position)
+
+    def _page(self, items: List, cursor: Optional[str], limit: int, match=None) -> Tuple[List, Optional[str]]:
+        """从游标位置开始取最多 limit 个匹配的条目，返回 (条目, 下一页游标)"""
+        position = self._decode_cursor(cursor)
+        page = []
+        while position < len(items) and len(page) < limit:
+            item = items[position]
+            position += 1
+            if match is None or match(item):
+                page.append(item)
+        return page, (self._encode_cursor(position) if position < len(items) else None)
+
+    def url_results(self, cursor: Optional[str] = None, limit: int = 50, status: Optional[str] = None,
+                    url: Optional[str] = None) -> Dict:
+        """
+        分页读取URL结果条目
+
+        Args:
+            cursor: 上一页返回的 next_cursor，为空时从头读取
+            limit: 每页条目数
+            status: 只返回该状态（done / failed / cancelled）的条目
+            url: 只返回该URL的条目
+
+        Returns:
+            {'items', 'count', 'next_cursor'}
+        """
+        if status is not None and status not in URL_STATES:
+            raise ValueError(f'无效的状态: {status}')
+
+        def match(entry: Dict) -> bool:
+            return (status is None or entry['status'] == status) and (url is None or entry['url'] == url)
+
+        items, next_cursor = self._page(self._entries, cursor, limit,
+                                        match if status is not None or url is not None else None)
+        return {'items': items, 'count': len(items), 'next_cursor': next_cursor}
+
+    def page_urls(self) -> List[str]:
+        """结果中的页面URL"""
+        return [entry['url'] for entry in self._entries]
+
+    def image_files(self) -> List[Tuple[str, str]]:
+        """已下载图片的 (页面URL, 本地路径)"""
+        return [(url, image['local_path']) for url, images in self._images.items()
+                for image in images if image.get('local_path')]
+
+    def images(self, url: str, cursor: Optional[str] = None, limit: int = 100) -> Optional[Dict]:
+        """
+        分页读取一个URL的图片元数据
+
+        Args:
+            url: 页面URL
+            cursor: 上一页返回的 next_cursor
+            limit: 每页图片数
+
+        Returns:
+            {'url', 'items', 'count', 'total', 'next_cursor'}，URL不在结果中时返回None
+        """
+        if url not in self._images:
+            return None
+        images = self._images[url]
+        items, next_cursor = self._page(images, cursor, limit)
+        return {'url': url, 'items': items, 'count': len(items), 'total': len(images), 'next_cursor': next_cursor}
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 重试策略与熔断器
+带抖动的指数退避重试（支持Retry-After），以及按CDN域名划分的熔断器
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试策略"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0,
+                 retry_statuses: Optional[Iterable[int]] = None, max_retry_after: float = 60.0):
+        """
+        初始化重试策略
+
+        Args:
+            max_retries: 最大重试次数（不含首次请求）
+            base_delay: 退避基础延迟（秒）
+            max_delay: 单次退避的最大延迟（秒）
+            retry_statuses: 需要重试的HTTP状态码
+            max_retry_after: 服务端Retry-After允许的最大等待时间（秒）
+        """
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses or (403, 408, 429, 500, 502, 503, 504))
+        self.max_retry_after = max_retry_after
+
+    def should_retry_status(self, status_code: int) -> bool:
+        """判断状态码是否值得重试"""
+        return status_code in self.retry_statuses
+
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        计算第attempt次重试前的等待时间
+
+        Args:
+            attempt: 重试序号（从1开始）
+            retry_after: 服务端要求的等待时间（秒）
+
+        Returns:
+            等待秒数
+        """
+        if retry_after is not None and retry_after >= 0:
+            return min(retry_after, self.max_retry_after)
+        # Full jitter：在 [0, min(max_delay, base * 2^(n-1))] 内随机
+        ceiling = min(self.max_delay, self.base_delay * (2 ** max(0, attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析Retry-After响应头（秒数或HTTP日期）
+
+    Args:
+        value: 响应头的值
+
+    Returns:
+        等待秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = parsedate_to_datetime(value)
+        return max(0.0, retry_time.timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class CircuitBreaker:
+    """单个域名的熔断器（closed -> open -> half_open -> closed）"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        初始化熔断器
+
+        Args:
+            host: 域名
+            failure_threshold: 连续失败多少次后打开
+            reset_timeout: 打开后经过多少秒进入半开状态试探
+        """
+        self.host = host
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        判断当前是否允许请求该域名
+
+        Returns:
+            True表示可以请求，False表示应快速失败
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # 半开状态只放行一个试探请求
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """记录一次成功请求"""
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self.state = self.CLOSED
+
+    def release_probe(self):
+        """释放半开状态的试探名额而不改变状态（试探请求被取消、未得到结果时调用）"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """记录一次失败请求，达到阈值或试探失败时打开熔断器"""
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.open_count += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        """获取熔断器状态快照"""
+        with self._lock:
+            remaining = 0.0
+            if self.state == self.OPEN:
+                remaining = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'total_failures': self.total_failures,
+                'rejected': self.rejected,
+                'open_count': self.open_count,
+                'reopen_in': round(remaining, 1)
+            }
+
+
+class HostCircuitBreakers:
+    """按域名管理的熔断器集合"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: 每个域名连续失败多少次后打开
+            reset_timeout: 打开后的冷却时间（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> CircuitBreaker:
+        """获取（或创建）某个域名的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+                self._breakers[host] = breaker
+            return breaker
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """获取所有域名熔断器的状态快照"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.host: breaker.snapshot() for breaker in breakers}
+
+    def open_hosts(self) -> Dict[str, Dict]:
+        """获取当前处于打开或半开状态的域名"""
+        return {host: state for host, state in self.snapshot().items()
+                if state['state'] != CircuitBreaker.CLOSED}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 本地替身HTTP服务
+在本机模拟CDN/页面服务器，可配置响应延迟和带宽，用于离线重放和基准测试
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# resolver(path, query) -> (状态码, 响应头, 响应体) 或 None（返回404）
+Resolver = Callable[[str, Dict], Optional[Tuple[int, Dict[str, str], bytes]]]
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server: 'StandInServer' = self.server.standin
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+
+        latency = server.latency_for(parsed.path)
+        if latency > 0:
+            time.sleep(latency)
+
+        response = server.resolver(parsed.path, query)
+        if response is None:
+            status, headers, body = 404, {'Content-Type': 'text/plain'}, b'not found'
+        else:
+            status, headers, body = response
+
+        self.send_response(status)
+        for key, value in headers.items():
+            if key.lower() not in ('content-length', 'transfer-encoding', 'connection', 'content-encoding'):
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        server.requests += 1
+
+        bandwidth = server.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+
+        # 按带宽限速分块发送
+        chunk_size = max(1024, int(bandwidth / 20))
+        for offset in range(0, len(body), chunk_size):
+            chunk = body[offset:offset + chunk_size]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / bandwidth)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer:
+    """本地替身HTTP服务（后台线程运行）"""
+
+    def __init__(self, resolver: Resolver, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0, bandwidth: Optional[float] = None,
+                 latency_fn: Optional[Callable[[str], float]] = None):
+        """
+        初始化替身服务
+
+        Args:
+            resolver: 根据路径和查询参数返回响应的函数
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            latency: 每个请求的固定延迟（秒）
+            bandwidth: 每个连接的带宽上限（字节/秒），None表示不限速
+            latency_fn: 按路径计算延迟的函数，优先于固定延迟
+        """
+        self.resolver = resolver
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.latency_fn = latency_fn
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), _StandInHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.standin = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """服务根地址"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def latency_for(self, path: str) -> float:
+        """计算某个路径的响应延迟"""
+        if self.latency_fn:
+            return self.latency_fn(path)
+        return self.latency
+
+    def start(self) -> 'StandInServer':
+        """在后台线程启动服务"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='standin-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -2,72 +2,174 @@
 # -*- coding: utf-8 -*-
 """
 抖音图片爬虫 - Web服务启动脚本
+
+用法:
+    python start_web.py                                  # 开发服务器，自动打开浏览器
+    python start_web.py --server waitress --threads 16 --no-browser
 """
 
+import argparse
 import os
+import signal
 import sys
 import webbrowser
 import time
 import threading
+import _thread
+
+try:
+    from waitress.server import create_server as create_waitress_server
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
 
-def open_browser():
+def open_browser(url: str):
     """延迟打开浏览器"""
     time.sleep(2)  # 等待服务器启动
-    webbrowser.open('http://localhost:5000')
+    webbrowser.open(url)
 
-def main():
-    """主函数"""
-    print("=" * 60)
-    print("🚀 启动抖音图片爬虫 Web 服务")
-    print("=" * 60)
-    
-    # 检查必要文件
+def pause_before_exit():
+    """交互式终端中等待回车，无终端（服务器、容器）时直接退出"""
+    if sys.stdin and sys.stdin.isatty():
+        input("按回车键退出...")
+
+def check_files() -> bool:
+    """检查必要文件"""
     required_files = ['app.py', 'douyin_image_crawler.py', 'linkrush.py']
     missing_files = []
-    
+
     for file in required_files:
         if not os.path.exists(file):
             missing_files.append(file)
-    
+
     if missing_files:
         print("❌ 缺少必要文件:")
         for file in missing_files:
             print(f"   • {file}")
         print("\n请确保所有文件都在当前目录中。")
-        input("按回车键退出...")
-        return
-    
+        return False
+
     # 检查templates目录
     if not os.path.exists('templates'):
         print("❌ 缺少 templates 目录")
         print("请确保 templates/index.html 文件存在。")
-        input("按回车键退出...")
-        return
-    
+        return False
+
     if not os.path.exists('templates/index.html'):
         print("❌ 缺少 templates/index.html 文件")
-        input("按回车键退出...")
+        return False
+
+    return True
+
+def install_graceful_shutdown(drain_timeout: float):
+    """
+    SIGTERM/SIGINT 时先停止接受新任务并等待正在运行的爬取任务结束，再停止服务
+
+    Args:
+        drain_timeout: 等待爬取任务结束的最长时间（秒），超时后取消任务
+    """
+    from app import drain_crawl_jobs
+
+    state = {'draining': False}
+
+    def drain_and_stop():
+        drain_crawl_jobs(timeout=drain_timeout)
+        # 在主线程中抛出 KeyboardInterrupt，使服务器主循环退出
+        _thread.interrupt_main()
+
+    def handle_signal(signum, frame):
+        if state['draining']:
+            # 再次收到信号时立即退出
+            raise KeyboardInterrupt
+        state['draining'] = True
+        print(f"\n⏳ 收到停止信号，等待正在运行的爬取任务结束（最长 {drain_timeout:.0f} 秒，再按一次 Ctrl+C 立即退出）...")
+        threading.Thread(target=drain_and_stop, name='drain', daemon=True).start()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+def serve(host: str, port: int, server: str, threads: int, connection_limit: int,
+          channel_timeout: int, debug: bool = False):
+    """
+    启动Web服务
+
+    Args:
+        host: 监听地址
+        port: 端口
+        server: dev（Flask开发服务器）/ waitress / auto（有waitress时使用waitress）
+        threads: 处理请求的线程数（waitress）
+        connection_limit: 最大并发连接数（waitress）
+        channel_timeout: 空闲连接超时（秒，waitress）
+        debug: 是否开启Flask调试模式（仅dev）
+    """
+    from app import app
+
+    if server == 'auto':
+        server = 'waitress' if WAITRESS_AVAILABLE else 'dev'
+
+    if server == 'waitress':
+        if not WAITRESS_AVAILABLE:
+            raise RuntimeError("未安装waitress，请运行: pip install waitress")
+        # SSE长连接各占用一个线程，线程数应大于同时打开的页面数；
+        # 事件流按块直接写出（不整体缓冲），单个连接有最长时间（SSE_MAX_STREAM_SECONDS）
+        wsgi_server = create_waitress_server(
+            app, host=host, port=port, threads=threads,
+            connection_limit=connection_limit, channel_timeout=channel_timeout,
+            send_bytes=1, ident='douyin-crawler'
+        )
+        print(f"🏭 生产模式: waitress，{threads} 个线程")
+        wsgi_server.run()
+    else:
+        print("🧪 开发模式: Flask内置服务器（生产环境请安装 waitress 并使用 --server waitress）")
+        app.run(debug=debug, host=host, port=port, threaded=True, use_reloader=False)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='抖音图片爬虫 - Web服务')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=5000, help='端口')
+    parser.add_argument('--server', choices=['auto', 'dev', 'waitress'], default='auto',
+                        help='服务器：auto（默认，有waitress时使用waitress）/ dev / waitress')
+    parser.add_argument('--threads', type=int, default=16, help='处理请求的线程数（waitress）')
+    parser.add_argument('--connection-limit', type=int, default=100, help='最大并发连接数（waitress）')
+    parser.add_argument('--channel-timeout', type=int, default=120, help='空闲连接超时秒数（waitress）')
+    parser.add_argument('--drain-timeout', type=float, default=300,
+                        help='关闭时等待爬取任务结束的最长秒数，超时后取消任务')
+    parser.add_argument('--no-browser', action='store_true', help='不自动打开浏览器（无界面服务器）')
+    parser.add_argument('--debug', action='store_true', help='Flask调试模式（仅开发服务器）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🚀 启动抖音图片爬虫 Web 服务")
+    print("=" * 60)
+
+    if not check_files():
+        pause_before_exit()
         return
-    
+
+    url = f"http://localhost:{args.port}"
     print("✅ 所有必要文件检查完成")
     print("🌐 准备启动Web服务...")
-    print("📱 服务地址: http://localhost:5000")
+    print(f"📱 服务地址: {url}")
     print("⏰ 正在启动服务器...")
-    
+
     # 启动浏览器线程
-    browser_thread = threading.Thread(target=open_browser)
-    browser_thread.daemon = True
-    browser_thread.start()
-    
+    if not args.no_browser:
+        browser_thread = threading.Thread(target=open_browser, args=(url,))
+        browser_thread.daemon = True
+        browser_thread.start()
+
     # 启动Flask应用
     try:
-        from app import app
-        app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
+        install_graceful_shutdown(args.drain_timeout)
+        serve(args.host, args.port, args.server, args.threads, args.connection_limit,
+              args.channel_timeout, debug=args.debug)
     except KeyboardInterrupt:
         print("\n\n🛑 服务已停止")
     except Exception as e:
         print(f"\n❌ 启动失败: {str(e)}")
-        input("按回车键退出...")
+        pause_before_exit()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 磁盘存储预算
+用SQLite索引记录每个已下载文件所属的任务、大小和最近访问时间：
+下载前按单任务/全局字节配额预留空间，超出全局配额或磁盘剩余空间不足时按LRU淘汰旧任务的文件，
+仍然不足时暂停下载阶段，而不是继续请求无法保存的图片
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from cancellation import CancellationToken, CrawlCancelled
+from crawl_logging import get_logger
+from disk_writer import DiskFullError
+from metrics import DOWNLOADS_PAUSED, STORAGE_EVICTIONS, STORAGE_USED_BYTES
+
+logger = get_logger('storage')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    job_id TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_accessed_at ON files(accessed_at);
+CREATE INDEX IF NOT EXISTS idx_files_job_id ON files(job_id);
+"""
+
+# 还没有下载过图片时，预留空间使用的单张图片大小估计（字节）
+DEFAULT_IMAGE_ESTIMATE = 512 * 1024
+# 写盘出现ENOSPC后，剩余空间至少恢复到该值才继续下载（未配置 min_free_bytes 时）
+DISK_FULL_RECOVERY_BYTES = 64 * 1024 * 1024
+# 剩余空间查询的缓存时间（秒），下载路径上每张图片都会检查
+FREE_SPACE_TTL = 1.0
+# 每批淘汰的文件数
+EVICTION_BATCH = 200
+# 磁盘空间长时间未恢复、中止任务时的取消原因
+DISK_FULL_REASON = '磁盘空间不足'
+
+
+class QuotaExceeded(Exception):
+    """下载该图片会超出字节配额"""
+
+    def __init__(self, scope: str, limit: int):
+        """
+        Args:
+            scope: 超出的配额，job（单任务）或 global（全局）
+            limit: 配额（字节）
+        """
+        self.scope = scope
+        self.limit = limit
+        name = '任务' if scope == 'job' else '全局'
+        super().__init__(f"已达到{name}存储配额（{limit} 字节）")
+
+
+class StorageBudget:
+    """已下载文件索引与全局存储预算（线程安全，Web线程和爬取线程共享）"""
+
+    def __init__(self, index_path: str = "douyin_storage.db", global_quota_bytes: Optional[int] = None,
+                 min_free_bytes: Optional[int] = 512 * 1024 * 1024, max_age_seconds: Optional[float] = None,
+                 allow_eviction: bool = False, pause_poll_seconds: float = 5.0,
+                 pause_timeout: Optional[float] = 600.0):
+        """
+        Args:
+            index_path: 文件索引（SQLite）路径
+            global_quota_bytes: 所有任务已下载文件的总字节上限，None表示不限
+            min_free_bytes: 下载目录所在磁盘至少保留的剩余空间，None表示不检查
+            max_age_seconds: 旧任务文件的最长保留时间，超过后由 evict_expired 删除，None表示不限
+            allow_eviction: 是否允许删除旧任务的文件来腾出空间（关闭时只拒绝下载或暂停）
+            pause_poll_seconds: 暂停下载期间检查剩余空间的间隔（秒）
+            pause_timeout: 暂停超过该时间（秒）后中止任务，None表示一直等待
+        """
+        self.index_path = Path(index_path)
+        if self.index_path.parent and not self.index_path.parent.exists():
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.global_quota_bytes = global_quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_age_seconds = max_age_seconds
+        self.allow_eviction = allow_eviction
+        self.pause_poll_seconds = pause_poll_seconds
+        self.pause_timeout = pause_timeout
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+        self._used = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        self._reserved = 0
+        self._active_jobs: Set[str] = set()
+        self._free_cache: Dict[str, tuple] = {}
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        STORAGE_USED_BYTES.set(self._used)
+
+    def job(self, job_id: str, directory: str, quota_bytes: Optional[int] = None) -> 'JobStorage':
+        """
+        开始一个任务的存储记账（任务运行期间其文件不会被淘汰）
+
+        Args:
+            job_id: 任务ID
+            directory: 任务的下载目录（用于检查所在磁盘的剩余空间）
+            quota_bytes: 单任务字节上限，None表示不限
+
+        Returns:
+            任务存储记账对象，任务结束时调用 close()
+        """
+        with self._lock:
+            self._active_jobs.add(job_id)
+        return JobStorage(self, job_id, directory, quota_bytes)
+
+    def _end_job(self, job_id: str):
+        with self._lock:
+            self._active_jobs.discard(job_id)
+
+    @property
+    def used_bytes(self) -> int:
+        """索引中文件的总字节数"""
+        return self._used
+
+    def _reserve(self, size: int, job_id: str):
+        """预留全局配额（必要且允许时先淘汰旧文件），超出时抛出 QuotaExceeded"""
+        with self._lock:
+            quota = self.global_quota_bytes
+            if quota is not None:
+                excess = self._used + self._reserved + size - quota
+                if excess > 0 and self.allow_eviction:
+                    self.evict(excess, reason='quota')
+                    excess = self._used + self._reserved + size - quota
+                if excess > 0:
+                    raise QuotaExceeded('global', quota)
+            self._reserved += size
+
+    def _release(self, size: int):
+        with self._lock:
+            self._reserved = max(0, self._reserved - size)
+
+    def record(self, job_id: str, path: str, size: int):
+        """
+        记录一个已写入的文件（同一路径被新任务覆盖时归属新任务）
+
+        Args:
+            job_id: 任务ID
+            path: 文件路径
+            size: 文件大小（字节）
+        """
+        key = os.path.abspath(path)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM files WHERE path = ?", (key,)).fetchone()
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files (path, job_id, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, job_id, size, now, now)
+                )
+            self._used += size - (row['size'] if row else 0)
+            STORAGE_USED_BYTES.set(self._used)
+
+    def touch(self, paths: Iterable[str]):
+        """
+        更新文件的最近访问时间（例如被导出时），使其晚于其他文件被淘汰
+
+        Args:
+            paths: 文件路径
+        """
+        now = time.time()
+        rows = [(now, os.path.abspath(path)) for path in paths]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE files SET accessed_at = ? WHERE path = ?", rows)
+
+    def evict(self, bytes_needed: int, reason: str = 'quota', older_than: Optional[float] = None) -> int:
+        """
+        按最近访问时间从旧到新删除非运行中任务的文件
+
+        Args:
+            bytes_needed: 需要腾出的字节数
+            reason: 淘汰原因（quota / low_disk / expired），记入指标
+            older_than: 只删除创建时间早于该时间戳的文件
+
+        Returns:
+            实际腾出的字节数
+        """
+        freed = 0
+        with self._lock:
+            active = list(self._active_jobs)
+            where = f"job_id NOT IN ({','.join('?' * len(active))})" if active else "1"
+            params = list(active)
+            if older_than is not None:
+                where += " AND created_at < ?"
+                params.append(older_than)
+            stalled = False
+            while freed < bytes_needed and not stalled:
+                rows = self._conn.execute(
+                    f"SELECT path, size FROM files WHERE {where} ORDER BY accessed_at LIMIT ?",
+                    params + [EVICTION_BATCH]
+                ).fetchall()
+                if not rows:
+                    break
+                removed = []
+                for row in rows:
+                    if freed >= bytes_needed:
+                        break
+                    try:
+                        os.remove(row['path'])
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        # 删除失败的文件留在索引中，下一轮仍会最先选中它，因此停止淘汰
+                        logger.warning("淘汰文件失败: %s %s", row['path'], e)
+                        stalled = True
+                        break
+                    removed.append((row['path'],))
+                    freed += row['size']
+                if removed:
+                    with self._conn:
+                        self._conn.executemany("DELETE FROM files WHERE path = ?", removed)
+                    self.evicted_files += len(removed)
+                    STORAGE_EVICTIONS.inc(len(removed), reason=reason)
+            self._used = max(0, self._used - freed)
+            self.evicted_bytes += freed
+            STORAGE_USED_BYTES.set(self._used)
+            self._free_cache.clear()
+        if freed:
+            logger.info("已淘汰旧任务文件 %s 字节（%s）", freed, reason)
+        return freed
+
+    def evict_expired(self) -> int:
+        """
+        删除超过最长保留时间的旧任务文件（需允许淘汰）
+
+        Returns:
+            腾出的字节数
+        """
+        if self.max_age_seconds is None or not self.allow_eviction:
+            return 0
+        return self.evict(self._used, reason='expired', older_than=time.time() - self.max_age_seconds)
+
+    def free_bytes(self, directory: str) -> int:
+        """目录所在磁盘的剩余字节数（短时间缓存）"""
+        now = time.monotonic()
+        cached = self._free_cache.get(directory)
+        if cached is not None and now - cached[0] < FREE_SPACE_TTL:
+            return cached[1]
+        free = shutil.disk_usage(directory).free
+        self._free_cache[directory] = (now, free)
+        return free
+
+    def usage(self) -> Dict:
+        """存储用量汇总"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            return {
+                'used_bytes': self._used,
+                'reserved_bytes': self._reserved,
+                'files': files,
+                'global_quota_bytes': self.global_quota_bytes,
+                'min_free_bytes': self.min_free_bytes,
+                'evicted_files': self.evicted_files,
+                'evicted_bytes': self.evicted_bytes,
+                'active_jobs': sorted(self._active_jobs)
+            }
+
+    def close(self):
+        """关闭索引"""
+        with self._lock:
+            self._conn.close()
+
+
+class JobStorage:
+    """单个任务的存储记账：下载前预留、写盘后登记、空间不足时暂停"""
+
+    def __init__(self, budget: StorageBudget, job_id: str, directory: str, quota_bytes: Optional[int] = None):
+        self.budget = budget
+        self.job_id = job_id
+        self.directory = str(directory)
+        self.quota_bytes = quota_bytes
+        self.used_bytes = 0
+        self.files = 0
+        self.rejected = 0
+        self.paused_seconds = 0.0
+        self._reserved = 0
+        self._estimate = DEFAULT_IMAGE_ESTIMATE
+        self._disk_full = False
+        self._paused = 0
+
+    def reserve(self) -> int:
+        """
+        按平均图片大小预留配额，超出单任务或全局配额时抛出 QuotaExceeded
+
+        Returns:
+            预留的字节数，写盘后交给 commit，失败时交给 release
+        """
+        size = self._estimate
+        if self.quota_bytes is not None and self.used_bytes + self._reserved + size > self.quota_bytes:
+            self.rejected += 1
+            raise QuotaExceeded('job', self.quota_bytes)
+        try:
+            self.budget._reserve(size, self.job_id)
+        except QuotaExceeded:
+            self.rejected += 1
+            raise
+        self._reserved += size
+        return size
+
+    def release(self, reserved: int):
+        """释放未使用的预留"""
+        self._reserved = max(0, self._reserved - reserved)
+        self.budget._release(reserved)
+
+    def commit(self, path, size: int, reserved: int):
+        """
+        登记已写入的文件并释放对应的预留
+
+        Args:
+            path: 文件路径
+            size: 文件大小（字节）
+            reserved: reserve() 返回的预留字节数
+        """
+        self.release(reserved)
+        self.budget.record(self.job_id, str(path), size)
+        self.used_bytes += size
+        self.files += 1
+        # 指数加权平均，使预留接近该任务图片的实际大小
+        self._estimate = int(self._estimate * 0.8 + size * 0.2)
+
+    def note_disk_full(self):
+        """写盘时磁盘已满：之后的下载先等待空间恢复"""
+        self._disk_full = True
+        self.budget._free_cache.pop(self.directory, None)
+
+    def _space_shortfall(self) -> int:
+        """距离可以继续下载还差的字节数（0表示空间足够）"""
+        threshold = self.budget.min_free_bytes
+        if self._disk_full:
+            threshold = max(threshold or 0, DISK_FULL_RECOVERY_BYTES)
+        if threshold is None:
+            return 0
+        shortfall = threshold + self._estimate - self.budget.free_bytes(self.directory)
+        if shortfall <= 0:
+            self._disk_full = False
+            return 0
+        return shortfall
+
+    async def wait_for_space(self, cancel_token: Optional[CancellationToken] = None,
+                             on_pause: Optional[Callable[[bool, int], None]] = None):
+        """
+        磁盘剩余空间不足时先淘汰旧任务文件（允许时），仍不足则暂停直到空间恢复
+
+        Args:
+            cancel_token: 取消令牌，暂停期间取消时抛出 CrawlCancelled
+            on_pause: 暂停/恢复时的回调 (paused, 剩余字节数)
+
+        Raises:
+            DiskFullError: 暂停超过 pause_timeout 后空间仍不足
+        """
+        shortfall = self._space_shortfall()
+        if not shortfall:
+            return
+        if self.budget.allow_eviction:
+            self.budget.evict(shortfall, reason='low_disk')
+            shortfall = self._space_shortfall()
+            if not shortfall:
+                return
+
+        self._paused += 1
+        if self._paused == 1:
+            free = self.budget.free_bytes(self.directory)
+            logger.warning("磁盘剩余空间不足（%s 字节），暂停下载", free)
+            DOWNLOADS_PAUSED.set(1)
+            if on_pause:
+                on_pause(True, free)
+        started = time.monotonic()
+        timeout = self.budget.pause_timeout
+        try:
+            while self._space_shortfall():
+                if timeout is not None and time.monotonic() - started >= timeout:
+                    raise DiskFullError(f"磁盘剩余空间不足，暂停 {int(timeout)} 秒后仍未恢复")
+                if cancel_token is not None:
+                    if await cancel_token.sleep(self.budget.pause_poll_seconds):
+                        raise CrawlCancelled(cancel_token.reason)
+                else:
+                    await asyncio.sleep(self.budget.pause_poll_seconds)
+        finally:
+            self._paused -= 1
+            if self._paused == 0:
+                self.paused_seconds += time.monotonic() - started
+                DOWNLOADS_PAUSED.set(0)
+        if self._paused == 0:
+            free = self.budget.free_bytes(self.directory)
+            logger.info("磁盘空间已恢复（%s 字节），继续下载", free)
+            if on_pause:
+                on_pause(False, free)
+
+    def snapshot(self) -> Dict:
+        """任务存储用量汇总"""
+        return {
+            'used_bytes': self.used_bytes,
+            'files': self.files,
+            'quota_bytes': self.quota_bytes,
+            'rejected_downloads': self.rejected,
+            'paused_seconds': round(self.paused_seconds, 3)
+        }
+
+    def close(self):
+        """任务结束：释放剩余预留，之后其文件可以被淘汰"""
+        if self._reserved:
+            self.budget._release(self._reserved)
+            self._reserved = 0
+        self.budget._end_job(self.job_id)
@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 分布式任务队列
+协调端提交主页URL任务，多个节点上的爬取worker租用任务：
+租约有可见性超时，worker定期心跳续租；worker退出或失联时租约过期，任务重新入队。
+broker可替换：SQLiteBroker（本机多进程、测试用）/ RedisBroker（生产，多节点共享）
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# 任务状态
+TASK_PENDING = 'pending'      # 等待租用
+TASK_LEASED = 'leased'        # 已被worker租用
+TASK_DONE = 'done'            # 完成
+TASK_FAILED = 'failed'        # 超过最大尝试次数后失败
+TASK_CANCELLED = 'cancelled'  # 任务被协调端取消
+TASK_STATES = (TASK_PENDING, TASK_LEASED, TASK_DONE, TASK_FAILED, TASK_CANCELLED)
+FINAL_STATES = (TASK_DONE, TASK_FAILED, TASK_CANCELLED)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex
+
+
+class TaskBroker:
+    """任务队列接口（协调端和worker共用）"""
+
+    def submit(self, job_id: str, payloads: List[Dict], max_attempts: int = 3) -> List[str]:
+        """
+        提交一批任务
+
+        Args:
+            job_id: 所属作业ID
+            payloads: 任务参数列表（可JSON序列化）
+            max_attempts: 每个任务的最大尝试次数（租约过期和失败都计一次）
+
+        Returns:
+            任务ID列表
+        """
+        raise NotImplementedError
+
+    def lease(self, worker_id: str, visibility_timeout: float) -> Optional[Dict]:
+        """
+        租用一个待处理任务（先回收已过期的租约）
+
+        Args:
+            worker_id: worker标识
+            visibility_timeout: 租约时长（秒），期间其他worker看不到该任务
+
+        Returns:
+            {'task_id', 'job_id', 'payload', 'attempts', 'lease_token'}；没有任务时返回None
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, task_id: str, lease_token: str, visibility_timeout: float) -> bool:
+        """
+        续租
+
+        Returns:
+            是否仍持有租约（租约已过期被其他worker租用或任务被取消时返回False）
+        """
+        raise NotImplementedError
+
+    def complete(self, task_id: str, lease_token: str, result: Dict) -> bool:
+        """
+        提交任务结果
+
+        Returns:
+            是否仍持有租约（返回False时结果被丢弃）
+        """
+        raise NotImplementedError
+
+    def fail(self, task_id: str, lease_token: str, error: str, retry: bool = True) -> bool:
+        """
+        报告任务失败：未超过最大尝试次数且 retry 为True时重新入队，否则标记为失败
+
+        Returns:
+            是否仍持有租约
+        """
+        raise NotImplementedError
+
+    def requeue_expired(self) -> int:
+        """
+        回收过期租约（worker失联），重新入队或标记为失败
+
+        Returns:
+            回收的任务数
+        """
+        raise NotImplementedError
+
+    def cancel_job(self, job_id: str) -> int:
+        """
+        取消作业中未完成的任务（租用中的任务在下次心跳时得知）
+
+        Returns:
+            取消的任务数
+        """
+        raise NotImplementedError
+
+    def job_tasks(self, job_id: str) -> List[Dict]:
+        """
+        作业的所有任务
+
+        Returns:
+            [{'task_id', 'state', 'payload', 'attempts', 'worker_id', 'result', 'error', 'updated_at'}, ...]
+        """
+        raise NotImplementedError
+
+    def touch_worker(self, worker_id: str, info: Optional[Dict] = None):
+        """记录worker存活（worker主循环定期调用）"""
+        raise NotImplementedError
+
+    def workers(self, max_age: float = 120.0) -> List[Dict]:
+        """
+        最近活跃的worker
+
+        Args:
+            max_age: 超过该秒数未心跳的worker视为离线，不返回
+
+        Returns:
+            [{'worker_id', 'last_seen', 'info'}, ...]
+        """
+        raise NotImplementedError
+
+    def job_summary(self, job_id: str) -> Dict:
+        """
+        作业汇总：各状态任务数和已完成任务的结果计数合计
+
+        Returns:
+            {'job_id', 'tasks', 'states', 'finished', 'total_images', 'downloaded_images', 'failed_downloads', 'retries'}
+        """
+        tasks = self.job_tasks(job_id)
+        states = {state: 0 for state in TASK_STATES}
+        totals = {'total_images': 0, 'downloaded_images': 0, 'failed_downloads': 0, 'retries': 0}
+        for task in tasks:
+            states[task['state']] += 1
+            for key in totals:
+                totals[key] += (task.get('result') or {}).get(key, 0)
+        summary = {
+            'job_id': job_id,
+            'tasks': len(tasks),
+            'states': states,
+            'finished': bool(tasks) and all(task['state'] in FINAL_STATES for task in tasks)
+        }
+        summary.update(totals)
+        return summary
+
+    def close(self):
+        """释放连接"""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_token TEXT,
+    lease_expires REAL,
+    worker_id TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_job ON tasks(job_id);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    info TEXT,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class SQLiteBroker(TaskBroker):
+    """基于SQLite的任务队列（WAL模式，同一台机器上的多个进程可共享一个数据库文件）"""
+
+    def __init__(self, db_path: str = "douyin_tasks.db"):
+        """
+        Args:
+            db_path: SQLite数据库文件路径
+        """
+        self.db_path = Path(db_path)
+        if self.db_path.parent and not self.db_path.parent.exists():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # 手动控制事务：租用使用 BEGIN IMMEDIATE，避免多个进程租到同一个任务
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def submit(self, job_id: str, payloads: List[Dict], max_attempts: int = 3) -> List[str]:
+        now = time.time()
+        rows = [(_new_id(), job_id, json.dumps(payload, ensure_ascii=False), TASK_PENDING, max(1, max_attempts),
+                 now + index * 1e-6, now) for index, payload in enumerate(payloads)]
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO tasks (task_id, job_id, payload, state, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        return [row[0] for row in rows]
+
+    def _requeue_expired(self, conn, now: float) -> int:
+        expired = conn.execute(
+            "SELECT task_id, attempts, max_attempts FROM tasks WHERE state = ? AND lease_expires < ?",
+            (TASK_LEASED, now)
+        ).fetchall()
+        for row in expired:
+            state = TASK_PENDING if row['attempts'] < row['max_attempts'] else TASK_FAILED
+            conn.execute(
+                "UPDATE tasks SET state = ?, lease_token = NULL, lease_expires = NULL, "
+                "error = COALESCE(error, '租约过期（worker失联）'), updated_at = ? WHERE task_id = ?",
+                (state, now, row['task_id'])
+            )
+        return len(expired)
+
+    def requeue_expired(self) -> int:
+        with self._transaction() as conn:
+            return self._requeue_expired(conn, time.time())
+
+    def lease(self, worker_id: str, visibility_timeout: float) -> Optional[Dict]:
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT task_id, job_id, payload, attempts FROM tasks WHERE state = ? "
+                "ORDER BY created_at LIMIT 1", (TASK_PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            lease_token = _new_id()
+            conn.execute(
+                "UPDATE tasks SET state = ?, attempts = attempts + 1, lease_token = ?, lease_expires = ?, "
+                "worker_id = ?, updated_at = ? WHERE task_id = ?",
+                (TASK_LEASED, lease_token, now + visibility_timeout, worker_id, now, row['task_id'])
+            )
+        return {
+            'task_id': row['task_id'],
+            'job_id': row['job_id'],
+            'payload': json.loads(row['payload']),
+            'attempts': row['attempts'] + 1,
+            'lease_token': lease_token
+        }
+
+    def heartbeat(self, task_id: str, lease_token: str, visibility_timeout: float) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                "WHERE task_id = ? AND state = ? AND lease_token = ?",
+                (now + visibility_timeout, now, task_id, TASK_LEASED, lease_token)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id: str, lease_token: str, result: Dict) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET state = ?, result = ?, error = NULL, lease_token = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE task_id = ? AND state = ? AND lease_token = ?",
+                (TASK_DONE, json.dumps(result, ensure_ascii=False), time.time(), task_id, TASK_LEASED, lease_token)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, task_id: str, lease_token: str, error: str, retry: bool = True) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM tasks WHERE task_id = ? AND state = ? AND lease_token = ?",
+                (task_id, TASK_LEASED, lease_token)
+            ).fetchone()
+            if row is None:
+                return False
+            state = TASK_PENDING if retry and row['attempts'] < row['max_attempts'] else TASK_FAILED
+            conn.execute(
+                "UPDATE tasks SET state = ?, error = ?, lease_token = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE task_id = ?", (state, error, time.time(), task_id)
+            )
+            return True
+
+    def cancel_job(self, job_id: str) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET state = ?, lease_token = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE job_id = ? AND state IN (?, ?)",
+                (TASK_CANCELLED, time.time(), job_id, TASK_PENDING, TASK_LEASED)
+            )
+            return cursor.rowcount
+
+    def job_tasks(self, job_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, state, payload, attempts, worker_id, result, error, updated_at FROM tasks "
+                "WHERE job_id = ? ORDER BY created_at", (job_id,)
+            ).fetchall()
+        tasks = []
+        for row in rows:
+            task = dict(row)
+            task['payload'] = json.loads(task['payload'])
+            task['result'] = json.loads(task['result']) if task['result'] else None
+            tasks.append(task)
+        return tasks
+
+    def touch_worker(self, worker_id: str, info: Optional[Dict] = None):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO workers (worker_id, info, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET info = excluded.info, last_seen = excluded.last_seen",
+                (worker_id, json.dumps(info or {}, ensure_ascii=False), time.time())
+            )
+
+    def workers(self, max_age: float = 120.0) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT worker_id, info, last_seen FROM workers WHERE last_seen >= ? ORDER BY worker_id",
+                (time.time() - max_age,)
+            ).fetchall()
+        return [{'worker_id': row['worker_id'], 'last_seen': row['last_seen'], 'info': json.loads(row['info'] or '{}')}
+                for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# 原子地回收过期租约并租用队首任务
+# KEYS: pending列表, leased有序集合（分数为租约到期时间）
+# ARGV: 当前时间, 租约到期时间, worker_id, lease_token, 任务哈希键前缀
+_LEASE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, task_id in ipairs(expired) do
+    local key = ARGV[5] .. task_id
+    redis.call('ZREM', KEYS[2], task_id)
+    local attempts = tonumber(redis.call('HGET', key, 'attempts') or '0')
+    local max_attempts = tonumber(redis.call('HGET', key, 'max_attempts') or '1')
+    redis.call('HDEL', key, 'lease_token')
+    if attempts < max_attempts then
+        redis.call('HSET', key, 'state', 'pending', 'updated_at', ARGV[1])
+        redis.call('LPUSH', KEYS[1], task_id)
+    else
+        redis.call('HSET', key, 'state', 'failed', 'error', '租约过期（worker失联）', 'updated_at', ARGV[1])
+    end
+end
+if ARGV[2] == '' then
+    return {#expired}
+end
+while true do
+    local task_id = redis.call('RPOP', KEYS[1])
+    if not task_id then
+        return {#expired}
+    end
+    local key = ARGV[5] .. task_id
+    if redis.call('HGET', key, 'state') == 'pending' then
+        redis.call('HINCRBY', key, 'attempts', 1)
+        redis.call('HSET', key, 'state', 'leased', 'lease_token', ARGV[4], 'worker_id', ARGV[3], 'updated_at', ARGV[1])
+        redis.call('ZADD', KEYS[2], ARGV[2], task_id)
+        return {#expired, task_id}
+    end
+end
+"""
+
+# 持有租约时修改任务（续租 / 完成 / 失败），租约令牌不匹配时返回0
+# KEYS: 任务哈希, leased有序集合, pending列表
+# ARGV: task_id, lease_token, 操作(heartbeat/complete/fail), 当前时间, 参数（租约到期时间 / 结果JSON / 错误）, 是否重试
+_HOLDER_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'state') ~= 'leased' or redis.call('HGET', KEYS[1], 'lease_token') ~= ARGV[2] then
+    return 0
+end
+if ARGV[3] == 'heartbeat' then
+    redis.call('ZADD', KEYS[2], ARGV[5], ARGV[1])
+    redis.call('HSET', KEYS[1], 'updated_at', ARGV[4])
+    return 1
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[1], 'lease_token')
+if ARGV[3] == 'complete' then
+    redis.call('HSET', KEYS[1], 'state', 'done', 'result', ARGV[5], 'updated_at', ARGV[4])
+    redis.call('HDEL', KEYS[1], 'error')
+    return 1
+end
+local attempts = tonumber(redis.call('HGET', KEYS[1], 'attempts') or '0')
+local max_attempts = tonumber(redis.call('HGET', KEYS[1], 'max_attempts') or '1')
+if ARGV[6] == '1' and attempts < max_attempts then
+    redis.call('HSET', KEYS[1], 'state', 'pending', 'error', ARGV[5], 'updated_at', ARGV[4])
+    redis.call('LPUSH', KEYS[3], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], 'state', 'failed', 'error', ARGV[5], 'updated_at', ARGV[4])
+end
+return 1
+"""
+
+
+class RedisBroker(TaskBroker):
+    """基于Redis的任务队列（多节点共享；租用、续租和回收都在Lua脚本中原子执行）"""
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "douyin"):
+        """
+        Args:
+            url: Redis连接URL（兼容Redis协议的服务均可）
+            prefix: 键前缀
+        """
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("未安装redis，请运行: pip install redis")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._pending_key = f"{prefix}:tasks:pending"
+        self._leased_key = f"{prefix}:tasks:leased"
+        self._workers_key = f"{prefix}:workers"
+        self._lease_script = self.client.register_script(_LEASE_SCRIPT)
+        self._holder_script = self.client.register_script(_HOLDER_SCRIPT)
+
+    def _task_key(self, task_id: str) -> str:
+        return f"{self.prefix}:task:{task_id}"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def submit(self, job_id: str, payloads: List[Dict], max_attempts: int = 3) -> List[str]:
+        now = time.time()
+        task_ids = [_new_id() for _ in payloads]
+        pipe = self.client.pipeline(transaction=True)
+        for task_id, payload in zip(task_ids, payloads):
+            pipe.hset(self._task_key(task_id), mapping={
+                'job_id': job_id,
+                'payload': json.dumps(payload, ensure_ascii=False),
+                'state': TASK_PENDING,
+                'attempts': 0,
+                'max_attempts': max(1, max_attempts),
+                'created_at': now,
+                'updated_at': now
+            })
+            pipe.rpush(self._job_key(job_id), task_id)
+            # 队首在列表右端（RPOP），新任务从左端进入
+            pipe.lpush(self._pending_key, task_id)
+        pipe.execute()
+        return task_ids
+
+    def requeue_expired(self) -> int:
+        result = self._lease_script(
+            keys=[self._pending_key, self._leased_key],
+            args=[time.time(), '', '', '', f"{self.prefix}:task:"]
+        )
+        return int(result[0])
+
+    def lease(self, worker_id: str, visibility_timeout: float) -> Optional[Dict]:
+        now = time.time()
+        lease_token = _new_id()
+        result = self._lease_script(
+            keys=[self._pending_key, self._leased_key],
+            args=[now, now + visibility_timeout, worker_id, lease_token, f"{self.prefix}:task:"]
+        )
+        if len(result) < 2:
+            return None
+        task_id = result[1]
+        task = self.client.hgetall(self._task_key(task_id))
+        return {
+            'task_id': task_id,
+            'job_id': task['job_id'],
+            'payload': json.loads(task['payload']),
+            'attempts': int(task['attempts']),
+            'lease_token': lease_token
+        }
+
+    def _holder(self, task_id: str, lease_token: str, action: str, value, retry: bool = False) -> bool:
+        result = self._holder_script(
+            keys=[self._task_key(task_id), self._leased_key, self._pending_key],
+            args=[task_id, lease_token, action, time.time(), value, '1' if retry else '0']
+        )
+        return int(result) == 1
+
+    def heartbeat(self, task_id: str, lease_token: str, visibility_timeout: float) -> bool:
+        return self._holder(task_id, lease_token, 'heartbeat', time.time() + visibility_timeout)
+
+    def complete(self, task_id: str, lease_token: str, result: Dict) -> bool:
+        return self._holder(task_id, lease_token, 'complete', json.dumps(result, ensure_ascii=False))
+
+    def fail(self, task_id: str, lease_token: str, error: str, retry: bool = True) -> bool:
+        return self._holder(task_id, lease_token, 'fail', error, retry=retry)
+
+    def cancel_job(self, job_id: str) -> int:
+        cancelled = 0
+        now = time.time()
+        for task_id in self.client.lrange(self._job_key(job_id), 0, -1):
+            key = self._task_key(task_id)
+            # 只取消未完成的任务；与租用脚本竞争时以 WATCH 保证状态未被并发修改
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    if pipe.hget(key, 'state') not in (TASK_PENDING, TASK_LEASED):
+                        continue
+                    pipe.multi()
+                    pipe.hset(key, mapping={'state': TASK_CANCELLED, 'updated_at': now})
+                    pipe.hdel(key, 'lease_token')
+                    pipe.zrem(self._leased_key, task_id)
+                    pipe.lrem(self._pending_key, 0, task_id)
+                    pipe.execute()
+                    cancelled += 1
+                except redis.WatchError:
+                    continue
+        return cancelled
+
+    def job_tasks(self, job_id: str) -> List[Dict]:
+        task_ids = self.client.lrange(self._job_key(job_id), 0, -1)
+        pipe = self.client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hgetall(self._task_key(task_id))
+        tasks = []
+        for task_id, task in zip(task_ids, pipe.execute()):
+            if not task:
+                continue
+            tasks.append({
+                'task_id': task_id,
+                'state': task['state'],
+                'payload': json.loads(task['payload']),
+                'attempts': int(task.get('attempts', 0)),
+                'worker_id': task.get('worker_id'),
+                'result': json.loads(task['result']) if task.get('result') else None,
+                'error': task.get('error'),
+                'updated_at': float(task.get('updated_at', 0))
+            })
+        return tasks
+
+    def touch_worker(self, worker_id: str, info: Optional[Dict] = None):
+        self.client.hset(self._workers_key, worker_id,
+                         json.dumps({'info': info or {}, 'last_seen': time.time()}, ensure_ascii=False))
+
+    def workers(self, max_age: float = 120.0) -> List[Dict]:
+        cutoff = time.time() - max_age
+        workers = []
+        for worker_id, value in sorted(self.client.hgetall(self._workers_key).items()):
+            data = json.loads(value)
+            if data['last_seen'] >= cutoff:
+                workers.append({'worker_id': worker_id, 'last_seen': data['last_seen'], 'info': data['info']})
+        return workers
+
+    def close(self):
+        self.client.close()
+
+
+def open_broker(url: str) -> TaskBroker:
+    """
+    按URL创建broker
+
+    Args:
+        url: sqlite:///路径（或直接给出 .db 文件路径） / redis://主机:端口/库
+
+    Returns:
+        broker实例
+    """
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SQLiteBroker(url)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抖音图片爬虫 - 上传请求流式解码
+按到达顺序解码 multipart/form-data 请求体：普通字段读入内存，文件部分逐块交给调用方，
+不经过 request.files（Werkzeug会先把整个文件写入临时文件）
+"""
+
+import tempfile
+from typing import Dict, Iterator, Optional
+
+from werkzeug.sansio.multipart import Epilogue, Field, File, MultipartDecoder, NeedData
+
+# 文件之后还有表单字段时，文件内容先缓存在内存中，超过该大小时转存到匿名临时文件（关闭后删除）
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+class MultipartUpload:
+    """单个文件的表单上传（只处理第一个文件，其余文件部分丢弃）"""
+
+    def __init__(self, stream, boundary: str, chunk_size: int = 64 * 1024, max_field_bytes: int = 1024 * 1024):
+        """
+        Args:
+            stream: 请求体（request.stream）
+            boundary: multipart 分隔符（request.mimetype_params['boundary']）
+            chunk_size: 每次读取的字节数
+            max_field_bytes: 单个普通字段的最大字节数
+        """
+        if not boundary:
+            raise ValueError('缺少 multipart 分隔符')
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_field_bytes = max_field_bytes
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_field: Optional[str] = None
+        self._decoder = MultipartDecoder(boundary.encode('latin-1'))
+        self._events = self._read_events()
+        self._file_pending = False
+        self._spool = None
+
+    def _read_events(self):
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, Epilogue):
+                return
+            if isinstance(event, NeedData):
+                data = self.stream.read(self.chunk_size)
+                # 读完后标记结束；请求体不完整（客户端断开）时解码器抛出 ValueError
+                self._decoder.receive_data(data or None)
+                continue
+            yield event
+
+    def _read_field(self, name: str):
+        value = bytearray()
+        for event in self._events:
+            value += event.data
+            if len(value) > self.max_field_bytes:
+                raise ValueError(f'表单字段过大: {name}')
+            if not event.more_data:
+                break
+        self.fields[name] = value.decode('utf-8', 'replace')
+
+    def _skip_part(self):
+        for event in self._events:
+            if not event.more_data:
+                return
+
+    def read_fields(self) -> Dict[str, str]:
+        """
+        读取表单字段，直到文件部分开始（或请求体结束）
+
+        Returns:
+            已读到的字段
+        """
+        for event in self._events:
+            if isinstance(event, Field):
+                self._read_field(event.name)
+            elif isinstance(event, File):
+                if self.filename is None and event.filename:
+                    self.filename = event.filename
+                    self.file_field = event.name
+                    self._file_pending = True
+                    break
+                self._skip_part()
+        return self.fields
+
+    def read_all_fields(self) -> Dict[str, str]:
+        """
+        读取全部表单字段（文件之后的字段也需要时使用，文件内容先缓存）
+
+        Returns:
+            全部字段
+        """
+        if self._file_pending and self._spool is None:
+            self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+            for chunk in self._file_chunks():
+                self._spool.write(chunk)
+            self._spool.seek(0)
+        self._file_pending = False
+        return self.read_fields()
+
+    def _file_chunks(self) -> Iterator[bytes]:
+        for event in self._events:
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                return
+
+    def iter_file(self) -> Iterator[bytes]:
+        """
+        逐块读取文件内容（之后的表单字段同时读入 fields）
+
+        Yields:
+            文件数据块
+        """
+        if self._spool is not None:
+            spool, self._spool = self._spool, None
+            try:
+                while True:
+                    chunk = spool.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                spool.close()
+            return
+        if self._file_pending:
+            self._file_pending = False
+            yield from self._file_chunks()
+            self.read_fields()
+
+    def close(self):
+        """释放缓存的文件内容"""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None